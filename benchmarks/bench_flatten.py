@@ -0,0 +1,73 @@
+"""
+Compares flatten against the previous recursive implementation on the PubMed test files
+
+    python benchmarks/bench_flatten.py [repeat]
+"""
+import glob
+import json
+import os
+import sys
+import timeit
+
+import xmltodict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from piano_utils.utils.flatten_json import flatten, _construct_key  # noqa: E402
+
+
+def recursive_flatten(nested_dict, separator="_", root_keys_to_ignore=set()):
+    """
+    The recursive flatten this benchmark measures against
+    """
+    flattened_dict = dict()
+
+    def _flatten(object_, key):
+        if isinstance(object_, dict):
+            for object_key in object_:
+                if not (not key and object_key in root_keys_to_ignore):
+                    _flatten(object_[object_key], _construct_key(key, separator, object_key))
+        elif isinstance(object_, list) or isinstance(object_, set):
+            for index, item in enumerate(object_):
+                _flatten(item, _construct_key(key, separator, index))
+        else:
+            flattened_dict[key] = object_
+
+    _flatten(nested_dict, None)
+    return flattened_dict
+
+
+def pubmed_articles():
+    """
+    :return: list of the PubMed articles of the test files, as parsed by xmltodict
+    """
+    tests_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests")
+    articles = []
+    for path in sorted(glob.glob(os.path.join(tests_dir, "*pubmed*.xml"))):
+        articles_ = xmltodict.parse(open(path).read())["PubmedArticleSet"]["PubmedArticle"]
+        articles.extend(articles_ if isinstance(articles_, list) else [articles_])
+    return articles
+
+
+def main(repeat=200):
+    xml_articles = pubmed_articles()
+    # the same articles as plain dictionaries, e.g. as loaded from JSON
+    json_articles = [json.loads(json.dumps(article)) for article in xml_articles]
+
+    keys = sum(len(flatten(article)) for article in xml_articles)
+    print("%d articles, %d flattened keys, %d repeats" % (len(xml_articles), keys, repeat))
+
+    for label, articles in (("xmltodict", xml_articles), ("json", json_articles)):
+        for article in articles:
+            assert flatten(article) == recursive_flatten(article)
+
+        results = {}
+        for name, function in (("recursive", recursive_flatten), ("flatten", flatten)):
+            results[name] = min(timeit.repeat(lambda: [function(article) for article in articles],
+                                              number=repeat, repeat=3))
+            print("%-10s %-10s %8.2f us/article" % (label, name, results[name] / repeat / len(articles) * 1e6))
+        print("%-10s speedup    %8.2fx" % (label, results["recursive"] / results["flatten"]))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
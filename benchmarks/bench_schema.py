@@ -0,0 +1,81 @@
+"""
+Compares FlatSchema against the generic flatten and unflatten_list on the articles of
+tests/multiple_pubmed_xml_articles.xml replicated to a batch. Every copy cuts the lists of the articles, such as the
+authors, MeSH headings and references, to other lengths, so the records have different sets of flattened keys as
+real articles do
+
+    python benchmarks/bench_schema.py [copies] [repeat]
+"""
+import os
+import sys
+import timeit
+
+import xmltodict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from piano_utils.utils.flat_schema import FlatSchema  # noqa: E402
+from piano_utils.utils.flatten_json import flatten, unflatten_list, KeyPathCache  # noqa: E402
+
+
+def cut_lists(object_, copy):
+    """
+    Cuts the lists of a record to lengths depending on the copy, from 1 to their length
+    :param object_: record
+    :param copy: index of the copy
+    :return:
+    """
+    stack = [object_]
+    while stack:
+        object_ = stack.pop()
+        if isinstance(object_, dict):
+            stack.extend(object_.itervalues())
+        elif isinstance(object_, list):
+            del object_[1 + copy % len(object_):]
+            stack.extend(object_)
+
+
+def replicated_articles(copies):
+    """
+    :param copies: number of copies of every article
+    :return: list of the articles of the test file, as parsed by xmltodict, copies times with lists of different
+             lengths
+    """
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests",
+                        "multiple_pubmed_xml_articles.xml")
+    articles = []
+    for copy in range(copies):
+        # parsed again for every copy, so no records share objects
+        for article in xmltodict.parse(open(path).read())["PubmedArticleSet"]["PubmedArticle"]:
+            cut_lists(article, copy)
+            articles.append(article)
+    return articles
+
+
+def main(copies=1000, repeat=3):
+    articles = replicated_articles(copies)
+    flat_articles = [flatten(article) for article in articles]
+    schema = FlatSchema.from_sample(articles[0])
+    key_cache = KeyPathCache()
+
+    print("%d distinct sets of flattened keys" % len(set(frozenset(article) for article in flat_articles)))
+    for article, flat_article in zip(articles[:100], flat_articles):
+        assert schema.flatten(article) == flat_article
+        assert schema.unflatten_list(flat_article) == unflatten_list(flat_article)
+
+    print("%d articles, %d flattened keys" % (len(articles), sum(len(article) for article in flat_articles)))
+    cases = (
+        ("flatten", lambda: [flatten(article) for article in articles],
+         lambda: [schema.flatten(article) for article in articles]),
+        ("unflatten_list", lambda: [unflatten_list(article, key_cache=key_cache) for article in flat_articles],
+         lambda: [schema.unflatten_list(article) for article in flat_articles]),
+    )
+    for name, generic, with_schema in cases:
+        generic_time = min(timeit.repeat(generic, number=1, repeat=repeat))
+        schema_time = min(timeit.repeat(with_schema, number=1, repeat=repeat))
+        print("%-14s generic %8.2f us/article, schema %8.2f us/article, speedup %5.2fx" % (
+            name, generic_time / len(articles) * 1e6, schema_time / len(articles) * 1e6, generic_time / schema_time))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
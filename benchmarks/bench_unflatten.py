@@ -0,0 +1,114 @@
+"""
+Compares unflatten_list, with and without a KeyPathCache shared by the records, against the previous sort based
+implementation on the flattened PubMed test files and on wide records with thousands of keys
+
+    python benchmarks/bench_unflatten.py [repeat]
+"""
+import os
+import sys
+import timeit
+from collections import Iterable
+
+from bench_flatten import pubmed_articles
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from piano_utils.utils.flatten_json import (flatten, unflatten_list, check_if_numbers_are_consecutive,  # noqa: E402
+                                            KeyPathCache)
+
+
+def _unflatten_asserts(flat_dict, separator):
+    assert isinstance(flat_dict, dict), "un_flatten requires a dictionary input"
+    assert isinstance(separator, str), "separator must be a string"
+    assert all((not isinstance(value, Iterable) or isinstance(value, str) or isinstance(value, unicode)
+                for value in flat_dict.values())), "provided dictionary is not flat"
+
+
+def unflatten(flat_dict, separator='_'):
+    """
+    The unflatten used by the previous unflatten_list
+    """
+    _unflatten_asserts(flat_dict, separator)
+
+    unflattened_dict = dict()
+
+    def _unflatten(dic, keys, value):
+        for key in keys[:-1]:
+            dic = dic.setdefault(key, {})
+
+        dic[keys[-1]] = value
+
+    for item in flat_dict:
+        _unflatten(unflattened_dict, item.split(separator), flat_dict[item])
+
+    return unflattened_dict
+
+
+def sorting_unflatten_list(flat_dict, separator='_'):
+    """
+    The unflatten_list this benchmark measures against
+    """
+    _unflatten_asserts(flat_dict, separator)
+
+    unflattened_dict = unflatten(flat_dict, separator)
+
+    def _convert_dict_to_list(object_, parent_object, parent_object_key):
+        if isinstance(object_, dict):
+            try:
+                keys = [int(key) for key in object_]
+                keys.sort()
+            except (ValueError, TypeError):
+                keys = []
+            keys_len = len(keys)
+
+            if (keys_len > 0 and sum(keys) == int(((keys_len - 1) * keys_len) / 2) and keys[0] == 0 and
+                    keys[-1] == keys_len - 1 and check_if_numbers_are_consecutive(keys)):
+                parent_object[parent_object_key] = [object_[str(key)] for key in keys]
+
+            for key in object_:
+                if isinstance(object_[key], dict):
+                    _convert_dict_to_list(object_[key], object_, key)
+
+    for key in unflattened_dict:
+        _convert_dict_to_list(unflattened_dict[key], unflattened_dict, key)
+    return unflattened_dict
+
+
+def wide_record(size):
+    """
+    :param size: number of items
+    :return: flattened record with a list of size items and a dictionary of size keys, about 6 * size keys
+    """
+    return flatten({
+        "items": [{"id": index, "name": "item %d" % index, "tags": ["a", "b", "c"]} for index in range(size)],
+        "attributes": dict(("attribute%d" % index, index) for index in range(size)),
+    })
+
+
+def main(repeat=20):
+    cases = [
+        ("pubmed", [flatten(article) for article in pubmed_articles()] * 10),
+        ("wide 1000", [wide_record(1000)] * 2),
+        ("wide 10000", [wide_record(10000)] * 2),
+    ]
+
+    for label, records in cases:
+        for record in records:
+            assert unflatten_list(record) == sorting_unflatten_list(record)
+
+        def cached_unflatten_list(record, key_cache=KeyPathCache(maxsize=100000)):
+            return unflatten_list(record, key_cache=key_cache)
+
+        keys = sum(len(record) for record in records)
+        results = {}
+        for name, function in (("sorting", sorting_unflatten_list), ("unflatten_list", unflatten_list),
+                               ("cached", cached_unflatten_list)):
+            results[name] = min(timeit.repeat(lambda: [function(record) for record in records],
+                                              number=repeat, repeat=3))
+            print("%-10s %-14s %6d keys %10.3f ms/repeat" % (label, name, keys, results[name] / repeat * 1e3))
+        for name in ("unflatten_list", "cached"):
+            print("%-10s %-14s speedup %14.2fx" % (label, name, results["sorting"] / results[name]))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,69 @@
+"""
+Compares two result files of benchmarks/suite.py, e.g. of two commits, and flags the cases that got slower or use
+more memory by more than a threshold
+
+    python benchmarks/compare.py baseline.json results.json [--threshold 0.1]
+
+Exits with status 1 if any case regressed
+"""
+import argparse
+import json
+import sys
+
+
+def load_results(path):
+    """
+    :param path: file path of suite results
+    :return: the report, and its results by (case, size)
+    """
+    with open(path) as f:
+        report = json.load(f)
+    return report, dict(((result["case"], result["size"]), result) for result in report["results"])
+
+
+def compare(baseline, results, threshold=0.1):
+    """
+    :param baseline: results by (case, size) measured against
+    :param results: results by (case, size)
+    :param threshold: relative loss of throughput or growth of peak RSS reported as a regression
+    :return: list of (case, size, throughput ratio, peak RSS ratio, regressed) for the cases of both results
+    """
+    rows = []
+    for key in sorted(set(baseline) & set(results)):
+        old, new = baseline[key], results[key]
+        if new["seconds"]:
+            speed = old["seconds"] / new["seconds"]
+        else:
+            # too fast to be timed, which is no slowdown whatever the baseline
+            speed = float("inf") if old["seconds"] else 1.0
+        memory = new["peak_rss_mb"] / old["peak_rss_mb"] if old["peak_rss_mb"] else 1.0
+        rows.append(key + (speed, memory, speed < 1 - threshold or memory > 1 + threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline", help="results measured against")
+    parser.add_argument("results", help="results to compare")
+    parser.add_argument("-t", "--threshold", type=float, default=0.1,
+                        help="relative slowdown or memory growth reported as a regression (default: 0.1)")
+    args = parser.parse_args(argv)
+
+    baseline_report, baseline = load_results(args.baseline)
+    report, results = load_results(args.results)
+    print("%s -> %s" % (baseline_report.get("commit"), report.get("commit")))
+    print("%-26s %7s %12s %12s %8s %10s %10s %8s" % (
+        "case", "size", "old art/s", "new art/s", "speed", "old MB", "new MB", "memory"))
+
+    regressions = 0
+    for case, size, speed, memory, regressed in compare(baseline, results, args.threshold):
+        old, new = baseline[(case, size)], results[(case, size)]
+        regressions += regressed
+        print("%-26s %7d %12.1f %12.1f %7.2fx %10.1f %10.1f %7.2fx%s" % (
+            case, size, old["articles_per_second"] or 0, new["articles_per_second"] or 0, speed,
+            old["peak_rss_mb"], new["peak_rss_mb"], memory, "  REGRESSION" if regressed else ""))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,248 @@
+"""
+Benchmarks the converter entry points on PubMed article sets synthesized from the tests/*.xml fixtures, whose
+articles are replicated with unique PMIDs and titles. Every case and size is measured in a fresh process, which
+reports the throughput, the latency of the calls and the peak RSS of the conversion, and the results are saved as
+JSON to compare between commits with benchmarks/compare.py. Cases too slow for the largest sizes, such as the
+BeautifulSoup mapper, are only measured up to their MAX_SIZES
+
+    python benchmarks/suite.py [-s 1 1000 100000] [-c xml_to_json flatten ...] [-r repeat] [-o results.json]
+"""
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from copy import deepcopy
+
+import xmltodict
+from lxml import etree
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from piano_utils.pubmed_converter import pubmed_xml_to_json, pubmed_xml_to_piano, pubmed_json_to_piano  # noqa: E402
+from piano_utils.utils.flatten_json import flatten, unflatten_list  # noqa: E402
+from piano_utils.xml_json_converter import xml_to_json, json_to_xml  # noqa: E402
+
+SIZES = (1, 1000, 100000)
+# Largest number of articles of the cases too slow to be measured on the largest sizes in a reasonable time
+MAX_SIZES = {"pubmed_xml_to_piano": 1000}
+# PMIDs of the synthesized articles, out of the range of real PMIDs
+FIRST_PMID = 900000000
+
+XML_FILE = "articles.xml"
+JSON_FILE = "articles.json"
+
+
+def fixture_articles():
+    """
+    :return: list of the PubmedArticle elements of the test fixtures
+    """
+    articles = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "tests", "*.xml"))):
+        articles.extend(etree.parse(path).getroot().iter("PubmedArticle"))
+    return articles
+
+
+def synthesize(count, output):
+    """
+    Writes a PubMed XML file of count articles, replicating the fixture articles with a unique PMID and title
+    :param count: number of articles
+    :param output: file object the XML is written to
+    :return:
+    """
+    articles = fixture_articles()
+    output.write('<?xml version="1.0" encoding="UTF-8"?>\n<PubmedArticleSet>\n')
+    for idx in range(count):
+        article = deepcopy(articles[idx % len(articles)])
+        pmid = str(FIRST_PMID + idx)
+        for element in article.xpath('MedlineCitation/PMID | PubmedData/ArticleIdList/ArticleId[@IdType="pubmed"]'):
+            element.text = pmid
+        for title in article.iter("ArticleTitle"):
+            title.text = "%s [%d]" % (title.text or "", idx)
+        output.write(etree.tostring(article, encoding="UTF-8", xml_declaration=False))
+        output.write("\n")
+    output.write("</PubmedArticleSet>\n")
+
+
+def write_fixtures(count, directory):
+    """
+    Writes the inputs of the cases for a number of articles: the PubMed XML and its flattened JSON
+    :param count: number of articles
+    :param directory: directory the inputs are written to
+    :return:
+    """
+    with open(os.path.join(directory, XML_FILE), "wb") as xml_file:
+        synthesize(count, xml_file)
+    with open(os.path.join(directory, XML_FILE), "rb") as xml_file, \
+            open(os.path.join(directory, JSON_FILE), "wb") as json_file:
+        json_file.write(pubmed_xml_to_json(xml_file.read()))
+
+
+def _read(directory, name):
+    with open(os.path.join(directory, name), "rb") as f:
+        return f.read()
+
+
+def _xmltodict_articles(directory):
+    articles = xmltodict.parse(_read(directory, XML_FILE))["PubmedArticleSet"]["PubmedArticle"]
+    return articles if isinstance(articles, list) else [articles]
+
+
+# Case name to (function loading the input from the fixture directory, function converting the input)
+CASES = {
+    "xml_to_json": (lambda directory: _read(directory, XML_FILE),
+                    lambda xml_string: xml_to_json(xml_string, "PubmedArticle")),
+    "json_to_xml": (lambda directory: _read(directory, JSON_FILE),
+                    lambda json_string: json_to_xml(json_string, "PubmedArticleSet", "PubmedArticle")),
+    "flatten": (_xmltodict_articles,
+                lambda articles: [flatten(article) for article in articles]),
+    "unflatten_list": (lambda directory: json.loads(_read(directory, JSON_FILE)),
+                       lambda flat_articles: [unflatten_list(article) for article in flat_articles]),
+    "pubmed_xml_to_piano": (lambda directory: _read(directory, XML_FILE),
+                            lambda xml_string: pubmed_xml_to_piano(xml_string)),
+    "pubmed_xml_to_piano_lxml": (lambda directory: _read(directory, XML_FILE),
+                                 lambda xml_string: pubmed_xml_to_piano(xml_string, engine="lxml")),
+    "pubmed_json_to_piano": (lambda directory: _read(directory, JSON_FILE),
+                             lambda json_string: pubmed_json_to_piano(json_string)),
+}
+
+
+def _peak_rss_kb(reset=False):
+    """
+    :param reset: whether the peak is reset to the current RSS, which Linux supports through /proc/self/clear_refs
+    :return: peak RSS of this process in kB, and whether it was reset
+    """
+    if reset:
+        try:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+        except IOError:
+            reset = False
+    try:
+        with open("/proc/self/status") as f:
+            return int(re.search(r"VmHWM:\s+(\d+)", f.read()).group(1)), reset
+    except (IOError, AttributeError):
+        # without procfs the peak of the whole process is reported, including loading the input
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, False
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def run_case(name, size, directory, repeat):
+    """
+    Measures one case on the inputs of a fixture directory, in the current process
+    :param name: case name
+    :param size: number of articles of the inputs
+    :param directory: fixture directory
+    :param repeat: number of calls measured
+    :return: dictionary of the measurements
+    """
+    load, convert = CASES[name]
+    inputs = load(directory)
+    input_rss, _ = _peak_rss_kb()
+    _, rss_reset = _peak_rss_kb(reset=True)
+
+    times = []
+    for _ in range(repeat):
+        started = time.time()
+        convert(inputs)
+        times.append(time.time() - started)
+    peak_rss, _ = _peak_rss_kb()
+
+    best = min(times)
+    return {
+        "case": name,
+        "size": size,
+        "repeat": repeat,
+        "seconds": best,
+        "articles_per_second": size / best if best else None,
+        "latency_ms": {"min": best * 1e3, "p50": _percentile(times, 0.5) * 1e3,
+                       "p95": _percentile(times, 0.95) * 1e3, "max": max(times) * 1e3},
+        "input_rss_mb": input_rss / 1024.0,
+        "peak_rss_mb": peak_rss / 1024.0,
+        "peak_rss_of_conversion_only": rss_reset,
+    }
+
+
+def default_repeat(size):
+    """
+    :return: number of calls measured for a number of articles, many for single articles to measure the latency
+    """
+    return max(3, min(100, 1000 // size))
+
+
+def _git_commit():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT).strip()
+        dirty = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the converter entry points")
+    parser.add_argument("-s", "--sizes", type=int, nargs="+", default=SIZES, help="numbers of articles")
+    parser.add_argument("-c", "--cases", nargs="+", choices=sorted(CASES), default=sorted(CASES), help="cases")
+    parser.add_argument("-r", "--repeat", type=int, default=None,
+                        help="number of calls measured (default: from 100 for 1 article down to 3)")
+    parser.add_argument("-o", "--output", default=None, help="JSON results file (default: stdout only)")
+    parser.add_argument("--run", nargs=3, metavar=("CASE", "SIZE", "DIRECTORY"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run:
+        # a single case in a worker process, reported on stdout to the process running the suite
+        name, size, directory = args.run
+        size = int(size)
+        print(json.dumps(run_case(name, size, directory, args.repeat or default_repeat(size))))
+        return 0
+
+    results = []
+    for size in args.sizes:
+        directory = tempfile.mkdtemp(prefix="piano_bench_")
+        try:
+            write_fixtures(size, directory)
+            for name in args.cases:
+                if size > MAX_SIZES.get(name, size):
+                    sys.stderr.write("%-26s %7d articles skipped, above %d articles\n" % (name, size, MAX_SIZES[name]))
+                    continue
+                command = [sys.executable, os.path.abspath(__file__), "--run", name, str(size), directory]
+                if args.repeat:
+                    command += ["--repeat", str(args.repeat)]
+                result = json.loads(subprocess.check_output(command).splitlines()[-1])
+                results.append(result)
+                sys.stderr.write("%-26s %7d articles %10.1f articles/s %10.2f ms p50 %8.1f MB peak RSS\n" % (
+                    name, size, result["articles_per_second"] or 0, result["latency_ms"]["p50"],
+                    result["peak_rss_mb"]))
+        finally:
+            shutil.rmtree(directory)
+
+    report = {
+        "commit": _git_commit(),
+        "created": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
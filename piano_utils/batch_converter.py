@@ -0,0 +1,223 @@
+"""
+Converts a whole set of PubMed XML files, e.g. a PubMed baseline, into one JSON Lines file per input file, with a
+pool of processes each converting one file at a time
+
+    piano-batch-convert pubmed_baseline/ -o pubmed_piano/ --format piano --processes 8
+"""
+import argparse
+import datetime
+import glob
+import json
+import multiprocessing
+import os
+import sys
+
+from piano_utils.pubmed_converter import PUBMED_MAPPERS, pubmed_xml_to_json_stream
+
+XML_EXTENSIONS = (".xml", ".xml.gz")
+# File of the output directory recording the settings its files were converted with, checked before resuming
+SETTINGS_FILE = "piano-batch-convert.json"
+
+
+def input_paths(inputs):
+    """
+    Expand the inputs into the XML files to convert
+    :param inputs: list of directories, glob patterns or file paths
+    :return: sorted list of file paths, without duplicates
+    """
+    paths = set()
+    for input_ in inputs:
+        if os.path.isdir(input_):
+            paths.update(os.path.join(input_, name) for name in os.listdir(input_) if name.endswith(XML_EXTENSIONS))
+        elif os.path.isfile(input_):
+            paths.add(input_)
+        else:
+            paths.update(path for path in glob.glob(input_) if os.path.isfile(path))
+    return sorted(paths)
+
+
+def output_path(path, output_dir):
+    """
+    :param path: file path of an XML file
+    :param output_dir: directory of the converted files
+    :return: file path of the JSON Lines file path is converted to, e.g. pubmed18n0001.xml.gz to pubmed18n0001.jsonl
+    """
+    name = os.path.basename(path)
+    for extension in XML_EXTENSIONS[::-1]:
+        if name.endswith(extension):
+            name = name[:-len(extension)]
+            break
+    return os.path.join(output_dir, name + ".jsonl")
+
+
+def convert_file(path, output, output_format="piano", engine="lxml", fields=None):
+    """
+    Convert a PubMed XML file into JSON Lines, one article per line. The lines are written to a temporary file which
+    is only renamed to output once the whole file has been converted, so output never holds a partial conversion
+    :param path: file path of PubMed XML, or gzip compressed PubMed XML
+    :param output: file path of the JSON Lines
+    :param output_format: (optional) "piano" for Piano dictionaries or "json" for flattened PubMed JSON
+    :param engine: (optional) mapper engine of the piano format, "soup" (BeautifulSoup) or "lxml"
+    :param fields: (optional) keys of the Piano fields written in the piano format, all by default
+    :return: number of articles written
+    """
+    temporary = output + ".tmp"
+    try:
+        with open(temporary, "wb") as output_stream:
+            if output_format == "json":
+                count = pubmed_xml_to_json_stream(path, output_stream)
+            else:
+                # mapped directly, rather than through XmlToJson, so an article that fails fails the whole file
+                mapper = PUBMED_MAPPERS[engine](fields=fields)
+                count = 0
+                for article in mapper.iterparse_articles(path):
+                    output_stream.write(json.dumps(mapper.transform_to_piano(article)))
+                    output_stream.write("\n")
+                    count += 1
+        os.rename(temporary, output)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    return count
+
+
+def _check_settings(output_dir, outputs, settings, resume):
+    """
+    Record the settings of a conversion in the output directory, checking that the files a resumed conversion
+    skips were converted with the same settings
+    :param output_dir: directory of the converted files
+    :param outputs: file paths of the converted files
+    :param settings: dictionary of the output format, engine and fields of the conversion
+    :param resume: whether files already converted are skipped
+    :return:
+    :raises ValueError: if a resumed conversion would skip files converted with other settings
+    """
+    path = os.path.join(output_dir, SETTINGS_FILE)
+    if resume:
+        if os.path.exists(path):
+            with open(path) as f:
+                previous = json.load(f)
+        elif any(os.path.exists(output) for output in outputs):
+            previous = None
+        else:
+            previous = settings
+        if previous != settings:
+            raise ValueError("%s holds files converted with other settings (%s) than %s, convert into another "
+                             "directory or without resuming" % (output_dir, previous, settings))
+    with open(path, "w") as f:
+        json.dump(settings, f, sort_keys=True)
+
+
+def _convert_task(task):
+    """
+    Convert one file in a worker process
+    :param task: tuple of the convert_file arguments
+    :return: tuple of the file path, the number of articles written and the error message if the conversion failed
+    """
+    path = task[0]
+    try:
+        return path, convert_file(*task), None
+    except Exception, e:
+        return path, 0, "%s: %s" % (type(e).__name__, e)
+
+
+def convert_files(paths, output_dir, output_format="piano", engine="lxml", processes=None, resume=True, fields=None):
+    """
+    Convert PubMed XML files into JSON Lines files, one file per task of a process pool. Progress is written to
+    stderr as files complete
+    :param paths: file paths of PubMed XML, or gzip compressed PubMed XML
+    :param output_dir: directory the JSON Lines files are written to
+    :param output_format: (optional) "piano" for Piano dictionaries or "json" for flattened PubMed JSON
+    :param engine: (optional) mapper engine of the piano format, "soup" (BeautifulSoup) or "lxml"
+    :param processes: (optional) number of worker processes, the number of CPUs by default
+    :param resume: (optional) whether files already converted by a previous run are skipped, which requires the
+                   previous run to have had the same format, engine and fields
+    :param fields: (optional) keys of the Piano fields written in the piano format, all by default
+    :return: dictionary of the file paths converted to the number of articles written, and of those that failed to
+             their error message
+    """
+    if output_format not in ("piano", "json"):
+        raise ValueError("Unknown output format: %s" % output_format)
+    if fields is not None and output_format != "piano":
+        raise ValueError("Fields only apply to the piano format")
+    outputs = {}
+    for path in paths:
+        output = output_path(path, output_dir)
+        if output in outputs:
+            # one would be skipped as already converted, or overwrite the other
+            raise ValueError("%s and %s would both be converted to %s" % (outputs[output], path, output))
+        outputs[output] = path
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    # the engine and fields do not change flattened JSON
+    settings = {"format": output_format, "engine": engine if output_format == "piano" else None,
+                "fields": list(fields) if fields is not None else None}
+    _check_settings(output_dir, outputs, settings, resume)
+
+    tasks = []
+    for output, path in outputs.iteritems():
+        if resume and os.path.exists(output):
+            continue
+        tasks.append((path, output, output_format, engine, fields))
+    # largest files first, so the last tasks to finish are short ones and all workers stay busy until the end
+    tasks.sort(key=lambda task: os.path.getsize(task[0]), reverse=True)
+
+    skipped = len(paths) - len(tasks)
+    sys.stderr.write("Start converting %d files, %d already converted %s\n" % (
+        len(tasks), skipped, datetime.datetime.now()))
+
+    processes = processes or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(processes) if processes > 1 and len(tasks) > 1 else None
+    results = pool.imap_unordered(_convert_task, tasks) if pool is not None else (_convert_task(t) for t in tasks)
+
+    converted = {}
+    failed = {}
+    articles = 0
+    try:
+        for idx, (path, count, error) in enumerate(results):
+            if error is None:
+                converted[path] = count
+                articles += count
+                sys.stderr.write("Converted: %d/%d files, %d articles, %s\n" % (
+                    idx + 1, len(tasks), articles, os.path.basename(path)))
+            else:
+                failed[path] = error
+                sys.stderr.write("Failed: %d/%d files, %s %s\n" % (idx + 1, len(tasks), path, error))
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    sys.stderr.write("End converting %d files, %d failed %s\n" % (len(converted), len(failed), datetime.datetime.now()))
+    return converted, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert PubMed XML(.gz) files into JSON Lines files")
+    parser.add_argument("inputs", nargs="+", help="directories, glob patterns or files of PubMed XML(.gz)")
+    parser.add_argument("-o", "--output-dir", required=True, help="directory the JSON Lines files are written to")
+    parser.add_argument("-f", "--format", choices=("piano", "json"), default="piano",
+                        help="Piano dictionaries or flattened PubMed JSON (default: piano)")
+    parser.add_argument("-e", "--engine", choices=sorted(PUBMED_MAPPERS), default="lxml",
+                        help="mapper engine of the piano format (default: lxml)")
+    parser.add_argument("-p", "--processes", type=int, default=None,
+                        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--fields", type=lambda value: value.split(","), default=None,
+                        help="comma separated Piano fields of the piano format, e.g. pmid,doi,title (default: all)")
+    parser.add_argument("--no-resume", dest="resume", action="store_false",
+                        help="convert files again even if their output exists")
+    args = parser.parse_args(argv)
+
+    paths = input_paths(args.inputs)
+    if not paths:
+        parser.error("no XML files found")
+    try:
+        converted, failed = convert_files(paths, args.output_dir, args.format, args.engine, args.processes,
+                                          args.resume, args.fields)
+    except ValueError, e:
+        parser.error(str(e))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+import os
+from piano_utils.utils.parse_xml import _chunks
+from piano_utils.xml_json_converter import iter_flattened
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class ColumnUnion(object):
+    """
+    Union of the keys of flattened records, in the order the keys first appear
+    Columns are only ever added at the end, so the columns of a batch always start with the columns of the
+    batches before it
+    """
+
+    def __init__(self, columns=()):
+        """
+        :param columns: (optional) initial columns, e.g. to keep the columns of a previous export first
+        """
+        self.columns = []
+        self.index = {}
+        for column in columns:
+            self.add(column)
+
+    def __len__(self):
+        return len(self.columns)
+
+    def add(self, column):
+        """
+        :param column: column name
+        :return: position of the column
+        """
+        position = self.index.get(column)
+        if position is None:
+            position = self.index[column] = len(self.columns)
+            self.columns.append(column)
+        return position
+
+
+def iter_columns(records, batch_size=10000, backend="python", columns=None):
+    """
+    Converts flattened records, such as the flatten output of many articles, into batches of columns
+    Every batch has the columns of all the records so far, with None for the records without the key
+    :param records: iterable of flattened dictionaries
+    :param batch_size: (optional) number of records per batch
+    :param backend: (optional) column type, "python" (lists), "numpy" (object arrays) or "pyarrow" (record batches)
+    :param columns: (optional) ColumnUnion shared with previous exports
+    :return: generator of (column names, batch), the batch being a list of columns or a pyarrow.RecordBatch
+    """
+    to_batch = COLUMN_BACKENDS[backend]()
+    union = columns if columns is not None else ColumnUnion()
+    for records_ in _chunks(records, batch_size):
+        size = len(records_)
+        data = [None] * len(union)
+        for row, record in enumerate(records_):
+            for key, value in record.iteritems():
+                position = union.index.get(key)
+                if position is None:
+                    position = union.add(key)
+                    data.append(None)
+                column = data[position]
+                if column is None:
+                    column = data[position] = [None] * size
+                column[row] = value
+
+        names = list(union.columns)
+        data = [column if column is not None else [None] * size for column in data]
+        yield names, to_batch(names, data)
+
+
+def _python_backend():
+    return lambda names, data: data
+
+
+def _numpy_backend():
+    if numpy is None:
+        raise ImportError("The numpy backend requires numpy, install piano_utils[numpy]")
+
+    def to_batch(names, data):
+        arrays = []
+        for column in data:
+            array = numpy.empty(len(column), dtype=object)
+            array[:] = column
+            arrays.append(array)
+        return arrays
+    return to_batch
+
+
+def _pyarrow_backend():
+    if pyarrow is None:
+        raise ImportError("The pyarrow backend requires pyarrow, install piano_utils[parquet]")
+    return lambda names, data: pyarrow.RecordBatch.from_arrays([_arrow_array(column) for column in data], names)
+
+
+def _arrow_array(column):
+    """
+    :param column: list of values
+    :return: pyarrow array of the values, as strings if they have no common type or only nulls
+    """
+    try:
+        array = pyarrow.array(column)
+    except (TypeError, ValueError, pyarrow.ArrowException):
+        array = None
+    if array is None or array.type in (pyarrow.null(), pyarrow.binary()):
+        array = pyarrow.array([value if value is None or isinstance(value, unicode) else
+                               value.decode("utf-8") if isinstance(value, str) else unicode(value)
+                               for value in column], type=pyarrow.string())
+    return array
+
+
+COLUMN_BACKENDS = {"python": _python_backend, "numpy": _numpy_backend, "pyarrow": _pyarrow_backend}
+
+
+def write_parquet(records, directory, batch_size=10000, columns=None):
+    """
+    Writes flattened records as Parquet, one file per batch of records
+    The column union grows from one file to the next, so the files are read together by merging their schemas
+    :param records: iterable of flattened dictionaries
+    :param directory: directory the files part-00000.parquet, part-00001.parquet, ... are written to
+    :param batch_size: (optional) number of records per file
+    :param columns: (optional) ColumnUnion shared with previous exports
+    :return: list of the paths written
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    paths = []
+    for names, batch in iter_columns(records, batch_size, "pyarrow", columns):
+        path = os.path.join(directory, "part-%05d.parquet" % len(paths))
+        pyarrow.parquet.write_table(pyarrow.Table.from_batches([batch]), path)
+        paths.append(path)
+    return paths
+
+
+def xml_to_columns(source, element_name, batch_size=10000, backend="python"):
+    """
+    Parses XML incrementally and converts the flattened elements into batches of columns
+    :param source: file path or file object of the XML
+    :param element_name: XML element name from which the child elements are converted
+    :param batch_size: (optional) number of elements per batch
+    :param backend: (optional) column type, "python", "numpy" or "pyarrow"
+    :return: generator of (column names, batch)
+    """
+    return iter_columns(iter_flattened(source, element_name), batch_size, backend)
+
+
+def xml_to_parquet(source, directory, element_name, batch_size=10000):
+    """
+    Parses XML incrementally and writes the flattened elements as Parquet files
+    :param source: file path or file object of the XML
+    :param directory: directory the Parquet files are written to
+    :param element_name: XML element name from which the child elements are converted
+    :param batch_size: (optional) number of elements per file
+    :return: list of the paths written
+    """
+    return write_parquet(iter_flattened(source, element_name), directory, batch_size)
@@ -0,0 +1,170 @@
+"""
+Converts successive PubMed update files into the changes they make, instead of full sets of Piano dictionaries: the
+articles added, the articles changed since they were last seen and the PMIDs deleted by their DeleteCitation blocks.
+An index of the version and content hash of every PMID seen is kept in a SQLite file, so unchanged articles, which
+update files ship again, are neither mapped nor emitted
+"""
+import os
+import sqlite3
+from collections import namedtuple
+from piano_utils.pubmed_converter import PUBMED_MAPPERS
+from piano_utils.utils.parse_xml import iterparse_elements
+
+ADDED = "added"
+CHANGED = "changed"
+DELETED = "deleted"
+
+# Change of an article: action is ADDED, CHANGED or DELETED, and piano its Piano dictionary, None if it is deleted
+DeltaEvent = namedtuple("DeltaEvent", ("action", "pmid", "version", "piano"))
+
+
+class DeltaIndex(object):
+    """
+    Version and content hash of every PMID seen, and the names of the update files applied, kept in a SQLite file
+    Changes are only committed once a whole file has been applied, so an interrupted file is applied again
+    The content hashes depend on the XML engine that serialized the articles, which is recorded with them
+    """
+
+    def __init__(self, path):
+        """
+        :param path: file path of the SQLite database, created if it does not exist
+        """
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.text_factory = str
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS articles (pmid TEXT PRIMARY KEY, version INTEGER NOT NULL, "
+                "digest TEXT NOT NULL)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT)")
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+
+    def use_etree(self, etree_name):
+        """
+        Record the XML engine the content hashes are serialized with, the first time
+        :param etree_name: module name of the engine, e.g. lxml.etree
+        :return:
+        :raises ValueError: if the index holds the content hashes of another engine
+        """
+        row = self._connection.execute("SELECT value FROM settings WHERE name = 'etree'").fetchone()
+        if row is None:
+            self._connection.execute("INSERT INTO settings VALUES ('etree', ?)", (etree_name,))
+        elif row[0] != etree_name:
+            raise ValueError("%s holds the content hashes of %s, not %s, use the same engine"
+                             % (self.path, row[0], etree_name))
+
+    def get(self, pmid):
+        """
+        :param pmid: PMID of an article
+        :return: (version, digest) of the article when it was last seen, None if it has not been seen
+        """
+        return self._connection.execute("SELECT version, digest FROM articles WHERE pmid = ?", (pmid,)).fetchone()
+
+    def put(self, pmid, version, digest):
+        self._connection.execute("INSERT OR REPLACE INTO articles VALUES (?, ?, ?)", (pmid, version, digest))
+
+    def delete(self, pmid):
+        self._connection.execute("DELETE FROM articles WHERE pmid = ?", (pmid,))
+
+    def applied(self, name):
+        """
+        :param name: name of an update file, e.g. pubmed18n0931.xml.gz
+        :return: whether the file has been applied
+        """
+        return self._connection.execute("SELECT 1 FROM files WHERE name = ?", (name,)).fetchone() is not None
+
+    def mark_applied(self, name):
+        self._connection.execute("INSERT OR IGNORE INTO files VALUES (?)", (name,))
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def close(self):
+        self._connection.close()
+
+
+def _article_changes(element, mapper, index):
+    """
+    :param element: PubmedArticle element
+    :param mapper: Mapper of the Piano dictionaries
+    :param index: DeltaIndex
+    :return: list of the DeltaEvent of the article, empty if it has not changed or has no PMID to index it by
+    """
+    pmid_element = element.find("MedlineCitation/PMID")
+    pmid = pmid_element.text if pmid_element is not None else None
+    if not pmid:
+        return []
+    version = int(pmid_element.get("Version") or 1)
+    digest = mapper.content_digest(element)
+
+    seen = index.get(pmid)
+    if seen is not None and tuple(seen) == (version, digest):
+        return []
+    index.put(pmid, version, digest)
+    piano = mapper.transform_to_piano(mapper.to_article(element))
+    return [DeltaEvent(ADDED if seen is None else CHANGED, pmid, version, piano)]
+
+
+def _deleted_changes(element, index):
+    """
+    :param element: DeleteCitation element
+    :param index: DeltaIndex
+    :return: list of the DeltaEvent of the PMIDs deleted
+    """
+    events = []
+    for pmid_element in element.iter("PMID"):
+        index.delete(pmid_element.text)
+        # deletions are emitted even for PMIDs not in the index, which the store may hold from before it
+        events.append(DeltaEvent(DELETED, pmid_element.text, int(pmid_element.get("Version") or 1), None))
+    return events
+
+
+def pubmed_xml_to_delta_iter(sources, index, engine="soup", fields=None):
+    """
+    Converts PubMed update files into the changes they make, in the order of the files and of the articles in them
+    Articles without a PMID are skipped
+    Files already applied to the index, by file name, are skipped. A file is recorded as applied once all its changes
+    have been consumed, so the changes of a file interrupted are emitted again by the next run
+    :param sources: file paths of PubMed XML update files, e.g. pubmed18n0931.xml.gz, oldest first
+    :param index: DeltaIndex, or file path of its SQLite database
+    :param engine: (optional) mapper engine, "soup" (BeautifulSoup) or "lxml"
+    :param fields: (optional) keys of the Piano fields to map, all by default. Changes to the subtrees none of
+                   them reads, such as the references, are not detected, so keep the fields of an index the same
+    :return: generator of DeltaEvent
+    """
+    if isinstance(sources, basestring):
+        sources = [sources]
+    owned = isinstance(index, basestring)
+    if owned:
+        index = DeltaIndex(index)
+    mapper = PUBMED_MAPPERS[engine](fields=fields)
+    element_names = (mapper.element_names, "DeleteCitation")
+
+    try:
+        index.use_etree(mapper.etree.__name__)
+        for source in sources:
+            name = os.path.basename(source)
+            if index.applied(name):
+                continue
+            try:
+                for element in iterparse_elements(source, element_names, mapper.etree, mapper.skip_element_names):
+                    if element.tag == "DeleteCitation":
+                        events = _deleted_changes(element, index)
+                    else:
+                        events = _article_changes(element, mapper, index)
+                    for event in events:
+                        yield event
+                index.mark_applied(name)
+                index.commit()
+            except BaseException:
+                index.rollback()
+                raise
+    finally:
+        if owned:
+            index.close()
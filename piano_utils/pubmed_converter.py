@@ -1,17 +1,72 @@
 import json
-from types import NoneType
-from bs4 import Tag
+import time
+from collections import namedtuple
+from lxml import etree
+from piano_utils.utils.field_plan import FieldSpec, SoupFieldPlan, XPathFieldPlan
 from piano_utils.utils.parse_xml import Mapper, XmlToJson
-from xml_json_converter import xml_to_json, json_to_xml
+from piano_utils.utils.flatten_json import unflatten_list, KeyPathCache
+from piano_utils.columnar_converter import xml_to_columns, xml_to_parquet
+from xml_json_converter import xml_to_json, xml_file_to_json, xml_to_json_stream, json_to_xml, json_to_xml_stream, \
+    json_to_element
 
 
-def pubmed_xml_to_json(xml_string):
+def pubmed_xml_to_json(xml_string, include=None, exclude=None):
     """
     Converts a PubMed XML string to a flattened JSON structure
     :param xml_string: PubMed XML string to flatten into JSON
+    :param include: (optional) key paths to convert, e.g. ["MedlineCitation_PMID", "MedlineCitation_Article"]
+    :param exclude: (optional) key paths left out, e.g. ["PubmedData_ReferenceList"], which are removed from the
+                    XML before it is converted
     :return: JSON
     """
-    return xml_to_json(xml_string, element_name="PubmedArticle")
+    return xml_to_json(xml_string, "PubmedArticle", include, exclude)
+
+
+def pubmed_xml_file_to_json(path, include=None, exclude=None):
+    """
+    Converts a PubMed XML file to a flattened JSON structure, parsing it from a memory map, or decompressing it
+    while parsing if it is gzip compressed, instead of from a string
+    :param path: file path of PubMed XML, or gzip compressed PubMed XML, to flatten into JSON
+    :param include: (optional) key paths to convert, see pubmed_xml_to_json
+    :param exclude: (optional) key paths left out, see pubmed_xml_to_json
+    :return: JSON
+    """
+    return xml_file_to_json(path, "PubmedArticle", include, exclude)
+
+
+def pubmed_xml_to_json_stream(input_stream, output_stream, include=None, exclude=None):
+    """
+    Converts PubMed XML to flattened JSON Lines, one PubMed article per line, without loading the whole XML
+    :param input_stream: file path or file object of PubMed XML to flatten into JSON Lines, gzip compressed
+                         files are decompressed as they are parsed
+    :param output_stream: file object the JSON Lines are written to
+    :param include: (optional) key paths to convert, see pubmed_xml_to_json
+    :param exclude: (optional) key paths left out, see pubmed_xml_to_json
+    :return: number of articles written
+    """
+    return xml_to_json_stream(input_stream, output_stream, "PubmedArticle", include, exclude)
+
+
+def pubmed_xml_to_columns(source, batch_size=10000, backend="python"):
+    """
+    Converts PubMed XML to batches of columns of the flattened articles, without loading the whole XML
+    :param source: file path or file object of PubMed XML
+    :param batch_size: (optional) number of articles per batch
+    :param backend: (optional) column type, "python" (lists), "numpy" (object arrays) or "pyarrow" (record batches)
+    :return: generator of (column names, batch)
+    """
+    return xml_to_columns(source, "PubmedArticle", batch_size, backend)
+
+
+def pubmed_xml_to_parquet(source, directory, batch_size=10000):
+    """
+    Converts PubMed XML to Parquet files of the flattened articles, one file per batch of articles
+    :param source: file path or file object of PubMed XML
+    :param directory: directory the Parquet files are written to
+    :param batch_size: (optional) number of articles per file
+    :return: list of the paths written
+    """
+    return xml_to_parquet(source, directory, "PubmedArticle", batch_size)
 
 
 def json_to_pubmed_xml(json_string):
@@ -23,19 +78,67 @@ def json_to_pubmed_xml(json_string):
     return json_to_xml(json_string, "PubmedArticleSet", "PubmedArticle")
 
 
-def pubmed_xml_to_piano(xml_string):
+def json_to_pubmed_xml_stream(input_stream, output_stream):
+    """
+    Converts flattened PubMed JSON Lines into PubMed XML, writing each article as soon as its line has been read
+    :param input_stream: file path or file object of flattened PubMed JSON Lines to convert to XML
+    :param output_stream: file object the XML is written to
+    :return: number of articles written
+    """
+    return json_to_xml_stream(input_stream, output_stream, "PubmedArticleSet", "PubmedArticle")
+
+
+def pubmed_xml_to_piano(xml_string, engine="soup", fields=None, cache=None):
     """
     Converts a PubMed XML string to a list of Piano dictionaries
     :param xml_string: Pubmed XML string to convert into a list of Piano dictionaries
+    :param engine: (optional) mapper engine, "soup" (BeautifulSoup) or "lxml"
+    :param fields: (optional) keys of the Piano fields to map, e.g. ["pmid", "doi", "title"], all by default
+    :param cache: (optional) PianoCache of the Piano dictionaries of previous conversions, articles whose XML has not
+                  changed since are taken from it instead of being mapped
     :return: list
     """
-    parser = XmlToJson(PubMedMapper())
+    parser = XmlToJson(PUBMED_MAPPERS[engine](fields=fields), cache=cache)
     return parser.xml_to_json(xml_string)
 
 
+def pubmed_xml_file_to_piano(path, engine="soup", fields=None, cache=None):
+    """
+    Converts a PubMed XML file to a list of Piano dictionaries, parsing it from a memory map, or decompressing it
+    while parsing if it is gzip compressed, instead of from a string
+    :param path: file path of PubMed XML, or gzip compressed PubMed XML, to convert into a list of Piano dictionaries
+    :param engine: (optional) mapper engine, "soup" (BeautifulSoup) or "lxml"
+    :param fields: (optional) keys of the Piano fields to map, all by default
+    :param cache: (optional) PianoCache of the Piano dictionaries of previous conversions, articles whose XML has not
+                  changed since are taken from it instead of being mapped
+    :return: list
+    """
+    parser = XmlToJson(PUBMED_MAPPERS[engine](fields=fields), cache=cache)
+    return parser.xml_file_to_json(path)
+
+
+def pubmed_xml_to_piano_iter(source, engine="soup", fields=None, cache=None, checkpoint=None):
+    """
+    Converts PubMed XML to Piano dictionaries one article at a time, without loading the whole XML into memory
+    :param source: file path or file object of PubMed XML to convert into Piano dictionaries, gzip compressed
+                   files (e.g. pubmed18n0001.xml.gz) are decompressed as they are parsed
+    :param engine: (optional) mapper engine, "soup" (BeautifulSoup) or "lxml"
+    :param fields: (optional) keys of the Piano fields to map, all by default. The subtrees none of them is read
+                   from, such as the references, are emptied while the XML is parsed
+    :param cache: (optional) PianoCache of the Piano dictionaries of previous conversions, articles whose XML has not
+                  changed since are taken from it instead of being mapped
+    :param checkpoint: (optional) Checkpoint recording the offset and PMID of the articles taken, so a restarted
+                       conversion of the file path skips them
+    :return: generator of Piano dictionaries
+    """
+    parser = XmlToJson(PUBMED_MAPPERS[engine](fields=fields), cache=cache)
+    return parser.xml_to_json_iter(source, checkpoint)
+
+
 def pubmed_json_to_piano(json_string):
     """
     Converts a flattened PubMed JSON string into a Piano dictionary
+    The flattened keys are mapped directly, without generating and re-parsing PubMed XML
     :param json_string: flattened PubMed JSON string to convert into a Piano dictionary
     :return: dict
     """
@@ -47,69 +150,238 @@ def pubmed_json_to_piano(json_string):
         return non_pubmed_dict
 
     json_dict = json.loads(json_string)
-    non_pubmed_data = []
-    if isinstance(json_dict, list):
-        for article in json_dict:
-            non_pubmed_data.append(get_non_pubmed_dict(article))
-    else:
-        non_pubmed_data.append(get_non_pubmed_dict(json_dict))
-
-    piano_dict = pubmed_xml_to_piano(json_to_pubmed_xml(json.dumps(json_dict)))
-    if non_pubmed_data:
-        for idx, _ in enumerate(non_pubmed_data):
-            piano_dict[idx].update(non_pubmed_data[idx])
+    articles = json_dict if isinstance(json_dict, list) else [json_dict]
+
+    mapper = PubMedLxmlMapper()
+    key_cache = KeyPathCache()
+    piano_dict = []
+    for article in articles:
+        non_pubmed_data = get_non_pubmed_dict(article)
+        # rebuild the dictionary as if it had been re-loaded, so keys are visited in the same order
+        # as when the articles were converted through PubMed XML
+        article = dict((k, article[k]) for k in article)
+        element = json_to_element(unflatten_list(article, key_cache=key_cache), "PubmedArticle", etree)
+
+        piano = mapper.transform_to_piano(element)
+        piano.update(non_pubmed_data)
+        piano_dict.append(piano)
 
     return piano_dict
 
 
+# Fields read from a PubmedArticle, compiled once per mapper into a plan that collects every field in one pass
+PUBMED_FIELD_SPECS = (
+    FieldSpec("title", "ArticleTitle"),
+    FieldSpec("doi", 'PubmedData > ArticleIdList > ArticleId[IdType="doi"]'),
+    FieldSpec("journal", "Journal > Title"),
+    FieldSpec("published_date", "PubDate > MedlineDate"),
+    FieldSpec("authors", "AuthorList > Author", many=True, fields=(
+        FieldSpec("last_name", "LastName"),
+        FieldSpec("fore_name", "ForeName"),
+    )),
+    FieldSpec("abstracts", "Abstract > AbstractText", many=True),
+    FieldSpec("mesh_headings", "MeshHeadingList > MeshHeading", many=True, fields=(
+        FieldSpec("descriptor_name", "DescriptorName"),
+        FieldSpec("qualifier_names", "QualifierName", many=True),
+    )),
+    FieldSpec("pmid", "MedlineCitation > PMID"),
+    FieldSpec("author_address", "AuthorList > Author > AffiliationInfo > Affiliation"),
+    FieldSpec("pages", "Article > Pagination > MedlinePgn"),
+    FieldSpec("volume", "Journal > JournalIssue > Volume"),
+    FieldSpec("number", "Journal > JournalIssue > Issue"),
+    FieldSpec("pubdate_year", 'PubMedPubDate[PubStatus="pubmed"] > Year'),
+    FieldSpec("pubdate_month", 'PubMedPubDate[PubStatus="pubmed"] > Month'),
+    FieldSpec("pubdate_day", 'PubMedPubDate[PubStatus="pubmed"] > Day'),
+    FieldSpec("isbn", "Journal > ISSN"),
+    FieldSpec("language", "Article > Language"),
+)
+
+
+class PianoField(namedtuple("PianoField", "key assemble specs optional")):
+    """
+    Declares a field of the Piano dictionaries
+    key: key of the field in the Piano dictionary
+    assemble: function of the mapper, the extracted fields and the Piano fields assembled so far returning the value
+    specs: names of the PUBMED_FIELD_SPECS the value is assembled from, the key by default
+    optional: whether the key is left out of the Piano dictionary when the value is None
+    """
+
+    def __new__(cls, key, assemble, specs=None, optional=False):
+        return super(PianoField, cls).__new__(cls, key, assemble, tuple(specs) if specs else (key,), optional)
+
+
+def _text_field(name):
+    return lambda mapper, fields, article: mapper.get_text_if_not_null(fields[name])
+
+
+def _external_id(mapper, fields, article):
+    # the pmid is only assembled again when it is not a field of the article
+    pmid = article['pmid'] if 'pmid' in article else mapper.get_text_if_not_null(fields['pmid'])
+    return "PUBMED:" + pmid if pmid else None
+
+
+def _edition(mapper, fields, article):
+    pubdate_year = mapper.get_text_if_not_null(fields['pubdate_year'])
+    pubdate_month = mapper.get_text_if_not_null(fields['pubdate_month'])
+    pubdate_day = mapper.get_text_if_not_null(fields['pubdate_day'])
+    if pubdate_day and pubdate_month and pubdate_year:
+        return pubdate_year + "/" + pubdate_month + "/" + pubdate_day
+    return None
+
+
+# Fields of the Piano dictionaries, assembled in this order from the fields extracted with PUBMED_FIELD_SPECS
+PIANO_FIELDS = (
+    PianoField("title", _text_field('title')),
+    PianoField("doi", _text_field('doi')),
+    PianoField("journal", _text_field('journal')),
+    PianoField("published_date", _text_field('published_date')),
+    PianoField("authors", lambda mapper, fields, article: [mapper.get_author(author) for author in fields['authors']]),
+    PianoField("abstract", lambda mapper, fields, article: mapper.get_abstract(fields['abstracts']), ["abstracts"]),
+    PianoField("keywords", lambda mapper, fields, article: ",".join(
+        [mapper.get_single_mesh_heading(mesh_heading) for mesh_heading in fields['mesh_headings']]), ["mesh_headings"]),
+    PianoField("pmid", _text_field('pmid')),
+    PianoField("external_id", _external_id, ["pmid"], optional=True),
+    PianoField("author_address", _text_field('author_address')),
+    PianoField("pages", _text_field('pages')),
+    PianoField("volume", _text_field('volume')),
+    PianoField("number", _text_field('number')),
+    PianoField("edition", _edition, ["pubdate_year", "pubdate_month", "pubdate_day"], optional=True),
+    PianoField("isbn", _text_field('isbn')),
+    PianoField("language", _text_field('language')),
+)
+
+# Elements whose subtrees only the listed PUBMED_FIELD_SPECS read from, so mappers that extract none of them skip the
+# subtrees while splitting the articles. No spec reads the references, which some articles have hundreds of
+PUBMED_SUBTREES = (
+    ("ReferenceList", ()),
+    ("MeshHeadingList", ("mesh_headings",)),
+    ("AuthorList", ("authors", "author_address")),
+    ("Abstract", ("abstracts",)),
+)
+
+# Entry of the profile report timing the walk of the articles, the time of their extraction not spent on any field spec
+WALK_ARTICLE = "(walk article)"
+# Entries of the profile report timing the extraction of every field spec
+EXTRACT_SPEC = "(extract) %s"
+
+
 class PubMedMapper(Mapper):
 
-    def __init__(self):
+    field_plan = SoupFieldPlan
+    # increased whenever PIANO_FIELDS or PUBMED_FIELD_SPECS change the Piano dictionaries
+    mapping_version = 1
+
+    def __init__(self, profile=False, fields=None):
+        """
+        :param profile: (optional) whether transform_to_piano accumulates the time spent on every field, see
+                        profile_report. Mappers sent to worker processes profile there, so profile with processes=1
+        :param fields: (optional) keys of the Piano fields to map, e.g. ["pmid", "doi", "title"], all by default.
+                       Only the elements these fields are read from are extracted
+        """
         super(PubMedMapper, self).__init__()
         self.element_names = "PubmedArticle"
+        if fields is None:
+            self.piano_fields = PIANO_FIELDS
+        else:
+            unknown = set(fields) - set(piano_field.key for piano_field in PIANO_FIELDS)
+            if unknown:
+                raise ValueError("Unknown Piano fields: %s" % ", ".join(sorted(unknown)))
+            self.piano_fields = tuple(piano_field for piano_field in PIANO_FIELDS if piano_field.key in fields)
+        self._assemblers = tuple((piano_field.key, piano_field.assemble, piano_field.optional)
+                                 for piano_field in self.piano_fields)
+
+        specs = set(spec for piano_field in self.piano_fields for spec in piano_field.specs)
+        self.plan = self.field_plan([spec for spec in PUBMED_FIELD_SPECS if spec.name in specs])
+        self.skip_element_names = tuple(name for name, subtree_specs in PUBMED_SUBTREES
+                                        if not specs.intersection(subtree_specs))
+        self.profile = profile
+        self.reset_profile()
 
     def attach_article_ids(self, xml_items):
         return [(i, {"pmid": self.get_text_if_not_null(i.select_one('PMID'))}) for i in xml_items]
 
+    def element_id(self, element):
+        return element.findtext("MedlineCitation/PMID")
+
+    def cache_namespace(self):
+        namespace = super(PubMedMapper, self).cache_namespace()
+        if self.piano_fields is PIANO_FIELDS:
+            return namespace
+        return "%s:%s" % (namespace, ",".join(piano_field.key for piano_field in self.piano_fields))
+
     def transform_to_piano(self, xml_soup_article):
+        if self.profile:
+            return self._profiled_transform_to_piano(xml_soup_article)
+
+        fields = self.plan.extract(xml_soup_article)
         article = {}
+        for key, assemble, optional in self._assemblers:
+            value = assemble(self, fields, article)
+            if value is not None or not optional:
+                article[key] = value
+        return article
 
-        article['title'] = self.get_text_if_not_null(xml_soup_article.find('ArticleTitle'))
-        article['doi'] = self.get_text_if_not_null(
-            xml_soup_article.select_one('ArticleIdList > ArticleId[IdType="doi"]'))
-        article['journal'] = self.get_text_if_not_null(xml_soup_article.select_one('Journal > Title'))
-        article['published_date'] = self.get_text_if_not_null(xml_soup_article.select_one('PubDate > MedlineDate'))
-        article['authors'] = [self.get_author(_xml) for _xml in xml_soup_article.select('AuthorList > Author')]
-        article['abstract'] = self.get_abstract(xml_soup_article)
-        article['keywords'] = ",".join(
-            [self.get_single_mesh_heading(_xml) for _xml in xml_soup_article.select('MeshHeadingList > MeshHeading')])
-        article['pmid'] = self.get_text_if_not_null(xml_soup_article.select_one('MedlineCitation > PMID'))
-        if article['pmid']:
-            article['external_id'] = "PUBMED:" + article['pmid']
-        # article['pubmed_xml'] = self.get_text_if_not_null(xml_soup_article)
-
-        article["author_address"] = self.get_text_if_not_null(
-            xml_soup_article.select_one('AuthorList > Author > AffiliationInfo > Affiliation'))
-        article["pages"] = self.get_text_if_not_null(
-            xml_soup_article.select_one('Article > Pagination > MedlinePgn'))
-        article["volume"] = self.get_text_if_not_null(
-            xml_soup_article.select_one('Journal > JournalIssue > Volume'))
-        article["number"] = self.get_text_if_not_null(
-            xml_soup_article.select_one('Journal > JournalIssue > Issue'))
-
-        pubdate_year = self.get_text_if_not_null(xml_soup_article.select_one('PubMedPubDate[PubStatus="pubmed"] > Year'))
-        pubdate_month = self.get_text_if_not_null(xml_soup_article.select_one('PubMedPubDate[PubStatus="pubmed"] > Month'))
-        pubdate_day = self.get_text_if_not_null(xml_soup_article.select_one('PubMedPubDate[PubStatus="pubmed"] > Day'))
-        if pubdate_day and pubdate_month and pubdate_year:
-            article["edition"] = pubdate_year + "/" + pubdate_month + "/" + pubdate_day
-
-        article["isbn"] = self.get_text_if_not_null(xml_soup_article.select_one('Journal > ISSN'))
-        article["language"] = self.get_text_if_not_null(xml_soup_article.select_one('Article > Language'))
-
-        # article["pubmed_xml"] = xml_soup_article.PubmedArticle.wrap(xml_soup_article.new_tag("PubmedArticleSet"))
+    def _profiled_transform_to_piano(self, xml_soup_article):
+        """
+        transform_to_piano, timing the extraction of every field spec and the assembly of every Piano field
+        """
+        timings = self._timings
+        spec_timings = {}
+        started = time.time()
+        fields = self.plan.extract(xml_soup_article, spec_timings)
+        finished = time.time()
+
+        specs_seconds = 0.0
+        for spec in self.plan.specs:
+            seconds = spec_timings.get(spec.name, 0.0)
+            timing = timings[EXTRACT_SPEC % spec.name]
+            timing[0] += seconds
+            timing[1] += 1
+            specs_seconds += seconds
+        timings[WALK_ARTICLE][0] += finished - started - specs_seconds
+        timings[WALK_ARTICLE][1] += 1
 
+        article = {}
+        for key, assemble, optional in self._assemblers:
+            started = finished
+            value = assemble(self, fields, article)
+            if value is not None or not optional:
+                article[key] = value
+            finished = time.time()
+            timing = timings[key]
+            timing[0] += finished - started
+            timing[1] += 1
         return article
 
+    def profile_report(self):
+        """
+        Report of the time spent per field since profiling started or was last reset. The extraction of the elements
+        of every field spec is reported as EXTRACT_SPEC % its name, e.g. "(extract) pubdate_year", the rest of the walk
+        of the articles as WALK_ARTICLE, and the assembly of every Piano field by its key
+        :return: list of (field, seconds, calls) tuples, the most expensive first
+        """
+        return sorted(((field, seconds, calls) for field, (seconds, calls) in self._timings.iteritems()),
+                      key=lambda timing: timing[1], reverse=True)
+
+    def reset_profile(self):
+        """
+        Clears the timings of the profile report
+        :return:
+        """
+        self._timings = dict((field, [0.0, 0]) for field in
+                             [WALK_ARTICLE] + [EXTRACT_SPEC % spec.name for spec in self.plan.specs] +
+                             [piano_field.key for piano_field in self.piano_fields])
+
+    @staticmethod
+    def get_attribute(element, name):
+        """
+        Get an attribute value of element
+        :param element: xml element
+        :param name: attribute name
+        :return: attribute value, else empty string
+        """
+        return element.get(name, "")
+
     def get_qualifier_name(self, qualifier_xml):
         """
         Gets as an input full xml qualifier: <QualifierName MajorTopicYN="Y" UI="Q000379">methods</QualifierName>
@@ -121,18 +393,19 @@ class PubMedMapper(Mapper):
 
         text_ = self.get_text_if_not_null(qualifier_xml)
 
-        if isinstance(qualifier_xml, Tag) \
-                and qualifier_xml.has_attr('MajorTopicYN') and qualifier_xml['MajorTopicYN'] == "Y":
+        if qualifier_xml.get('MajorTopicYN') == "Y":
             return '*' + text_
         else:
             return text_
 
-    def get_single_mesh_heading(self, _xml):
-
-        text_ = [self.get_text_if_not_null(_xml.select_one('DescriptorName'))] + \
-                [self.get_qualifier_name(qualifier_xml)
-                 if qualifier_xml is not NoneType else None
-                 for qualifier_xml in _xml.find_all("QualifierName")]
+    def get_single_mesh_heading(self, mesh_heading):
+        """
+        Gets as an input the extracted fields of a MeshHeading
+        :param mesh_heading: dictionary with the descriptor_name element and list of qualifier_names elements
+        :return:
+        """
+        text_ = [self.get_text_if_not_null(mesh_heading['descriptor_name'])] + \
+                [self.get_qualifier_name(qualifier_xml) for qualifier_xml in mesh_heading['qualifier_names']]
 
         # skip all None
         text_ = filter(lambda t: t is not None, text_)
@@ -141,23 +414,84 @@ class PubMedMapper(Mapper):
 
         return str_mesh_heading
 
-    def get_author(self, _xml):
+    def get_author(self, author):
+        """
+        Gets as an input the extracted fields of an Author
+        :param author: dictionary with the last_name and fore_name elements
+        :return:
+        """
         # extract elements
-        text_ = [_xml.select_one('LastName'), _xml.select_one('ForeName')]
+        text_ = [author['last_name'], author['fore_name']]
 
         # skip None values and join by comma
-        return u", ".join(i.get_text() for i in filter(lambda t: not isinstance(t, NoneType), text_))
+        return u", ".join(self.get_text_if_not_null(i) for i in filter(lambda t: t is not None, text_))
 
-    def get_abstract(self, _xml):
-        abstracts_soup = _xml.select('Abstract > AbstractText')
-        if not abstracts_soup:
+    def get_abstract(self, abstracts_xml):
+        if not abstracts_xml:
             return None
         abstracts = []
-        for abstract in abstracts_soup:
-            label = abstract.get("Label", "")
+        for abstract in abstracts_xml:
+            label = self.get_attribute(abstract, "Label")
             if label:
                 label += ": "
             text = self.get_text_if_not_null(abstract)
             if text:
                 abstracts.append(label + text)
         return u"\n\n".join(abstracts) if abstracts else None
+
+
+class PubMedLxmlMapper(PubMedMapper):
+    """
+    Produces the same Piano dictionaries as PubMedMapper, but reads the fields straight from lxml elements
+    with precompiled XPath instead of serializing every article and re-parsing it with BeautifulSoup
+    """
+
+    etree = etree
+    field_plan = XPathFieldPlan
+
+    _string = etree.XPath("string()", smart_strings=False)
+    _pmid = etree.XPath("(descendant-or-self::PMID)[1]")
+
+    def to_article(self, element):
+        return element
+
+    def article_from_string(self, xml_article):
+        return etree.fromstring(xml_article)
+
+    @staticmethod
+    def get_text_if_not_null(element):
+        """
+        Get text value of element if it exists
+        :param element: lxml element
+        :return: text value, else None
+        """
+        if element is None:
+            return None
+        text = unicode(PubMedLxmlMapper._string(element))
+        if "\r" in text:
+            # the re-serialized article BeautifulSoup parses has these as raw line endings, which are normalized
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        return text
+
+    @staticmethod
+    def get_attribute(element, name):
+        """
+        Get an attribute value of element
+        :param element: lxml element
+        :param name: attribute name
+        :return: attribute value, else empty string
+        """
+        value = element.get(name, "")
+        if "\r" in value or "\t" in value:
+            # likewise these are left raw in re-serialized attributes, where they are normalized to spaces
+            value = value.replace("\r", " ").replace("\t", " ")
+        return value
+
+    def attach_article_ids(self, xml_items):
+        return [(i, {"pmid": self.get_text_if_not_null((self._pmid(i) or [None])[0])}) for i in xml_items]
+
+
+PUBMED_MAPPERS = {
+    "soup": PubMedMapper,
+    "lxml": PubMedLxmlMapper,
+}
@@ -0,0 +1,63 @@
+import json
+import os
+
+
+class Checkpoint(object):
+    """
+    Records, per input file, how many articles of the file have been emitted and the identifier (e.g. PMID) of the
+    last one, so an interrupted import can skip ahead to the first article it has not emitted yet
+    The checkpoints are kept in a JSON file, which is replaced atomically every interval updates and on save
+    """
+
+    def __init__(self, path, interval=100):
+        """
+        :param path: file path of the checkpoint file, loaded if it exists
+        :param interval: (optional) number of updates after which the checkpoint file is written
+        """
+        self.path = path
+        self.interval = interval
+        self.states = {}
+        self._pending = 0
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                self.states = json.load(f)
+
+    def get(self, key):
+        """
+        :param key: input key, e.g. the file path
+        :return: dictionary with the offset and id of the last emitted article of the input, None if there is none
+        """
+        return self.states.get(key)
+
+    def update(self, key, offset, element_id):
+        """
+        Record the last emitted article of an input
+        :param key: input key, e.g. the file path
+        :param offset: number of articles of the input emitted so far
+        :param element_id: identifier of the last emitted article, e.g. its PMID
+        :return:
+        """
+        self.states[key] = {"offset": offset, "id": element_id}
+        self._pending += 1
+        if self._pending >= self.interval:
+            self.save()
+
+    def clear(self, key):
+        """
+        Forget an input, so it is imported from its first article again
+        :param key: input key, e.g. the file path
+        :return:
+        """
+        if self.states.pop(key, None) is not None:
+            self.save()
+
+    def save(self):
+        """
+        Write the checkpoint file, through a temporary file so it is never left partially written
+        :return:
+        """
+        temporary = self.path + ".tmp"
+        with open(temporary, "wb") as f:
+            json.dump(self.states, f)
+        os.rename(temporary, self.path)
+        self._pending = 0
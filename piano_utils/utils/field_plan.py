@@ -0,0 +1,221 @@
+import re
+import time
+from abc import ABCMeta, abstractmethod
+from collections import namedtuple
+
+from bs4 import Tag
+from lxml import etree
+
+_SELECTOR_STEP = re.compile(r'^([\w.-]+)((?:\[[\w.-]+="[^"]*"\])*)$')
+_SELECTOR_ATTRIBUTE = re.compile(r'\[([\w.-]+)="([^"]*)"\]')
+
+
+class FieldSpec(namedtuple("FieldSpec", "name selector many fields")):
+    """
+    Declares a field read from an article
+    name: key of the field in the extracted dictionary
+    selector: CSS style selector, tag names joined by the child combinator (>) with optional [attr="value"] filters
+    many: whether all matches are collected in document order, rather than only the first one
+    fields: (optional) field specs evaluated within the subtree of every match, the match is then replaced by
+            the dictionary of these fields
+    """
+
+    def __new__(cls, name, selector, many=False, fields=()):
+        return super(FieldSpec, cls).__new__(cls, name, selector, many, tuple(fields))
+
+
+def parse_selector(selector):
+    """
+    Parse a selector into its steps
+    :param selector: selector of the form 'A > B[attr="value"]'
+    :return: tuple of (tag, ((attr, value), ...)) steps
+    """
+    steps = []
+    for part in selector.split(">"):
+        match = _SELECTOR_STEP.match(part.strip())
+        if not match:
+            raise ValueError("Unsupported selector: %s" % selector)
+        steps.append((match.group(1), tuple(_SELECTOR_ATTRIBUTE.findall(match.group(2)))))
+    return tuple(steps)
+
+
+class FieldPlan(object):
+    """
+    A set of field specs compiled once and then used to extract the fields of any number of articles
+    """
+    __metaclass__ = ABCMeta
+
+    def __init__(self, specs):
+        self.specs = tuple(specs)
+        self.compile()
+
+    def __getstate__(self):
+        # compiled plans are rebuilt from their specs when unpickled, e.g. in worker processes
+        return {"specs": self.specs}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @abstractmethod
+    def compile(self):
+        """
+        Compile the specs into the structures extract walks
+        :return:
+        """
+        pass
+
+    @abstractmethod
+    def extract(self, root, timings=None):
+        """
+        Extract the fields from an article
+        :param root: article element
+        :param timings: (optional) dictionary of field name to seconds, the time spent matching every spec is added
+                        to, including the time spent on the fields of its matches
+        :return: dictionary of field name to the first matched element (None if there is no match), or for
+                 'many' fields the list of matched elements
+        """
+        pass
+
+
+class SoupFieldPlan(FieldPlan):
+    """
+    Extracts every field of a BeautifulSoup article in a single traversal of its tree. Each visited element
+    is only checked against the specs whose last selector step names its tag, and the rest of the selector
+    is checked against the ancestors of the element
+    """
+
+    def compile(self):
+        self._specs_by_tag = {}
+        for spec in self.specs:
+            steps = parse_selector(spec.selector)
+            tag, attrs = steps[-1]
+            # ancestor steps, nearest parent first
+            parent_steps = tuple(reversed(steps[:-1]))
+            sub_plan = SoupFieldPlan(spec.fields) if spec.fields else None
+            self._specs_by_tag.setdefault(tag, []).append((spec.name, spec.many, attrs, parent_steps, sub_plan))
+
+    def empty_fields(self):
+        return dict((spec.name, [] if spec.many else None) for spec in self.specs)
+
+    def extract(self, root, timings=None):
+        fields = self.empty_fields()
+        # active sub plans of matched elements, as (depth of the element, plan, fields, name of the timed spec)
+        scopes = []
+        ancestors = []
+        stack = [(root, 0)]
+        while stack:
+            element, depth = stack.pop()
+            del ancestors[depth:]
+            while scopes and scopes[-1][0] >= depth:
+                scopes.pop()
+
+            for _, sub_plan, sub_fields, name in list(scopes):
+                sub_plan.match(element, ancestors, depth, sub_fields, scopes, timings, name)
+            self.match(element, ancestors, depth, fields, scopes, timings)
+
+            ancestors.append(element)
+            children = [child for child in element.contents if isinstance(child, Tag)]
+            children.reverse()
+            stack.extend((child, depth + 1) for child in children)
+
+        return fields
+
+    def match(self, element, ancestors, depth, fields, scopes, timings=None, scope_name=None):
+        """
+        Record element in fields for every spec it matches
+        :param element: visited element
+        :param ancestors: ancestors of the element, root first
+        :param depth: depth of the element
+        :param fields: fields extracted so far
+        :param scopes: active sub plans, a sub plan is opened for matches of specs with fields
+        :param timings: (optional) dictionary of field name to seconds, the time spent matching is added to
+        :param scope_name: (optional) name of the spec of the sub plan, the time of its specs is added to
+        :return:
+        """
+        specs = self._specs_by_tag.get(element.name)
+        if not specs:
+            return
+
+        if timings is None:
+            self._match_specs(specs, element, ancestors, depth, fields, scopes, scope_name)
+            return
+        for spec in specs:
+            started = time.time()
+            self._match_specs((spec,), element, ancestors, depth, fields, scopes, scope_name)
+            name = scope_name or spec[0]
+            timings[name] = timings.get(name, 0.0) + time.time() - started
+
+    def _match_specs(self, specs, element, ancestors, depth, fields, scopes, scope_name):
+        for name, many, attrs, parent_steps, sub_plan in specs:
+            if not many and fields[name] is not None:
+                continue
+            if not self._matches(element, attrs) or len(parent_steps) > len(ancestors):
+                continue
+            if not all(ancestors[-idx].name == tag and self._matches(ancestors[-idx], step_attrs)
+                       for idx, (tag, step_attrs) in enumerate(parent_steps, 1)):
+                continue
+
+            value = element
+            if sub_plan is not None:
+                value = sub_plan.empty_fields()
+                scopes.append((depth, sub_plan, value, scope_name or name))
+            if many:
+                fields[name].append(value)
+            else:
+                fields[name] = value
+
+    @staticmethod
+    def _matches(element, attrs):
+        for attr, value in attrs:
+            if element.get(attr) != value:
+                return False
+        return True
+
+
+class XPathFieldPlan(FieldPlan):
+    """
+    Extracts the fields of an lxml article with one precompiled XPath expression per spec
+    """
+
+    def __init__(self, specs, axis="descendant-or-self"):
+        """
+        :param specs: field specs
+        :param axis: (optional) XPath axis the selectors are matched on, relative to the article element
+        """
+        self.axis = axis
+        super(XPathFieldPlan, self).__init__(specs)
+
+    def __getstate__(self):
+        return {"specs": self.specs, "axis": self.axis}
+
+    def compile(self):
+        self._xpaths = []
+        for spec in self.specs:
+            steps = parse_selector(spec.selector)
+            condition = None
+            for tag, attrs in steps[:-1]:
+                condition = "parent::%s%s" % (self._step(tag, attrs), "[%s]" % condition if condition else "")
+            expression = "%s::%s%s" % (self.axis, self._step(*steps[-1]), "[%s]" % condition if condition else "")
+            if not spec.many:
+                expression = "(%s)[1]" % expression
+
+            # fields of a match are only looked up below it
+            sub_plan = XPathFieldPlan(spec.fields, axis="descendant") if spec.fields else None
+            self._xpaths.append((spec.name, spec.many, etree.XPath(expression), sub_plan))
+
+    @staticmethod
+    def _step(tag, attrs):
+        return tag + "".join('[@%s="%s"]' % attr for attr in attrs)
+
+    def extract(self, root, timings=None):
+        fields = {}
+        for name, many, xpath, sub_plan in self._xpaths:
+            if timings is not None:
+                started = time.time()
+            elements = xpath(root)
+            if sub_plan is not None:
+                elements = [sub_plan.extract(element) for element in elements]
+            fields[name] = elements if many else (elements[0] if elements else None)
+            if timings is not None:
+                timings[name] = timings.get(name, 0.0) + time.time() - started
+        return fields
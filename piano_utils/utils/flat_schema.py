@@ -0,0 +1,286 @@
+from piano_utils.utils.flatten_json import KeyPathCache, unflatten_list, _object_kind, _object_kinds, _LEAF, _DICT, \
+    _list_from_dict, _list_index, _unflatten_asserts
+
+# Entry of a root key of the schema that flatten ignores
+_IGNORED = object()
+# Entry of a flattened key unflatten_list leaves to the generic path
+_GENERIC = object()
+
+
+class _Container(object):
+    """
+    Nested dictionary of the records unflatten_list builds, for the flattened keys starting with prefix
+    """
+    __slots__ = ("parent", "key", "prefix", "int_keys", "check")
+
+    def __init__(self, parent, key, prefix, int_keys):
+        """
+        :param parent: _Container holding this one, None for the root
+        :param key: key of this container in its parent
+        :param prefix: flattened key of this container
+        :param int_keys: whether the items of this container are keyed by their list index, None until the first
+                         one is learned
+        """
+        self.parent = parent
+        self.key = key
+        self.prefix = prefix
+        self.int_keys = int_keys
+        # whether the container may be a list, i.e. some of its keys are list indices
+        self.check = False
+
+
+class FlatSchema(object):
+    """
+    Flattens and unflattens records that have the same shape, e.g. a batch of PubMed articles
+    The flattened key of every nested key seen so far is kept in a tree mirroring the records, so flatten looks
+    keys up instead of joining strings. unflatten_list compiles every flattened key into the container it is set in
+    and its key there, list indices already converted to int, so a record is built with one lookup per key and only
+    the containers that can be lists are checked, without splitting keys or parsing indices
+    Keys are learned one by one, so records with lists of different lengths, such as the authors of articles, share
+    the keys they have in common. Keys the schema does not know are learned until max_keys is reached, after which
+    the records holding them take the generic path
+    """
+
+    def __init__(self, separator="_", root_keys_to_ignore=set(), max_keys=100000):
+        """
+        :param separator: string to separate dictionary keys by
+        :param root_keys_to_ignore: set of root keys to ignore from flattening
+        :param max_keys: (optional) number of nested keys learned for flatten, and of flattened keys and their
+                         containers compiled for unflatten_list
+        """
+        assert isinstance(separator, str), "separator must be a string"
+        self.separator = separator
+        self.root_keys_to_ignore = root_keys_to_ignore
+        self.max_keys = max_keys
+        # node of the key tree: [prefix of the children, {nested key: (flattened key, child node)}]
+        self._root = [None, {}]
+        self._keys = 0
+        self._key_cache = KeyPathCache(separator, max_keys)
+        # layout of unflatten_list: the containers by flattened key prefix, the (container, key) of every flattened
+        # key, and the containers of the flattened keys that are also prefixes, e.g. of a text in some records and
+        # a list in others. The prefixes of the containers that turned out to hold both list indices and other keys
+        # are kept when the layout is rebuilt
+        self._mixed = set()
+        self._reset_layout()
+
+    @classmethod
+    def from_sample(cls, nested_dict, **kwargs):
+        """
+        Creates a schema that knows the shape of a sample record
+        :param nested_dict: sample record
+        :param kwargs: (optional) FlatSchema arguments
+        :return: FlatSchema
+        """
+        schema = cls(**kwargs)
+        schema.learn(nested_dict)
+        return schema
+
+    def learn(self, nested_dict):
+        """
+        Adds the keys of a record to the schema, as flatten does for the keys it does not know
+        :param nested_dict: record
+        :return: the flattened record
+        """
+        return self.flatten(nested_dict)
+
+    def flatten(self, nested_dict):
+        """
+        Flattens a dictionary with nested structure, as flatten_json.flatten does
+        :param nested_dict: dictionary we want to flatten
+        :return: flattened dictionary
+        """
+        assert isinstance(nested_dict, dict), "flatten requires a dictionary input"
+
+        flattened_dict = dict()
+
+        # The same walk as flatten_json.flatten, with the keys looked up in the key tree
+        kinds = _object_kinds
+        stack = [(nested_dict.iteritems(), self._root, True)]
+        while stack:
+            items, node, is_dict = stack[-1]
+            for object_key, object_ in items:
+                # keys that are equal but flatten differently, such as 1 and True, are kept apart
+                tree_key = (object_key if not is_dict or type(object_key) is str or type(object_key) is unicode
+                            else (type(object_key), object_key))
+                entry = node[1].get(tree_key)
+                if entry is None:
+                    entry = self._add_key(node, tree_key, object_key, is_dict)
+                if entry is _IGNORED:
+                    continue
+
+                key, child = entry
+                object_type = type(object_)
+                kind = kinds.get(object_type)
+                if kind is None:
+                    kind = _object_kind(object_type)
+                if kind is _LEAF:
+                    flattened_dict[key] = object_
+                else:
+                    if kind is _DICT:
+                        stack.append((object_.iteritems(), child, True))
+                    else:
+                        stack.append((enumerate(object_), child, False))
+                    break
+            else:
+                stack.pop()
+
+        return flattened_dict
+
+    def _add_key(self, node, tree_key, object_key, is_dict):
+        """
+        Computes the entry of a nested key the way flatten_json.flatten does, and adds it to the key tree while
+        there is room
+        """
+        prefix = node[0]
+        if prefix is None and is_dict and object_key in self.root_keys_to_ignore:
+            entry = _IGNORED
+        else:
+            if prefix is None:
+                key = object_key
+            else:
+                key = prefix + (object_key if isinstance(object_key, basestring) else str(object_key))
+
+            if not key:
+                child_prefix = None
+            elif isinstance(key, basestring):
+                child_prefix = key + self.separator
+            else:
+                child_prefix = str(key) + self.separator
+            entry = (key, [child_prefix, {}])
+
+        if self._keys < self.max_keys:
+            node[1][tree_key] = entry
+            self._keys += 1
+        return entry
+
+    def unflatten_list(self, flat_dict):
+        """
+        Unflattens a dictionary, as flatten_json.unflatten_list does
+        :param flat_dict: dictionary with no hierarchy
+        :return: a dictionary with hierarchy
+        """
+        _unflatten_asserts(flat_dict, self.separator)
+        layout = self._layout
+        unflattened_dict = dict()
+        objects = {self._root_container: unflattened_dict}
+        # containers created for this record, parents before their children
+        created = []
+        for key, value in flat_dict.iteritems():
+            entry = layout.get(key)
+            if entry is None:
+                entry = self._learn(key)
+            if entry is _GENERIC:
+                return unflatten_list(flat_dict, self.separator, self._key_cache)
+
+            container, item_key = entry
+            dict_ = objects.get(container)
+            if dict_ is None:
+                dict_ = self._create(container, objects, created)
+            dict_[item_key] = value
+
+        for key, container in self._shadowed.iteritems():
+            if container in objects and key in flat_dict:
+                # a value and a container under the same key, which the generic path fails on or overwrites
+                return unflatten_list(flat_dict, self.separator, self._key_cache)
+
+        # children are replaced by lists before their parents
+        for container in reversed(created):
+            if not container.check:
+                continue
+            dict_ = objects[container]
+            if container.int_keys:
+                size = len(dict_)
+                if max(dict_) < size:
+                    # the indices are distinct, so every index from 0 to size - 1 is filled
+                    converted = [dict_[index] for index in xrange(size)]
+                else:
+                    converted = dict((str(index), value) for index, value in dict_.iteritems())
+            else:
+                converted = _list_from_dict(dict_, self._key_cache.index)
+                if converted is dict_:
+                    continue
+            objects[container.parent][container.key] = converted
+        return unflattened_dict
+
+    @staticmethod
+    def _create(container, objects, created):
+        """
+        Creates the dictionary of a container in a record, and those of its parents the record has none of yet
+        """
+        missing = []
+        while container not in objects:
+            missing.append(container)
+            container = container.parent
+        dict_ = objects[container]
+        for container in reversed(missing):
+            child = dict()
+            dict_[container.key] = child
+            objects[container] = child
+            created.append(container)
+            dict_ = child
+        return dict_
+
+    def _reset_layout(self):
+        self._root_container = _Container(None, None, None, False)
+        self._containers = {}
+        self._layout = {}
+        self._shadowed = {}
+
+    def _learn(self, flat_key):
+        """
+        Compiles a flattened key into the layout of unflatten_list while there is room
+        :param flat_key: flattened key
+        :return: (container, key) of the flattened key, or _GENERIC if the record holding it takes the generic path
+        """
+        if len(self._layout) + len(self._containers) >= self.max_keys:
+            return _GENERIC
+
+        separator = self.separator
+        parts = flat_key.split(separator)
+        container = self._root_container
+        prefix = None
+        for part in parts[:-1]:
+            prefix = part if prefix is None else prefix + separator + part
+            child = self._containers.get(prefix)
+            if child is None:
+                key = self._item_key(container, part)
+                if key is _GENERIC:
+                    return _GENERIC
+                child = _Container(container, key, prefix, False if prefix in self._mixed else None)
+                self._containers[prefix] = child
+                if prefix in self._layout:
+                    self._shadowed[prefix] = child
+            container = child
+
+        key = self._item_key(container, parts[-1])
+        if key is _GENERIC:
+            return _GENERIC
+        if flat_key in self._containers:
+            self._shadowed[flat_key] = self._containers[flat_key]
+        entry = (container, key)
+        self._layout[flat_key] = entry
+        return entry
+
+    def _item_key(self, container, part):
+        """
+        :param container: _Container
+        :param part: key part of an item of the container
+        :return: key of the item in the container, its list index if the container is keyed by list index, and
+                 _GENERIC if the container can no longer be, in which case the layout is rebuilt
+        """
+        if container.parent is None:
+            # the root is never replaced by a list
+            return part
+        index = _list_index(part)
+        if index >= 0:
+            container.check = True
+            if container.int_keys is None:
+                container.int_keys = True
+            return index if container.int_keys else part
+        if container.int_keys:
+            # the keys compiled as list indices of this container are now wrong
+            self._mixed.add(container.prefix)
+            self._reset_layout()
+            return _GENERIC
+        container.int_keys = False
+        return part
@@ -54,7 +54,7 @@ def _construct_key(previous_key, separator, new_key):
         return new_key
 
 
-def flatten(nested_dict, separator="_", root_keys_to_ignore=set()):
+def flatten(nested_dict, separator="_", root_keys_to_ignore=set(), index=None, include=None, exclude=None):
     """
     Flattens a dictionary with nested structure to a dictionary with no hierarchy
     Consider ignoring keys that you are not interested in to prevent unnecessary processing
@@ -63,6 +63,12 @@ def flatten(nested_dict, separator="_", root_keys_to_ignore=set()):
     :param nested_dict: dictionary we want to flatten
     :param separator: string to separate dictionary keys by
     :param root_keys_to_ignore: set of root keys to ignore from flattening
+    :param index: (optional) FlatIndex the flattened keys and values are added to, by their key pattern
+    :param include: (optional) key paths to flatten, any other key is left out. A path is a key prefix at any depth,
+                    as a string of keys joined by separator or a tuple of keys, with * for the indices of lists,
+                    e.g. "MedlineCitation_MeshHeadingList_MeshHeading_*_DescriptorName". The wildcard also matches
+                    nothing where a key holds a single item instead of a list, as xmltodict parses a single element
+    :param exclude: (optional) key paths left out, their subtrees are not walked at all
     :return: flattened dictionary
     """
     assert isinstance(nested_dict, dict), "flatten requires a dictionary input"
@@ -71,102 +77,598 @@ def flatten(nested_dict, separator="_", root_keys_to_ignore=set()):
     # This global dictionary stores the flattened keys and values and is ultimately returned
     flattened_dict = dict()
 
-    def _flatten(object_, key):
-        """
-        For dict, list and set objects_ calls itself on the elements and for other types assigns the object_ to
-        the corresponding key in the global flattened_dict
-        :param object_: object to flatten
-        :param key: carries the concatenated key for the object_
-        :return: None
-        """
-        if isinstance(object_, dict):
-            for object_key in object_:
-                if not (not key and object_key in root_keys_to_ignore):
-                    _flatten(object_[object_key], _construct_key(key, separator, object_key))
-        elif isinstance(object_, list) or isinstance(object_, set):
-            for index, item in enumerate(object_):
-                _flatten(item, _construct_key(key, separator, index))
+    # Depth first walk with an explicit stack instead of recursion. Each entry holds the iterator over the
+    # (key, object_) pairs of a dict, list or set, the key prefix shared by its children (None when the
+    # children keep their own key) and whether it is a dict. Descending into a child suspends the parent's
+    # iterator, so keys are added in the same order as a recursive walk would add them
+    # When indexing, the entries also hold the prefix of the key patterns, in which list indices are wildcards
+    # When filtering, the entries also hold the PathFilter node of the children, None once nothing below is filtered
+    kinds = _object_kinds
+    root_node = None
+    if include is not None or exclude is not None:
+        root_node = path_filter(include, exclude, separator).root
+        if root_node.unfiltered:
+            root_node = None
+    stack = [(nested_dict.iteritems(), None, True, None, root_node)]
+    while stack:
+        items, prefix, is_dict, pattern_prefix, node = stack[-1]
+        for object_key, object_ in items:
+            if node is not None:
+                child_node = node.child(object_key, is_dict)
+                if (child_node is not None and child_node.single is not None and
+                        (kinds.get(type(object_)) or _object_kind(type(object_))) is not _SEQUENCE):
+                    # a single item where the paths expect a list
+                    child_node = child_node.single
+                if child_node is None:
+                    if not node.included:
+                        continue
+                elif child_node.excluded:
+                    continue
+                elif child_node.unfiltered:
+                    child_node = None
+            else:
+                child_node = None
+
+            if prefix is None:
+                if is_dict and object_key in root_keys_to_ignore:
+                    continue
+                key = object_key
+            elif type(object_key) is str or type(object_key) is unicode:
+                key = prefix + object_key
+            else:
+                key = prefix + (object_key if isinstance(object_key, basestring) else str(object_key))
+
+            if index is not None:
+                pattern = _key_pattern(key, object_key, is_dict, prefix, pattern_prefix, index.wildcard)
+
+            object_type = type(object_)
+            kind = kinds.get(object_type)
+            if kind is None:
+                kind = _object_kind(object_type)
+            if kind is _LEAF:
+                if child_node is not None and not child_node.included:
+                    # the leaf is on the way to included paths, but not included itself
+                    continue
+                flattened_dict[key] = object_
+                if index is not None:
+                    index.add(pattern, key, object_)
+            else:
+                if not key:
+                    child_prefix = child_pattern_prefix = None
+                else:
+                    child_prefix = (key if isinstance(key, basestring) else str(key)) + separator
+                    child_pattern_prefix = pattern + separator if index is not None else None
+                if kind is _DICT:
+                    stack.append((object_.iteritems(), child_prefix, True, child_pattern_prefix, child_node))
+                else:
+                    stack.append((enumerate(object_), child_prefix, False, child_pattern_prefix, child_node))
+                break
         else:
-            flattened_dict[key] = object_
+            stack.pop()
 
-    _flatten(nested_dict, None)
     return flattened_dict
 
+
+def _key_pattern(key, object_key, is_dict, prefix, pattern_prefix, wildcard):
+    """
+    :return: the key pattern of a flattened key, the key with the list indices in it replaced by the wildcard
+    """
+    if prefix is None:
+        # the children of a dict or list whose key is empty keep their own key
+        return wildcard if not is_dict else key if isinstance(key, basestring) else str(key)
+    if not is_dict:
+        return pattern_prefix + wildcard
+    return pattern_prefix + (object_key if isinstance(object_key, basestring) else str(object_key))
+
+
+_LEAF = "leaf"
+_DICT = "dict"
+_SEQUENCE = "sequence"
+_object_kinds = {}
+
+
+def _object_kind(object_type):
+    """
+    Returns whether flatten treats objects of object_type as a dict, a list/set or a value, and caches it
+    so the type checks are only done once per type
+    """
+    if issubclass(object_type, dict):
+        kind = _DICT
+    elif issubclass(object_type, list) or issubclass(object_type, set):
+        kind = _SEQUENCE
+    else:
+        kind = _LEAF
+    _object_kinds[object_type] = kind
+    return kind
+
 flatten_json = flatten
 
 
 def _unflatten_asserts(flat_dict, separator):
     assert isinstance(flat_dict, dict), "un_flatten requires a dictionary input"
     assert isinstance(separator, str), "separator must be a string"
-    assert all((not isinstance(value, Iterable) or isinstance(value, str) or isinstance(value, unicode)
-                for value in flat_dict.values())), "provided dictionary is not flat"
+    flat_types = _flat_types
+    assert all((flat_types.get(type(value)) or _is_flat_type(type(value))
+                for value in flat_dict.itervalues())), "provided dictionary is not flat"
+
+
+_flat_types = {}
 
 
-def unflatten(flat_dict, separator='_'):
+def _is_flat_type(value_type):
+    """
+    Returns whether values of value_type can be values of a flat dictionary, strings or values that are not
+    Iterable, and caches it so the Iterable check is only done once per type
+    """
+    flat = not issubclass(value_type, Iterable) or issubclass(value_type, basestring)
+    _flat_types[value_type] = flat
+    return flat
+
+
+def unflatten(flat_dict, separator='_', key_cache=None):
     """
     Creates a hierarchical dictionary from a flattened dictionary
     Assumes no lists are present
     :param flat_dict: a dictionary with no hierarchy
     :param separator: a string that separates keys
+    :param key_cache: (optional) KeyPathCache of the separator, to reuse the split keys of previous dictionaries
     :return: a dictionary with hierarchy
     """
     _unflatten_asserts(flat_dict, separator)
+    return _unflatten(flat_dict, separator, key_cache)
+
+
+def _unflatten(flat_dict, separator, key_cache):
+    """
+    Creates the hierarchical dictionary of unflatten, without checking flat_dict
+    """
+    assert key_cache is None or key_cache.separator == separator, "key_cache must use the same separator"
+    split = key_cache.split if key_cache is not None else lambda item: item.split(separator)
 
     # This global dictionary is mutated and returned
     unflattened_dict = dict()
 
-    def _unflatten(dic, keys, value):
+    for item, value in flat_dict.iteritems():
+        keys = split(item)
+        dic = unflattened_dict
         for key in keys[:-1]:
             dic = dic.setdefault(key, {})
 
         dic[keys[-1]] = value
 
-    for item in flat_dict:
-        _unflatten(unflattened_dict, item.split(separator), flat_dict[item])
-
     return unflattened_dict
 
 
-def unflatten_list(flat_dict, separator='_'):
+def unflatten_list(flat_dict, separator='_', key_cache=None):
     """
-    Unflattens a dictionary, first assuming no lists exist and then tries to identify lists and replaces them
-    This is probably not very efficient and has not been tested extensively
-    Feel free to add test cases or rewrite the logic
-    Issues that stand out to me:
-    - Sorting all the keys in the dictionary, which specially for the root dictionary can be a lot of keys
-    - Checking that numbers are consecutive is O(N) in number of keys
+    Unflattens a dictionary, first assuming no lists exist and then replaces every nested dictionary whose keys
+    are exactly "0" to "n-1" by a list
+    Each dictionary is checked once, in a single bottom-up walk that reads its keys once, so this is linear in
+    the number of keys and never sorts them
 
     :param flat_dict: dictionary with no hierarchy
     :param separator: a string that separates keys
+    :param key_cache: (optional) KeyPathCache of the separator, to reuse the split keys and list indices of
+                      previous dictionaries
     :return: a dictionary with hierarchy
     """
     _unflatten_asserts(flat_dict, separator)
 
     # First unflatten the dictionary assuming no lists exist
-    unflattened_dict = unflatten(flat_dict, separator)
-
-    def _convert_dict_to_list(object_, parent_object, parent_object_key):
-        if isinstance(object_, dict):
-            try:
-                keys = [int(key) for key in object_]
-                keys.sort()
-            except (ValueError, TypeError):
-                keys = []
-            keys_len = len(keys)
-
-            if (keys_len > 0 and sum(keys) == int(((keys_len - 1) * keys_len) / 2) and keys[0] == 0 and
-                    keys[-1] == keys_len - 1 and check_if_numbers_are_consecutive(keys)):
-                # The dictionary looks like a list so we're going to replace it as one
-                parent_object[parent_object_key] = [object_[str(key)] for key in keys]
-
-            for key in object_:
-                if isinstance(object_[key], dict):
-                    _convert_dict_to_list(object_[key], object_, key)
-
-    _convert_dict_to_list(unflattened_dict, None, None)
+    unflattened_dict = _unflatten(flat_dict, separator, key_cache)
+
+    list_index = key_cache.index if key_cache is not None else _list_index
+    # The root itself is never replaced by a list
+    for key, object_ in unflattened_dict.iteritems():
+        if type(object_) is dict:
+            unflattened_dict[key] = _convert_dict_to_list(object_, list_index)
     return unflattened_dict
 
 
+def _convert_dict_to_list(object_, list_index):
+    """
+    Replaces the nested dictionaries of object_ that look like lists, and then object_ itself
+    :param object_: dictionary built by unflatten
+    :param list_index: function returning the list index a key stands for
+    :return: a list of the values of object_ in index order if its keys are exactly "0" to "n-1", otherwise object_
+    """
+    # Iterative post-order walk, children are converted before the dictionary that holds them
+    stack = [(object_, object_.iteritems(), None, None)]
+    while stack:
+        dict_, items, parent, parent_key = stack[-1]
+        for key, child in items:
+            if type(child) is dict:
+                stack.append((child, child.iteritems(), dict_, key))
+                break
+        else:
+            stack.pop()
+            converted = _list_from_dict(dict_, list_index)
+            if parent is None:
+                return converted
+            if converted is not dict_:
+                parent[parent_key] = converted
+
+
+def _list_from_dict(dict_, list_index):
+    """
+    :param dict_: dictionary
+    :param list_index: function returning the list index a key stands for
+    :return: list of the values of dict_ in index order if its keys are exactly "0" to "n-1", otherwise dict_
+    """
+    size = len(dict_)
+    list_ = [None] * size
+    for key, value in dict_.iteritems():
+        index = list_index(key)
+        if index < 0 or index >= size:
+            return dict_
+        list_[index] = value
+    # the keys are distinct and all below size, so every index from 0 to size - 1 is filled
+    return list_ if size else dict_
+
+
+def _list_index(key):
+    """
+    :param key: dictionary key
+    :return: the list index the key stands for, -1 if it is not an index
+    """
+    # only keys written the way str(index) writes them, as "01" or "+1" would not round trip
+    if not key.isdigit() or (key[0] == "0" and len(key) > 1):
+        return -1
+    try:
+        return int(key)
+    except ValueError:
+        # digits int does not read, such as superscripts
+        return -1
+
+
+class KeyPathCache(object):
+    """
+    Bounded cache of the parts unflatten splits flattened keys into and of the list indices these parts stand for,
+    to share between dictionaries with the same keys, e.g. the records of a batch
+    Least recently used entries are evicted approximately: entries are kept in a recent and an older generation of
+    at most maxsize entries each, a full recent generation replaces the older one and entries used from the older
+    generation are moved back into the recent one
+    """
+
+    def __init__(self, separator="_", maxsize=10000):
+        """
+        :param separator: a string that separates keys
+        :param maxsize: (optional) number of keys and of key parts kept in each generation
+        """
+        assert isinstance(separator, str), "separator must be a string"
+        assert maxsize > 0, "maxsize must be positive"
+        self.separator = separator
+        self.maxsize = maxsize
+        # recent and older generation of the split keys and of the list indices
+        self._paths = [{}, {}]
+        self._indices = [{}, {}]
+
+    def __len__(self):
+        return sum(len(generation) for generation in self._paths)
+
+    def split(self, key):
+        """
+        :param key: flattened key
+        :return: tuple of the parts of the key
+        """
+        paths = self._paths
+        parts = paths[0].get(key)
+        if parts is None:
+            parts = paths[1].get(key)
+            if parts is None:
+                parts = tuple(key.split(self.separator))
+            self._add(paths, key, parts)
+        return parts
+
+    def index(self, part):
+        """
+        :param part: key part
+        :return: the list index the part stands for, -1 if it is not an index
+        """
+        indices = self._indices
+        index = indices[0].get(part)
+        if index is None:
+            index = indices[1].get(part)
+            if index is None:
+                index = _list_index(part)
+            self._add(indices, part, index)
+        return index
+
+    def _add(self, generations, key, value):
+        if len(generations[0]) >= self.maxsize:
+            generations[1] = generations[0]
+            generations[0] = {}
+        generations[0][key] = value
+
+
+class _PathNode(object):
+    """
+    Node of the tree of the key paths of a PathFilter
+    """
+
+    __slots__ = ("children", "included", "excluded", "unfiltered", "wildcard", "single")
+
+    def __init__(self, wildcard):
+        self.children = {}
+        # whether the keys below the node are included unless excluded by a node further down
+        self.included = False
+        self.excluded = False
+        # whether nothing below the node is filtered, so the walk stops checking the keys
+        self.unfiltered = False
+        self.wildcard = wildcard
+        # node used in the place of this one when its key holds a single item instead of a list, as xmltodict
+        # parses an element that is not repeated, merging it with its wildcard child, None without wildcard child
+        self.single = None
+
+    def child(self, object_key, is_dict):
+        """
+        :param object_key: key of a dictionary or index of a list
+        :param is_dict: whether the key is of a dictionary
+        :return: the node of the key, None if no path goes through it
+        """
+        if not is_dict:
+            return self.children.get(self.wildcard)
+        if type(object_key) is not str and type(object_key) is not unicode:
+            object_key = object_key if isinstance(object_key, basestring) else str(object_key)
+        return self.children.get(object_key)
+
+
+class PathFilter(object):
+    """
+    Include and exclude key paths compiled into a tree of their keys, which flatten walks alongside the nested
+    dictionary, so a key is checked with a dictionary lookup and excluded subtrees are never walked
+    A key is kept if a path of include, or any path if include is None, is a prefix of it and no path of exclude is.
+    Paths are keys joined by the separator, or tuples of keys, with the wildcard for the indices of lists. The
+    wildcard also matches nothing when the key holds a single item instead of a list, so "a_*_b" keeps "a_0_b" and
+    "a_1_b", and "a_b" when a is not a list
+    """
+
+    def __init__(self, include=None, exclude=None, separator="_", wildcard="*"):
+        """
+        :param include: (optional) key paths to keep, None for all
+        :param exclude: (optional) key paths to leave out
+        :param separator: a string that separates keys
+        :param wildcard: (optional) string standing for any list index
+        """
+        assert isinstance(separator, str), "separator must be a string"
+        self.separator = separator
+        self.wildcard = wildcard
+        self.root = _PathNode(wildcard)
+        self.root.included = include is None
+        for path in include or ():
+            self._add(path).included = True
+        for path in exclude or ():
+            self._add(path).excluded = True
+        self._propagate(self.root)
+        self._add_singles(self.root)
+
+    def _add(self, path):
+        node = self.root
+        for part in (path.split(self.separator) if isinstance(path, basestring) else path):
+            if not isinstance(part, basestring):
+                part = str(part)
+            child = node.children.get(part)
+            if child is None:
+                child = node.children[part] = _PathNode(self.wildcard)
+            node = child
+        return node
+
+    def _propagate(self, node):
+        """
+        Includes the nodes below included ones and finds the nodes below which nothing is filtered
+        :return: whether nothing below the node is excluded
+        """
+        unexcluded = not node.excluded
+        for child in node.children.itervalues():
+            child.included = child.included or node.included
+            unexcluded = self._propagate(child) and unexcluded
+        node.unfiltered = node.included and unexcluded
+        return unexcluded
+
+    def _add_singles(self, node):
+        """
+        Sets the single node of the nodes with a wildcard child, below node and below the single nodes themselves
+        """
+        for child in node.children.itervalues():
+            self._add_singles(child)
+        items = node.children.get(self.wildcard)
+        if items is not None:
+            # the single item is matched by the paths of the items, not by the paths of the list
+            single = _merge_nodes(node, items, self.wildcard, skip=self.wildcard)
+            self._propagate(single)
+            self._add_singles(single)
+            node.single = single
+
+
+def _merge_nodes(node, other, wildcard, skip=None):
+    """
+    :param node: node of a PathFilter
+    :param other: (optional) node of a PathFilter, None to copy node
+    :param wildcard: string standing for any list index
+    :param skip: (optional) key of a child of node left out
+    :return: new node of the keys matched by the paths of node or of other
+    """
+    merged = _PathNode(wildcard)
+    merged.included = node.included or other is not None and other.included
+    merged.excluded = node.excluded or other is not None and other.excluded
+    for key in set(node.children).union(other.children if other is not None else ()):
+        child = node.children.get(key) if key != skip else None
+        other_child = other.children.get(key) if other is not None else None
+        if child is None:
+            child, other_child = other_child, None
+        if child is not None:
+            merged.children[key] = _merge_nodes(child, other_child, wildcard)
+    return merged
+
+
+# include and exclude paths to their compiled PathFilter, reused by the records flattened with the same filters
+_path_filters = {}
+_MAX_PATH_FILTERS = 100
+
+
+def path_filter(include=None, exclude=None, separator="_"):
+    """
+    :param include: (optional) key paths to keep, None for all
+    :param exclude: (optional) key paths to leave out
+    :param separator: a string that separates keys
+    :return: the PathFilter of the paths, compiled once for all the records using them
+    """
+    cache_key = (_hashable_paths(include), _hashable_paths(exclude), separator)
+    compiled = _path_filters.get(cache_key)
+    if compiled is None:
+        if len(_path_filters) >= _MAX_PATH_FILTERS:
+            _path_filters.clear()
+        compiled = _path_filters[cache_key] = PathFilter(include, exclude, separator)
+    return compiled
+
+
+def _hashable_paths(paths):
+    if paths is None:
+        return None
+    return tuple(path if isinstance(path, basestring) else tuple(path) for path in paths)
+
+
+class FlatIndex(object):
+    """
+    Index of the keys and values of a flattened dictionary by key pattern, the key with its list indices replaced by
+    a wildcard, e.g. MedlineCitation_MeshHeadingList_MeshHeading_*_DescriptorName_#text for the keys
+    MedlineCitation_MeshHeadingList_MeshHeading_0_DescriptorName_#text, ..._1_DescriptorName_#text, ...
+    A pattern is looked up in constant time and returns its matches without scanning the other keys. As xmltodict
+    parses an element that is not repeated into a single item instead of a list, whose key has no index, a wildcard
+    of the pattern also matches nothing, e.g. the pattern above also returns the value of
+    MedlineCitation_MeshHeadingList_MeshHeading_DescriptorName_#text for an article with a single heading
+
+        index = FlatIndex()
+        flat_dict = flatten(nested_dict, index=index)
+        index.values("MedlineCitation_MeshHeadingList_MeshHeading_*_DescriptorName_#text")
+    """
+
+    def __init__(self, separator="_", wildcard="*"):
+        """
+        :param separator: a string that separates keys, the separator given to flatten
+        :param wildcard: (optional) string standing for any list index in the key patterns
+        """
+        assert isinstance(separator, str), "separator must be a string"
+        self.separator = separator
+        self.wildcard = wildcard
+        # key pattern to the list of (flattened key, value) matching it
+        self.patterns = {}
+
+    @classmethod
+    def from_flat(cls, flat_dict, separator="_", wildcard="*"):
+        """
+        Indexes a dictionary that has already been flattened, e.g. a record of pubmed_xml_to_json. As the keys no
+        longer tell list indices from dictionary keys, every key part made of digits is taken for a list index, and the
+        matches of a pattern are ordered by these indices
+        :param flat_dict: flattened dictionary
+        :param separator: a string that separates keys
+        :param wildcard: (optional) string standing for any list index in the key patterns
+        :return: FlatIndex
+        """
+        index = cls(separator, wildcard)
+        patterns = {}
+        for key, value in flat_dict.iteritems():
+            parts = (key if isinstance(key, basestring) else str(key)).split(separator)
+            pattern = separator.join(wildcard if part.isdigit() else part for part in parts)
+            entries = patterns.get(pattern)
+            if entries is None:
+                entries = patterns[pattern] = []
+            entries.append((tuple(int(part) for part in parts if part.isdigit()), key, value))
+
+        # put the matches of every pattern in the order of their list indices, as flatten would have added them
+        for pattern, entries in patterns.iteritems():
+            if len(entries) > 1:
+                entries.sort(key=lambda entry: entry[0])
+            patterns[pattern] = [(key, value) for indices, key, value in entries]
+        index.patterns = patterns
+        return index
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def __contains__(self, pattern):
+        return pattern in self.patterns
+
+    def __iter__(self):
+        return iter(self.patterns)
+
+    def add(self, pattern, key, value):
+        """
+        :param pattern: key pattern of the key
+        :param key: flattened key
+        :param value: value of the key
+        :return:
+        """
+        entries = self.patterns.get(pattern)
+        if entries is None:
+            self.patterns[pattern] = [(key, value)]
+        else:
+            entries.append((key, value))
+
+    def get(self, pattern):
+        """
+        :param pattern: key pattern, with the wildcard for every list index
+        :return: list of (flattened key, value) matching the pattern, in the order they were flattened, followed by
+                 the matches of the pattern without some of its wildcards, which single items have
+        """
+        patterns = self.patterns
+        variants = pattern_variants(pattern, self.separator, self.wildcard)
+        if len(variants) == 1:
+            return patterns.get(pattern, [])
+        matches = [patterns[variant] for variant in variants if variant in patterns]
+        if len(matches) == 1:
+            return matches[0]
+        return [entry for entries in matches for entry in entries]
+
+    def values(self, pattern):
+        """
+        :param pattern: key pattern, with the wildcard for every list index
+        :return: list of the values of the keys matching the pattern
+        """
+        return [value for key, value in self.get(pattern)]
+
+    def first(self, pattern, default=None):
+        """
+        :param pattern: key pattern, with the wildcard for every list index
+        :param default: (optional) value returned if no key matches
+        :return: value of the first key matching the pattern
+        """
+        entries = self.get(pattern)
+        return entries[0][1] if entries else default
+
+
+# key pattern, separator and wildcard to the patterns FlatIndex looks up for the pattern
+_pattern_variants = {}
+_MAX_PATTERN_VARIANTS = 1000
+
+
+def pattern_variants(pattern, separator="_", wildcard="*"):
+    """
+    :param pattern: key pattern
+    :param separator: a string that separates keys
+    :param wildcard: (optional) string standing for any list index in the key pattern
+    :return: tuple of the pattern followed by the patterns without some of its wildcards, which match the keys of
+             single items instead of lists, e.g. "a_*_b" and "a_b"
+    """
+    cache_key = (pattern, separator, wildcard)
+    variants = _pattern_variants.get(cache_key)
+    if variants is None:
+        if wildcard not in pattern:
+            variants = (pattern,)
+        else:
+            parts_variants = [()]
+            for part in pattern.split(separator):
+                if part == wildcard:
+                    parts_variants = [parts + (part,) for parts in parts_variants] + parts_variants
+                else:
+                    parts_variants = [parts + (part,) for parts in parts_variants]
+            variants = tuple(separator.join(parts) for parts in parts_variants if parts)
+        if len(_pattern_variants) >= _MAX_PATTERN_VARIANTS:
+            _pattern_variants.clear()
+        _pattern_variants[cache_key] = variants
+    return variants
+
+
 def cli(input_stream=sys.stdin, output_stream=sys.stdout):
     import json
     raw = input_stream.read()
@@ -0,0 +1,170 @@
+import datetime
+import sys
+import time
+from collections import defaultdict
+
+# phases of an import: splitting the XML into article elements, parsing the elements into the form the mapper
+# expects (e.g. BeautifulSoup) and mapping them to piano dictionaries
+SPLIT = "split"
+PARSE = "parse"
+MAP = "map"
+
+
+class Instrumentation(object):
+    """
+    Receives the events of an import. This base class ignores them, subclasses override the events they need
+    Imports are only timed and reported when they are given an instrumentation, so imports without one pay nothing
+    """
+
+    def import_started(self):
+        pass
+
+    def articles_found(self, total):
+        """
+        :param total: number of articles to import, only known in advance when the whole XML is split first
+        :return:
+        """
+        pass
+
+    def phase(self, name, seconds, count=1):
+        """
+        :param name: phase name, SPLIT, PARSE or MAP
+        :param seconds: time spent in the phase
+        :param count: number of articles the time was spent on
+        :return:
+        """
+        pass
+
+    def articles_done(self, count):
+        """
+        :param count: number of articles of the import mapped so far
+        :return:
+        """
+        pass
+
+    def import_finished(self, count, error=None):
+        """
+        :param count: number of articles of the import mapped
+        :param error: exception that stopped the import, if any
+        :return:
+        """
+        pass
+
+
+class Metrics(Instrumentation):
+    """
+    Collects the number of articles, the time spent in every phase and the throughput of one or more imports
+    """
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.total = None
+        self.articles = 0
+        self.imports = 0
+        self.errors = 0
+        self.started = None
+        self.finished = None
+        # articles of the previous imports
+        self._articles_before = 0
+
+    def import_started(self):
+        self.total = None
+        self.imports += 1
+        self._articles_before = self.articles
+        if self.started is None:
+            self.started = time.time()
+
+    def articles_found(self, total):
+        self.total = total
+
+    def phase(self, name, seconds, count=1):
+        self.seconds[name] += seconds
+        self.counts[name] += count
+
+    def articles_done(self, count):
+        self.articles = self._articles_before + count
+
+    def import_finished(self, count, error=None):
+        self.articles = self._articles_before + count
+        if error is not None:
+            self.errors += 1
+        self.finished = time.time()
+
+    def elapsed(self):
+        """
+        :return: seconds from the start of the first import to the end of the last one
+        """
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def throughput(self):
+        """
+        :return: articles mapped per second
+        """
+        elapsed = self.elapsed()
+        return self.articles / elapsed if elapsed else 0.0
+
+    def report(self):
+        """
+        :return: dictionary of the metrics
+        """
+        return {
+            "imports": self.imports,
+            "articles": self.articles,
+            "errors": self.errors,
+            "elapsed": self.elapsed(),
+            "throughput": self.throughput(),
+            "phases": dict((name, {"seconds": self.seconds[name], "count": self.counts[name]})
+                           for name in self.seconds),
+        }
+
+
+class StderrProgress(Metrics):
+    """
+    Writes the progress of imports to stderr, or another stream, sampled every number of articles or seconds, and
+    a summary with the time spent in every phase at the end
+    """
+
+    def __init__(self, stream=None, every=1000, interval=10.0):
+        """
+        :param stream: (optional) stream the progress is written to, stderr by default
+        :param every: (optional) number of articles between progress lines
+        :param interval: (optional) seconds between progress lines, whatever the number of articles
+        """
+        super(StderrProgress, self).__init__()
+        self.stream = stream
+        self.every = every
+        self.interval = interval
+        self._next_count = every
+        self._next_time = None
+
+    def write(self, line):
+        (self.stream or sys.stderr).write(line + "\n")
+
+    def import_started(self):
+        super(StderrProgress, self).import_started()
+        self._next_count = self.every
+        self._next_time = time.time() + self.interval
+        self.write("Start Import %s" % datetime.datetime.now())
+
+    def articles_found(self, total):
+        super(StderrProgress, self).articles_found(total)
+        self.write("Found: %d xml articles" % total)
+
+    def articles_done(self, count):
+        super(StderrProgress, self).articles_done(count)
+        if count >= self._next_count or time.time() >= self._next_time:
+            self._next_count = count + self.every
+            self._next_time = time.time() + self.interval
+            self.write("Processing: %s, %.1f articles/s" % (
+                "%d/%d" % (count, self.total) if self.total is not None else count, self.throughput()))
+
+    def import_finished(self, count, error=None):
+        super(StderrProgress, self).import_finished(count, error)
+        phases = ", ".join("%s %.2fs" % (name, self.seconds[name]) for name in (SPLIT, PARSE, MAP)
+                           if name in self.seconds)
+        self.write("End Import %s, %d articles, %.1f articles/s%s%s" % (
+            datetime.datetime.now(), count, self.throughput(), " (%s)" % phases if phases else "",
+            ", failed: %s" % error if error is not None else ""))
@@ -1,9 +1,105 @@
-import datetime
-import xml.etree.ElementTree as ET
+import gzip
+import hashlib
+import mmap
+import multiprocessing
+import time
 from abc import ABCMeta, abstractmethod
+from collections import deque
+from contextlib import closing
+from itertools import islice
 
-import sys
 from bs4 import BeautifulSoup
+from piano_utils.utils.instrumentation import SPLIT, PARSE, MAP
+
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+
+def open_mapped(path):
+    """
+    Open a file for parsing from a read-only memory map, so its bytes are read from the OS page cache, which
+    processes reading the same file share, instead of being copied into one string
+    :param path: file path
+    :return: file-like object supporting read(size), to be closed after use. Empty files, which cannot be
+             mapped, are returned as a regular file object
+    """
+    with open(path, "rb") as f:
+        try:
+            # the map keeps its own handle on the file
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return open(path, "rb")
+
+
+def open_xml(path, mapped=False):
+    """
+    Open an XML file for parsing. Gzip compressed files, such as the .xml.gz files NLM distributes, are recognized
+    by their magic number and decompressed as they are read, so neither the compressed nor the decompressed file is
+    held in memory. Other files are read through a buffer, or from a memory map
+    :param path: file path
+    :param mapped: (optional) whether other files are opened with open_mapped, for parsers building the whole tree.
+                   The pages of a map stay resident as they are read, so incremental parsers use the buffer
+    :return: file-like object supporting read(size), to be closed after use
+    """
+    with open(path, "rb") as f:
+        magic = f.read(2)
+    if magic == "\x1f\x8b":
+        return gzip.open(path, "rb")
+    if mapped:
+        return open_mapped(path)
+    return open(path, "rb")
+
+
+def iterparse_elements(source, element_name, etree=ET, skip=()):
+    """
+    Incrementally parse XML, yielding each element_name element as soon as it has been fully read.
+    Once the consumer moves on, the element is cleared and detached from the tree, as are finished
+    children of the root element, so memory stays flat regardless of the size of the input
+    :param source: file path or file object to parse, file paths are opened with open_xml
+    :param element_name: name of the elements to yield, or tuple of names, e.g. ("PubmedArticle", "DeleteCitation")
+    :param etree: ElementTree implementation used for parsing
+    :param skip: (optional) names of elements emptied as soon as they have been read, so the yielded elements
+                 keep them without their content
+    :return: generator of elements
+    """
+    if isinstance(source, basestring):
+        with closing(open_xml(source)) as xml_file:
+            for element in iterparse_elements(xml_file, element_name, etree, skip):
+                yield element
+        return
+
+    element_names = (element_name,) if isinstance(element_name, basestring) else tuple(element_name)
+    path = []
+    for event, element in etree.iterparse(source, events=("start", "end")):
+        if event == "start":
+            path.append(element)
+            continue
+
+        path.pop()
+        if element.tag in element_names:
+            yield element
+        elif element.tag in skip:
+            _empty_element(element)
+            if len(path) != 1:
+                continue
+        elif len(path) != 1:
+            # only the root keeps a reference to finished elements outside of an article
+            continue
+
+        element.clear()
+        if path:
+            path[-1].remove(element)
+
+
+def _empty_element(element):
+    """
+    Removes the attributes and content of an element, keeping the text that follows it
+    """
+    tail = element.tail
+    element.clear()
+    element.tail = tail
 
 
 class Mapper:
@@ -11,6 +107,12 @@ class Mapper:
 
     element_names = None
     overwrite = None
+    etree = ET
+    # Names of the elements within the articles transform_to_piano does not read, emptied when splitting the articles
+    skip_element_names = ()
+    # Version of the piano dictionaries transform_to_piano produces, part of the cache namespace. Increase it whenever
+    # the mapping changes, so the dictionaries cached by previous versions are not used
+    mapping_version = 1
 
     def __init__(self, overwrite=False):
         self.overwrite = overwrite
@@ -34,14 +136,60 @@ class Mapper:
         """
         pass
 
-    def transform_raw(self, xml):
+    def element_id(self, element):
+        """
+        Identifier of a split out XML element, recorded by checkpoints to check a restarted import resumes from
+        the same article
+        :param element: XML element
+        :return: identifier, or None if the mapper does not identify elements
+        """
+        return None
+
+    def cache_namespace(self):
+        """
+        Namespace of the Piano dictionaries of the mapper in a PianoCache, mappers producing different dictionaries
+        must not share one
+        :return: string of the class and the mapping version of the mapper
+        """
+        return "%s/%d" % (type(self).__name__, self.mapping_version)
+
+    def content_digest(self, element):
+        """
+        Hash of the content of a split out XML element, to tell whether it has changed since it was last seen. The
+        hash is of the element serialized by self.etree, so digests of mappers of different engines must not be
+        compared
+        :param element: XML element, its tail is dropped
+        :return: hex digest
+        """
+        # the whitespace after the element depends on how far the parser has read, it is not hashed
+        element.tail = None
+        return hashlib.sha1(self.etree.tostring(element)).hexdigest()
+
+    def to_article(self, element):
+        """
+        Convert a split out XML element into the form expected by transform_to_piano
+        :param element: XML element
+        :return: XML element in BeautifulSoup format
+        """
+        return self.article_from_string(self.etree.tostring(element))
+
+    def article_from_string(self, xml_article):
+        """
+        Parse a serialized XML element into the form expected by transform_to_piano
+        :param xml_article: serialized XML element
+        :return: XML element in BeautifulSoup format
+        """
+        return BeautifulSoup(xml_article, "xml")
+
+    def transform_raw(self, xml, instrumentation=None):
         """
         Transform raw XML content into list of articles
         :param xml: xml to parse
+        :param instrumentation: (optional) Instrumentation receiving the timings of splitting and parsing the XML
         :return: combine new and existing ids in one return list
         """
 
-        xml_articles_tuples = self.parse_articles_from_xml(xml)
+        xml_articles_tuples = self.parse_articles_from_xml(xml, instrumentation)
 
         return xml_articles_tuples
 
@@ -55,78 +203,492 @@ class Mapper:
         text = element.get_text() if element is not None else None
         return text if text is not None else None
 
-    def parse_articles_from_xml(self, xml_raw):
+    def parse_articles_from_xml(self, xml_raw, instrumentation=None):
         """
         Split raw xml into separate articles (xml format)
         Can throw exception if xml is invalid or could not fine any articles, for e.g. could not find articles.
         :param xml_raw: raw xml format
+        :param instrumentation: (optional) Instrumentation receiving the timings of splitting and parsing the XML
         :return: list of tuples (beautifulXML, pmid)
         """
-        sys.stderr.write("Started parsing XML %s\n" % datetime.datetime.now())
-
-        xml_items = self.parallelize_parse(xml_raw)
-
-        sys.stderr.write("Found: %d xml articles\n" % len(xml_items))
+        xml_items = self.parallelize_parse(xml_raw, instrumentation)
 
         if len(xml_items) == 0:
             raise ValueError('Could not find any articles')
 
         return self.attach_article_ids(xml_items)
 
-    def parallelize_parse(self, xml_raw):
+    def parallelize_parse(self, xml_raw, instrumentation=None):
         """
         Wanted to run multiple parsers in parallel but it seems that sax processing is enough.
         :param xml_raw: raw xml format
+        :param instrumentation: (optional) Instrumentation receiving the timings of splitting and parsing the XML
         :return:
         """
         _list = []
 
-        if isinstance(xml_raw, unicode):
-            # encode in utf8 if raw xml is unicode
-            xml_raw = xml_raw.encode("utf8")
-        root = ET.fromstring(xml_raw)
-        for element in root.iter(self.element_names):
-            _item = BeautifulSoup(ET.tostring(element), "xml")
+        started = time.time()
+        elements = list(self.iter_elements(xml_raw))
+        split = time.time()
+        for element in elements:
+            _item = self.to_article(element)
             _list.append(_item)
 
+        if instrumentation is not None:
+            instrumentation.phase(SPLIT, split - started, len(elements))
+            instrumentation.phase(PARSE, time.time() - split, len(elements))
         return _list
 
+    def iter_elements(self, xml_raw):
+        """
+        Split raw xml into the XML elements of separate articles
+        :param xml_raw: raw xml format, or a file object of it such as a memory map from open_mapped
+        :return: generator of XML elements
+        """
+        if hasattr(xml_raw, "read"):
+            # parsed in chunks, without reading the whole file into one string first
+            root = self.etree.parse(xml_raw).getroot()
+        else:
+            if isinstance(xml_raw, unicode):
+                # encode in utf8 if raw xml is unicode
+                xml_raw = xml_raw.encode("utf8")
+            root = self.etree.fromstring(xml_raw)
+        elements = root.iter(self.element_names)
+        if self.skip_element_names:
+            elements = self._pruned(elements)
+        return elements
+
+    def _pruned(self, elements):
+        for element in elements:
+            for name in self.skip_element_names:
+                for skipped in list(element.iter(name)):
+                    _empty_element(skipped)
+            yield element
+
+    def iterparse_elements(self, source):
+        """
+        Split XML into the XML elements of separate articles while parsing it incrementally
+        :param source: file path or file object
+        :return: generator of XML elements
+        """
+        return iterparse_elements(source, self.element_names, self.etree, self.skip_element_names)
+
+    def iterparse_articles(self, source):
+        """
+        Streaming counterpart of parallelize_parse, the XML is parsed incrementally and articles are
+        yielded one at a time instead of being collected in a list
+        :param source: file path or file object
+        :return: generator of articles
+        """
+        for element in self.iterparse_elements(source):
+            yield self.to_article(element)
+
+
+_worker_mapper = None
+
+
+def _init_worker(mapper):
+    global _worker_mapper
+    _worker_mapper = mapper
+
+
+def _transform_chunk(xml_articles):
+    """
+    Map a chunk of serialized articles in a worker process
+    :param xml_articles: list of serialized XML elements
+    :return: tuple of the piano dictionaries, the exception that stopped the chunk, if any, and the seconds spent
+             parsing and mapping the articles
+    """
+    pianos = []
+    parse_seconds = map_seconds = 0.0
+    try:
+        for xml_article in xml_articles:
+            started = time.time()
+            article = _worker_mapper.article_from_string(xml_article)
+            parsed = time.time()
+            pianos.append(_worker_mapper.transform_to_piano(article))
+            parse_seconds += parsed - started
+            map_seconds += time.time() - parsed
+    except Exception, e:
+        return pianos, e, (parse_seconds, map_seconds)
+    return pianos, None, (parse_seconds, map_seconds)
+
+
+def _chunks(iterable, chunk_size):
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, chunk_size))
+
 
 class XmlToJson:
 
     mapper = None
     dao = None
+    # status of the last xml_to_json import, with the error and the number of the article that failed, if any
+    result = None
+    # exception of the article that stopped the last transform, if any
+    error = None
 
-    def __init__(self, mapper):
+    def __init__(self, mapper, processes=1, chunk_size=100, instrumentation=None, cache=None):
+        """
+        :param mapper: Mapper used to split and transform the articles
+        :param processes: (optional) number of worker processes mapping articles, 1 maps in this process
+        :param chunk_size: (optional) number of articles sent to a worker process at a time
+        :param instrumentation: (optional) Instrumentation receiving the progress, counts and phase timings of the
+                                imports, such as Metrics or StderrProgress. Imports report nothing without one
+        :param cache: (optional) PianoCache of the Piano dictionaries of previous imports, articles whose serialized
+                      XML has not changed since are taken from it instead of being mapped
+        """
         self.mapper = mapper
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.instrumentation = instrumentation
+        self.cache = cache
 
     def xml_to_json(self, xml_content):
-        sys.stderr.write("Start Import %s\n" % datetime.datetime.now())
-
-        list_of_references = self.mapper.transform_raw(xml_content)
-        ids = []
-        len_list = len(list_of_references)
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            instrumentation.import_started()
+        self.error = None
+
+        if self.cache is not None:
+            started = time.time()
+            elements = list(self.mapper.iter_elements(xml_content))
+            if instrumentation is not None:
+                instrumentation.phase(SPLIT, time.time() - started, len(elements))
+            if not elements:
+                raise ValueError('Could not find any articles')
+            xml_articles = elements
+        elif self.processes > 1:
+            started = time.time()
+            xml_articles = [self.mapper.etree.tostring(element) for element in self.mapper.iter_elements(xml_content)]
+            if instrumentation is not None:
+                instrumentation.phase(SPLIT, time.time() - started, len(xml_articles))
+            if not xml_articles:
+                raise ValueError('Could not find any articles')
+        else:
+            xml_articles = [xml_article for xml_article, id_dict
+                            in self.mapper.transform_raw(xml_content, instrumentation)]
+        len_list = len(xml_articles)
 
         result = {"number": len_list}
 
         articles = []
 
-        sys.stderr.write("Processing %s number of records %s\n" % (len_list, datetime.datetime.now()))
-        try:
-            for idx, (xml_article, id_dict) in enumerate(list_of_references):
-                sys.stderr.write("Processing: %d/%d\n" % (idx + 1, len_list))
+        if self.cache is not None:
+            pianos = self.transform_cached(xml_articles)
+        else:
+            pianos = self.transform_articles(xml_articles, serialized=self.processes > 1)
 
-                piano = self.mapper.transform_to_piano(xml_article)
+        if instrumentation is not None:
+            instrumentation.articles_found(len_list)
+        try:
+            for idx, piano in enumerate(pianos):
                 articles.append(piano)
 
+                if instrumentation is not None:
+                    instrumentation.articles_done(idx + 1)
+
         except Exception, e:
+            self.error = e
+
+        if self.error is not None:
             result["status"] = 'failed'
-            result["error"] = str(e)
-            result["error_number"] = len(ids) + 1
-            print(str(e))
+            result["error"] = str(self.error)
+            result["error_number"] = len(articles) + 1
         else:
             result["status"] = 'successful'
+        self.result = result
 
-        sys.stderr.write("End Import %s\n" % datetime.datetime.now())
+        if instrumentation is not None:
+            instrumentation.import_finished(len(articles), self.error)
 
         return articles
+
+    def xml_file_to_json(self, path):
+        """
+        Counterpart of xml_to_json for XML files, the file is parsed from a memory map, or decompressed while
+        parsing if it is gzip compressed, instead of from a string
+        :param path: file path
+        :return: list of piano dictionaries
+        """
+        with closing(open_xml(path, mapped=True)) as xml_file:
+            return self.xml_to_json(xml_file)
+
+    def xml_to_json_iter(self, xml_source, checkpoint=None, key=None):
+        """
+        Streaming counterpart of xml_to_json, articles are parsed incrementally and each piano
+        dictionary is yielded as soon as it has been mapped
+        An article that fails to map stops the import: the generator raises its error, which is also kept as
+        self.error, after the dictionaries of the articles before it
+        With a checkpoint, an article is recorded once the consumer asks for the next one, so an article being
+        processed when the import is interrupted is emitted again by the next run, and the articles recorded by
+        a previous run are skipped without being mapped
+        :param xml_source: file path or file object
+        :param checkpoint: (optional) Checkpoint recording the articles emitted
+        :param key: (optional) key of the input in the checkpoint, the file path by default
+        :return: generator of piano dictionaries
+        :raises Exception: the error of the article that failed to map, if any
+        """
+        if key is None and isinstance(xml_source, basestring):
+            key = xml_source
+        if checkpoint is not None and key is None:
+            raise ValueError('A key is required to checkpoint a file object')
+
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            instrumentation.import_started()
+
+        elements = self.mapper.iterparse_elements(xml_source)
+        if instrumentation is not None:
+            elements = self._timed_split(elements)
+        offset = 0
+        element_ids = deque()
+        if checkpoint is not None:
+            state = checkpoint.get(key)
+            if state:
+                offset = state["offset"]
+                elements = self._skip_elements(elements, offset, state["id"])
+            elements = self._record_ids(elements, element_ids)
+
+        if self.cache is not None:
+            pianos = self.transform_cached(elements)
+        else:
+            if self.processes > 1:
+                xml_articles = (self.mapper.etree.tostring(element) for element in elements)
+            elif instrumentation is not None:
+                xml_articles = self._timed_parse(elements)
+            else:
+                xml_articles = (self.mapper.to_article(element) for element in elements)
+            pianos = self.transform_articles(xml_articles, serialized=self.processes > 1)
+
+        count = 0
+        try:
+            for idx, piano in enumerate(pianos):
+                count = idx + 1
+                if instrumentation is not None:
+                    instrumentation.articles_done(offset + count)
+
+                yield piano
+
+                if checkpoint is not None:
+                    # the consumer is done with the article
+                    checkpoint.update(key, offset + idx + 1, element_ids.popleft())
+        finally:
+            if checkpoint is not None:
+                checkpoint.save()
+
+        if instrumentation is not None:
+            instrumentation.import_finished(offset + count, self.error)
+        if self.error is not None:
+            raise self.error
+
+    def _timed_split(self, elements):
+        """
+        Report the time spent reading each element from the incremental parser
+        """
+        iterator = iter(elements)
+        while True:
+            started = time.time()
+            try:
+                element = next(iterator)
+            except StopIteration:
+                return
+            self.instrumentation.phase(SPLIT, time.time() - started)
+            yield element
+
+    def _timed_parse(self, elements):
+        """
+        Report the time spent converting each element into the form expected by transform_to_piano
+        """
+        for element in elements:
+            started = time.time()
+            article = self.mapper.to_article(element)
+            self.instrumentation.phase(PARSE, time.time() - started)
+            yield article
+
+    def _skip_elements(self, elements, offset, element_id):
+        """
+        Skip the elements emitted by a previous run, checking the last one is the article it recorded
+        :param elements: iterable of XML elements
+        :param offset: number of elements to skip
+        :param element_id: identifier of the last element to skip
+        :return: generator of the remaining XML elements
+        """
+        for idx, element in enumerate(elements):
+            if idx < offset - 1:
+                continue
+            if idx == offset - 1:
+                skipped_id = self.mapper.element_id(element)
+                if skipped_id != element_id:
+                    raise ValueError('Checkpoint does not match the input, article %d is %s instead of %s'
+                                     % (offset, skipped_id, element_id))
+                continue
+            yield element
+
+    def _record_ids(self, elements, element_ids):
+        for element in elements:
+            element_ids.append(self.mapper.element_id(element))
+            yield element
+
+    def transform_articles(self, xml_articles, serialized=False):
+        """
+        Transform articles to piano dictionaries, preserving their order. When processes > 1 the
+        articles are sent in chunks to a pool of worker processes. Stops at the first article that
+        fails to transform, which is then kept as error
+        :param xml_articles: iterable of articles
+        :param serialized: whether the articles are serialized XML elements rather than parsed articles
+        :return: generator of piano dictionaries
+        """
+        if self.processes > 1:
+            if not serialized:
+                raise ValueError('Articles must be serialized to be sent to worker processes')
+            results = self._transform_in_pool(xml_articles)
+        else:
+            results = self._transform_in_process(xml_articles, serialized)
+
+        instrumentation = self.instrumentation
+        self.error = None
+        try:
+            for pianos, error, (parse_seconds, map_seconds) in results:
+                if instrumentation is not None:
+                    if serialized:
+                        instrumentation.phase(PARSE, parse_seconds, len(pianos))
+                    instrumentation.phase(MAP, map_seconds, len(pianos))
+                for piano in pianos:
+                    yield piano
+                if error is not None:
+                    self.error = error
+                    return
+        finally:
+            results.close()
+
+    def transform_cached(self, elements):
+        """
+        Transform XML elements to piano dictionaries like transform_articles, taking the dictionaries of the
+        elements whose serialized XML is in the cache from it and caching the dictionaries of the others
+        The cached dictionaries stay in this process and are merged back by position with the dictionaries of the
+        elements mapped, in this process or in worker processes
+        :param elements: iterable of XML elements
+        :return: generator of piano dictionaries
+        """
+        cache = self.cache
+        mapper = self.mapper
+        instrumentation = self.instrumentation
+        namespace = mapper.cache_namespace()
+        pool = multiprocessing.Pool(self.processes, _init_worker, (mapper,)) if self.processes > 1 else None
+        # elements read but not emitted yet, in input order: the cached piano dictionaries, and the (id, digest)
+        # keys of the elements being mapped
+        entries = deque()
+        # results of the chunks sent to the worker processes, the chunk of serialized elements filled next, and the
+        # piano dictionaries mapped but not emitted yet
+        results = deque()
+        chunk = []
+        mapped = deque()
+        # elements read ahead of the ones emitted before waiting for the worker processes
+        read_ahead = 2 * self.processes * self.chunk_size
+        elements = iter(elements)
+        done = False
+        error = self.error = None
+        try:
+            while not done and error is None:
+                element = next(elements, None)
+                done = element is None
+                if not done:
+                    digest = mapper.content_digest(element)
+                    element_id = mapper.element_id(element)
+                    if element_id is None:
+                        element_id = digest
+                    piano = cache.get(namespace, element_id, digest)
+                    if piano is not None:
+                        entries.append(piano)
+                    elif pool is not None:
+                        entries.append((element_id, digest))
+                        chunk.append(mapper.etree.tostring(element))
+                        if len(chunk) >= self.chunk_size:
+                            results.append(pool.apply_async(_transform_chunk, (chunk,)))
+                            chunk = []
+                    else:
+                        entries.append((element_id, digest))
+                        started = time.time()
+                        article = mapper.to_article(element)
+                        if instrumentation is not None:
+                            instrumentation.phase(PARSE, time.time() - started)
+                        error = self._received(next(self._transform_in_process([article], False)), mapped, False)
+
+                # emit the entries whose dictionaries are known, waiting for the worker processes once the input is
+                # read or too far ahead
+                wait = done or len(entries) >= read_ahead
+                while entries:
+                    if type(entries[0]) is not tuple:
+                        yield entries.popleft()
+                        continue
+                    if not mapped:
+                        if error is not None:
+                            # the element that failed, the ones after it are not emitted
+                            break
+                        if wait and not results and chunk:
+                            results.append(pool.apply_async(_transform_chunk, (chunk,)))
+                            chunk = []
+                        if not results or not (wait or results[0].ready()):
+                            break
+                        error = self._received(results.popleft().get(), mapped, True)
+                        continue
+                    element_id, digest = entries.popleft()
+                    piano = mapped.popleft()
+                    cache.put(namespace, element_id, digest, piano)
+                    yield piano
+
+            self.error = error
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            cache.flush()
+
+    def _received(self, result, mapped, serialized):
+        """
+        Take the piano dictionaries of mapped articles and report the time spent on them
+        :param result: tuple of the piano dictionaries, the exception that stopped the mapping, if any, and the seconds
+                       spent parsing and mapping the articles
+        :param mapped: deque the piano dictionaries are added to
+        :param serialized: whether the articles were parsed from serialized XML elements
+        :return: the exception that stopped the mapping, None if there is none
+        """
+        pianos, error, (parse_seconds, map_seconds) = result
+        if self.instrumentation is not None:
+            if serialized:
+                self.instrumentation.phase(PARSE, parse_seconds, len(pianos))
+            self.instrumentation.phase(MAP, map_seconds, len(pianos))
+        mapped.extend(pianos)
+        return error
+
+    def _transform_in_process(self, xml_articles, serialized):
+        for xml_article in xml_articles:
+            started = time.time()
+            try:
+                if serialized:
+                    xml_article = self.mapper.article_from_string(xml_article)
+                parsed = time.time()
+                piano = self.mapper.transform_to_piano(xml_article)
+            except Exception, e:
+                yield [], e, (0.0, 0.0)
+                return
+            yield [piano], None, (parsed - started, time.time() - parsed)
+
+    def _transform_in_pool(self, xml_articles):
+        pool = multiprocessing.Pool(self.processes, _init_worker, (self.mapper,))
+        try:
+            # keep a bounded number of chunks in flight so input is consumed at the pace of the workers
+            pending = deque()
+            for chunk in _chunks(xml_articles, self.chunk_size):
+                pending.append(pool.apply_async(_transform_chunk, (chunk,)))
+                if len(pending) >= 2 * self.processes:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+        finally:
+            pool.terminate()
+            pool.join()
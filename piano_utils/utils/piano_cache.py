@@ -0,0 +1,114 @@
+import json
+import sqlite3
+
+
+class PianoCache(object):
+    """
+    Persistent cache of mapped Piano dictionaries, kept in a SQLite file, so articles that have not changed since a
+    previous import, such as the articles PubMed update files ship again, are not mapped again
+    Entries are keyed by the namespace of the mapper and the identifier of the article (e.g. its PMID), and are only
+    used if the hash of the serialized article matches, so a changed article is mapped again and replaces its entry
+    Writes are committed every commit_interval writes and on flush. Beyond max_entries, the least recently used
+    entries are evicted when committing
+    """
+
+    def __init__(self, path, max_entries=1000000, commit_interval=1000):
+        """
+        :param path: file path of the SQLite database, created if it does not exist
+        :param max_entries: (optional) number of entries kept
+        :param commit_interval: (optional) number of writes after which they are committed
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.commit_interval = commit_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._connection = sqlite3.connect(path)
+        self._connection.text_factory = str
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS pianos (namespace TEXT NOT NULL, id TEXT NOT NULL, digest TEXT NOT NULL, "
+            "piano TEXT NOT NULL, used INTEGER NOT NULL, PRIMARY KEY (namespace, id))")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS pianos_used ON pianos (used)")
+        # the last use of the entries is a counter, advanced on every lookup and write
+        self._clock = self._connection.execute("SELECT MAX(used) FROM pianos").fetchone()[0] or 0
+        self._puts = []
+        self._uses = []
+
+    def __len__(self):
+        self.flush()
+        return self._connection.execute("SELECT COUNT(*) FROM pianos").fetchone()[0]
+
+    def get(self, namespace, element_id, digest):
+        """
+        :param namespace: namespace of the mapper, see Mapper.cache_namespace
+        :param element_id: identifier of the article
+        :param digest: hash of the serialized article, see Mapper.content_digest
+        :return: the cached Piano dictionary of the article, None if there is none for this content
+        """
+        row = self._connection.execute("SELECT digest, piano FROM pianos WHERE namespace = ? AND id = ?",
+                                       (namespace, element_id)).fetchone()
+        if row is None or row[0] != digest:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._clock += 1
+        self._uses.append((self._clock, namespace, element_id))
+        if len(self._uses) >= self.commit_interval:
+            self.flush()
+        return json.loads(row[1])
+
+    def put(self, namespace, element_id, digest, piano):
+        """
+        :param namespace: namespace of the mapper
+        :param element_id: identifier of the article
+        :param digest: hash of the serialized article
+        :param piano: Piano dictionary of the article
+        :return:
+        """
+        self._clock += 1
+        self._puts.append((namespace, element_id, digest, json.dumps(piano), self._clock))
+        if len(self._puts) >= self.commit_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Commit the pending writes and evict the least recently used entries beyond max_entries
+        :return:
+        """
+        if not self._puts and not self._uses:
+            return
+        with self._connection:
+            self._connection.executemany("UPDATE pianos SET used = ? WHERE namespace = ? AND id = ?", self._uses)
+            self._connection.executemany("INSERT OR REPLACE INTO pianos VALUES (?, ?, ?, ?, ?)", self._puts)
+            count = self._connection.execute("SELECT COUNT(*) FROM pianos").fetchone()[0]
+            if count > self.max_entries:
+                self._connection.execute(
+                    "DELETE FROM pianos WHERE rowid IN (SELECT rowid FROM pianos ORDER BY used LIMIT ?)",
+                    (count - self.max_entries,))
+                self.evictions += count - self.max_entries
+        self._puts = []
+        self._uses = []
+
+    def clear(self):
+        """
+        Remove all entries, e.g. after the mapping has changed
+        :return:
+        """
+        self._puts = []
+        self._uses = []
+        with self._connection:
+            self._connection.execute("DELETE FROM pianos")
+
+    def close(self):
+        self.flush()
+        self._connection.close()
+
+    def stats(self):
+        """
+        :return: dictionary of the numbers of hits, misses and evictions
+        """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_rate": float(self.hits) / lookups if lookups else 0.0}
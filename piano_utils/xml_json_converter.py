@@ -1,28 +1,194 @@
 import json
 import xml.etree.ElementTree as Et
+from contextlib import closing
+from xml.sax.saxutils import XMLGenerator
 import xmltodict
-from piano_utils.utils.flatten_json import flatten, unflatten_list
+from piano_utils.utils.flatten_json import flatten, unflatten_list, KeyPathCache, path_filter
+from piano_utils.utils.parse_xml import iterparse_elements, open_xml
 
 
-def xml_to_json(xml_string, element_name=None):
+def xml_to_json(xml_string, element_name=None, include=None, exclude=None):
     """
     Converts an XML string to a flattened JSON structure
-    :param xml_string: XML string to flatten into JSON
+    :param xml_string: XML string, or file object, to flatten into JSON
     :param element_name: (optional) XML element name from which the child elements are converted
+    :param include: (optional) key paths to convert, see flatten, e.g. ["MedlineCitation"]
+    :param exclude: (optional) key paths left out, e.g. ["PubmedData_ReferenceList"]. With element_name, the XML
+                    elements of the paths left out are removed before the elements are converted by xmltodict
     :return: JSON
     """
     json_list = []
     if element_name:
-        root = Et.fromstring(xml_string)
+        root = Et.parse(xml_string).getroot() if hasattr(xml_string, "read") else Et.fromstring(xml_string)
         for element in root.iter(element_name):
-            xml_dict = xmltodict.parse(Et.tostring(element))
-            json_list.append(flatten(xml_dict.get(element_name, {})))
+            json_list.append(_flatten_element(element, element_name, include, exclude))
     else:
-        json_list.append(flatten(xmltodict.parse(xml_string)))
+        json_list.append(flatten(xmltodict.parse(xml_string), include=include, exclude=exclude))
 
     return json.dumps(json_list)
 
 
+def _flatten_element(element, element_name, include=None, exclude=None):
+    """
+    :param element: XML element
+    :param element_name: name of the element
+    :param include: (optional) key paths to convert
+    :param exclude: (optional) key paths left out
+    :return: flattened dictionary of the content of the element
+    """
+    if include is not None or exclude is not None:
+        node = path_filter(include, exclude).root
+        if not node.unfiltered:
+            _prune_element(element, node)
+    xml_dict = xmltodict.parse(Et.tostring(element))
+    return flatten(xml_dict.get(element_name) or {}, include=include, exclude=exclude)
+
+
+def _prune_element(element, node):
+    """
+    Empties the child elements of the key paths flatten leaves out, so their content is neither serialized nor
+    converted by xmltodict. The emptied elements are kept, so the elements around them keep their shape, and are left
+    out by flatten, which applies the filter exactly
+    :param element: XML element
+    :param node: PathFilter node of the keys of the element
+    :return:
+    """
+    counts = {}
+    for child in element:
+        counts[child.tag] = counts.get(child.tag, 0) + 1
+
+    for child in element:
+        tag = child.tag
+        if not isinstance(tag, basestring) or tag.startswith(("{", "@", "#")):
+            # comments, processing instructions and namespaced tags are not keyed by their tag, nor told apart
+            # from attributes and text when named like them
+            continue
+
+        child_node = node.children.get(tag)
+        if child_node is None:
+            prune = not node.included
+        elif child_node.excluded:
+            prune = True
+        elif counts[tag] > 1:
+            # repeated elements are a list in xmltodict, whose items are matched by the wildcard
+            child_node = child_node.children.get(child_node.wildcard)
+            prune = child_node.excluded if child_node is not None else not node.children[tag].included
+        elif child_node.single is not None:
+            # a single element is not a list in xmltodict, the wildcard matches nothing
+            child_node = child_node.single
+            prune = child_node.excluded
+        else:
+            prune = False
+
+        if prune:
+            tail = child.tail
+            child.clear()
+            child.tail = tail
+        elif child_node is not None and not child_node.unfiltered:
+            _prune_element(child, child_node)
+
+
+def xml_file_to_json(path, element_name=None, include=None, exclude=None):
+    """
+    Converts an XML file to a flattened JSON structure, parsing it from a memory map, or decompressing it while
+    parsing if it is gzip compressed, instead of from a string
+    :param path: file path of the XML, or gzip compressed XML, to flatten into JSON
+    :param element_name: (optional) XML element name from which the child elements are converted
+    :param include: (optional) key paths to convert, see xml_to_json
+    :param exclude: (optional) key paths left out, see xml_to_json
+    :return: JSON
+    """
+    with closing(open_xml(path, mapped=True)) as xml_file:
+        return xml_to_json(xml_file, element_name, include, exclude)
+
+
+def iter_flattened(source, element_name=None, include=None, exclude=None):
+    """
+    Parses XML incrementally and yields the flattened dictionary of each element as soon as it has been read
+    :param source: file path or file object of the XML
+    :param element_name: (optional) XML element name from which the child elements are converted
+    :param include: (optional) key paths to convert, see xml_to_json
+    :param exclude: (optional) key paths left out, see xml_to_json
+    :return: generator of flattened dictionaries
+    """
+    if element_name:
+        for element in iterparse_elements(source, element_name):
+            yield _flatten_element(element, element_name, include, exclude)
+    elif isinstance(source, basestring):
+        with closing(open_xml(source)) as f:
+            yield flatten(xmltodict.parse(f), include=include, exclude=exclude)
+    else:
+        yield flatten(xmltodict.parse(source), include=include, exclude=exclude)
+
+
+def xml_to_json_stream(input_stream, output_stream, element_name=None, include=None, exclude=None):
+    """
+    Converts XML to flattened JSON Lines, writing one flattened element per line as soon as it has been read
+    :param input_stream: file path or file object of the XML
+    :param output_stream: file object the JSON Lines are written to
+    :param element_name: (optional) XML element name from which the child elements are converted
+    :param include: (optional) key paths to convert, see xml_to_json
+    :param exclude: (optional) key paths left out, see xml_to_json
+    :return: number of lines written
+    """
+    count = 0
+    for flattened in iter_flattened(input_stream, element_name, include, exclude):
+        output_stream.write(json.dumps(flattened))
+        output_stream.write("\n")
+        count += 1
+    return count
+
+
+def json_to_element(json_dict, element_name, etree=Et):
+    """
+    Builds the XML element that xmltodict would serialize an unflattened JSON dictionary to, without
+    serializing and re-parsing it. Text follows the child elements, as it does in the serialized XML
+    :param json_dict: unflattened JSON dictionary
+    :param element_name: name of the element
+    :param etree: (optional) ElementTree implementation used to build the element
+    :return: XML element
+    """
+    root = etree.Element("root")
+    _append_json_elements(root, element_name, json_dict, etree)
+    element = root[0]
+    root.remove(element)
+    return element
+
+
+def _append_json_elements(parent, name, value, etree):
+    if not isinstance(value, list):
+        value = [value]
+    for v in value:
+        if v is None:
+            v = {}
+        elif isinstance(v, bool):
+            v = u"true" if v else u"false"
+        elif not isinstance(v, dict):
+            v = unicode(v)
+        if isinstance(v, basestring):
+            v = {"#text": v}
+
+        element = etree.SubElement(parent, name)
+        text = None
+        for child_name, child_value in v.items():
+            if child_name == "#text":
+                text = child_value
+            elif child_name.startswith("@"):
+                element.set(child_name[1:], child_value if isinstance(child_value, unicode) else unicode(child_value))
+            else:
+                _append_json_elements(element, child_name, child_value, etree)
+
+        if text is not None:
+            text = text if isinstance(text, basestring) else unicode(text)
+            if "\r" in text:
+                # line endings are normalized when serialized XML is parsed
+                text = text.replace("\r\n", "\n").replace("\r", "\n")
+            if len(element):
+                element[-1].tail = text
+            else:
+                element.text = text
+
+
 def json_to_xml(json_string, root_name=None, element_name=None):
     """
     Converts a JSON string to an XML string
@@ -34,9 +200,11 @@ def json_to_xml(json_string, root_name=None, element_name=None):
     json_value = json.loads(json_string)
     if isinstance(json_value, list):
         if len(json_value) > 1:
+            # the records usually share most of their keys, which are then only split once
+            key_cache = KeyPathCache()
             json_dicts = []
             for json_string in json_value:
-                json_dicts.append(unflatten_list(json_string))
+                json_dicts.append(unflatten_list(json_string, key_cache=key_cache))
 
             json_value = json_dicts
             if element_name:
@@ -54,3 +222,39 @@ def json_to_xml(json_string, root_name=None, element_name=None):
         if root_name:
             json_value = {root_name: json_value}
         return xmltodict.unparse(json_value)
+
+
+def json_to_xml_stream(input_stream, output_stream, root_name, element_name=None):
+    """
+    Converts flattened JSON Lines to XML, writing each element as soon as its line has been read, so only one
+    element is held in memory at a time
+    :param input_stream: file path or file object of the JSON Lines, e.g. as written by xml_to_json_stream
+    :param output_stream: file object the XML is written to
+    :param root_name: root element name in the XML
+    :param element_name: (optional) element name of children
+    :return: number of elements written
+    """
+    if isinstance(input_stream, basestring):
+        with open(input_stream, "rb") as f:
+            return json_to_xml_stream(f, output_stream, root_name, element_name)
+
+    # the same XML declaration and encoding as xmltodict.unparse
+    generator = XMLGenerator(output_stream, "utf-8")
+    generator.startDocument()
+    generator.startElement(root_name, {})
+
+    # the lines usually share most of their keys, which are then only split once
+    key_cache = KeyPathCache()
+    count = 0
+    for line in input_stream:
+        if not line.strip():
+            continue
+        json_value = unflatten_list(json.loads(line), key_cache=key_cache)
+        if element_name:
+            json_value = {element_name: json_value}
+        xmltodict.unparse(json_value, output=output_stream, encoding="utf-8", full_document=False)
+        count += 1
+
+    generator.endElement(root_name)
+    generator.endDocument()
+    return count
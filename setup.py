@@ -15,4 +15,11 @@ setup(
     keywords=['piano', 'util', 'xml', 'json'],
     classifiers=[],
     install_requires=requirements,
+    entry_points={
+        'console_scripts': ['piano-batch-convert=piano_utils.batch_converter:main'],
+    },
+    extras_require={
+        'numpy': ['numpy'],
+        'parquet': ['pyarrow'],
+    },
 )
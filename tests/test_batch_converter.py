@@ -0,0 +1,129 @@
+import os
+import gzip
+import json
+import shutil
+import tempfile
+from contextlib import closing
+from unittest import TestCase
+from piano_utils.batch_converter import input_paths, output_path, convert_files, main, SETTINGS_FILE
+from piano_utils.pubmed_converter import pubmed_xml_to_json, pubmed_xml_to_piano
+
+
+class TestBatchConverter(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        create/setup test data
+        :return:
+        """
+        tests_dir = os.path.dirname(__file__)
+        cls.pubmed_xmls = [open(os.path.join(tests_dir, name)).read() for name in (
+            'single_pubmed_xml_article.xml', 'multiple_pubmed_xml_articles.xml')]
+
+    def setUp(self):
+        """
+        write the pubmed xml files to convert, one of them gzip compressed
+        :return:
+        """
+        self.directory = tempfile.mkdtemp()
+        self.input_dir = os.path.join(self.directory, "baseline")
+        self.output_dir = os.path.join(self.directory, "output")
+        os.makedirs(self.input_dir)
+        with open(os.path.join(self.input_dir, "pubmed0001.xml"), "wb") as f:
+            f.write(self.pubmed_xmls[0])
+        with closing(gzip.open(os.path.join(self.input_dir, "pubmed0002.xml.gz"), "wb")) as f:
+            f.write(self.pubmed_xmls[1])
+        with open(os.path.join(self.input_dir, "README.txt"), "wb") as f:
+            f.write("not xml")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read_lines(self, name):
+        with open(os.path.join(self.output_dir, name)) as f:
+            return [json.loads(line) for line in f]
+
+    def test_input_paths(self):
+        """
+        test directories and glob patterns are expanded into the xml files
+        :return:
+        """
+        paths = [os.path.join(self.input_dir, name) for name in ("pubmed0001.xml", "pubmed0002.xml.gz")]
+        self.assertEquals(paths, input_paths([self.input_dir]))
+        self.assertEquals(paths[1:], input_paths([os.path.join(self.input_dir, "*.gz"), paths[1]]))
+        self.assertEquals(os.path.join("out", "pubmed0002.jsonl"), output_path(paths[1], "out"))
+
+    def test_convert_files(self):
+        """
+        test conversion of pubmed xml files into json lines files, in worker processes
+        :return:
+        """
+        converted, failed = convert_files(input_paths([self.input_dir]), self.output_dir, processes=2)
+
+        self.assertEquals({}, failed)
+        self.assertEquals([1, 3], [count for path, count in sorted(converted.items())])
+        for idx, name in enumerate(("pubmed0001.jsonl", "pubmed0002.jsonl")):
+            self.assertEquals(json.loads(json.dumps(pubmed_xml_to_piano(self.pubmed_xmls[idx]))), self.read_lines(name))
+
+    def test_convert_files__with_json_format_and_resume(self):
+        """
+        test conversion into flattened json skips the files converted by a previous run
+        :return:
+        """
+        paths = input_paths([self.input_dir])
+        convert_files(paths[:1], self.output_dir, output_format="json", processes=1)
+        converted, failed = convert_files(paths, self.output_dir, output_format="json", processes=1)
+
+        self.assertEquals({paths[1]: 3}, converted)
+        self.assertEquals(json.loads(pubmed_xml_to_json(self.pubmed_xmls[1])), self.read_lines("pubmed0002.jsonl"))
+
+    def test_convert_files__resume_with_other_settings(self):
+        """
+        test a conversion is not resumed over files converted with another format or other fields, and fields are
+        refused with the json format
+        :return:
+        """
+        paths = input_paths([self.input_dir])
+        convert_files(paths[:1], self.output_dir, processes=1)
+
+        for options in ({"output_format": "json"}, {"fields": ["pmid"]}, {"engine": "soup"}):
+            self.assertRaises(ValueError, convert_files, paths, self.output_dir, processes=1, **options)
+        self.assertEquals(["piano-batch-convert.json", "pubmed0001.jsonl"], sorted(os.listdir(self.output_dir)))
+
+        converted, failed = convert_files(paths, self.output_dir, processes=1, resume=False, fields=["pmid"])
+        self.assertEquals([1, 3], [count for path, count in sorted(converted.items())])
+        self.assertEquals([{"pmid": piano["pmid"]} for piano in pubmed_xml_to_piano(self.pubmed_xmls[0])],
+                          self.read_lines("pubmed0001.jsonl"))
+        self.assertEquals({}, convert_files(paths, self.output_dir, processes=1, fields=["pmid"])[0])
+
+        os.remove(os.path.join(self.output_dir, SETTINGS_FILE))
+        self.assertRaises(ValueError, convert_files, paths, self.output_dir, processes=1, fields=["pmid"])
+        self.assertRaises(ValueError, convert_files, paths, self.output_dir, output_format="json", fields=["pmid"])
+
+    def test_main__with_failed_file(self):
+        """
+        test the command line returns an error status and leaves no output for a file that fails to convert
+        :return:
+        """
+        with open(os.path.join(self.input_dir, "pubmed0003.xml"), "wb") as f:
+            f.write("<PubmedArticleSet><PubmedArticle>")
+
+        self.assertEquals(1, main([self.input_dir, "-o", self.output_dir, "-p", "1"]))
+        self.assertEquals(["piano-batch-convert.json", "pubmed0001.jsonl", "pubmed0002.jsonl"],
+                          sorted(os.listdir(self.output_dir)))
+
+    def test_convert_files__with_colliding_outputs(self):
+        """
+        test files that would be converted to the same output are refused before any is converted
+        :return:
+        """
+        other_dir = os.path.join(self.directory, "other")
+        os.makedirs(other_dir)
+        shutil.copy(os.path.join(self.input_dir, "pubmed0001.xml"), other_dir)
+        with open(os.path.join(self.input_dir, "pubmed0002.xml"), "wb") as f:
+            f.write(self.pubmed_xmls[1])
+
+        for inputs in ([self.input_dir], [os.path.join(self.input_dir, "pubmed0001.xml"), other_dir]):
+            self.assertRaises(ValueError, convert_files, input_paths(inputs), self.output_dir, processes=1)
+            self.assertFalse(os.path.exists(self.output_dir))
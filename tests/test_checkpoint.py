@@ -0,0 +1,100 @@
+import os
+import shutil
+import sys
+import tempfile
+from StringIO import StringIO
+from unittest import TestCase
+from piano_utils.pubmed_converter import pubmed_xml_to_piano, pubmed_xml_to_piano_iter, PubMedLxmlMapper
+from piano_utils.utils.checkpoint import Checkpoint
+from piano_utils.utils.instrumentation import Metrics
+from piano_utils.utils.parse_xml import XmlToJson
+
+
+class FailingMapper(PubMedLxmlMapper):
+
+    failing_id = None
+
+    def transform_to_piano(self, xml_soup_element):
+        if self.element_id(xml_soup_element) == self.failing_id:
+            raise ValueError("cannot map")
+        return super(FailingMapper, self).transform_to_piano(xml_soup_element)
+
+
+class TestCheckpoint(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        create/setup test data
+        :return:
+        """
+        cls.pubmed_xml_path = os.path.join(os.path.dirname(__file__), 'multiple_pubmed_xml_articles.xml')
+        cls.pubmed_xml = open(cls.pubmed_xml_path).read()
+        cls.expected = pubmed_xml_to_piano(cls.pubmed_xml)
+        FailingMapper.failing_id = cls.expected[1]["pmid"]
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.checkpoint_path = os.path.join(self.directory, "checkpoint.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_xml_to_json_iter__resumes_after_checkpoint(self):
+        """
+        test a restarted import skips the articles processed before it was interrupted, the article taken last
+        may not have been processed and is emitted again
+        :return:
+        """
+        for processes in (1, 2):
+            piano_docs = XmlToJson(PubMedLxmlMapper(), processes).xml_to_json_iter(
+                self.pubmed_xml_path, Checkpoint(self.checkpoint_path))
+            self.assertEquals(self.expected[:2], [next(piano_docs), next(piano_docs)])
+            piano_docs.close()
+
+            checkpoint = Checkpoint(self.checkpoint_path)
+            self.assertEquals({"offset": 1, "id": self.expected[0]["pmid"]}, checkpoint.get(self.pubmed_xml_path))
+            self.assertEquals(self.expected[1:],
+                              list(pubmed_xml_to_piano_iter(self.pubmed_xml_path, "lxml", checkpoint=checkpoint)))
+            self.assertEquals(3, Checkpoint(self.checkpoint_path).get(self.pubmed_xml_path)["offset"])
+
+            checkpoint.clear(self.pubmed_xml_path)
+            self.assertEquals(None, Checkpoint(self.checkpoint_path).get(self.pubmed_xml_path))
+
+    def test_xml_to_json_iter__with_checkpoint_of_other_input(self):
+        """
+        test a checkpoint that does not match the input is rejected
+        :return:
+        """
+        checkpoint = Checkpoint(self.checkpoint_path)
+        checkpoint.update(self.pubmed_xml_path, 2, "1")
+
+        piano_docs = XmlToJson(PubMedLxmlMapper()).xml_to_json_iter(self.pubmed_xml_path, checkpoint)
+        self.assertRaises(ValueError, list, piano_docs)
+
+    def test_xml_to_json_iter__stops_at_failed_article(self):
+        """
+        test the checkpoint and the result of an import stopped by an article that fails to map
+        :return:
+        """
+        for processes in (1, 2):
+            parser = XmlToJson(FailingMapper(), processes)
+            checkpoint = Checkpoint(self.checkpoint_path)
+            checkpoint.clear(self.pubmed_xml_path)
+
+            piano_docs = parser.xml_to_json_iter(self.pubmed_xml_path, checkpoint)
+            self.assertEquals(self.expected[0], next(piano_docs))
+            self.assertRaisesRegexp(ValueError, "cannot map", next, piano_docs)
+            self.assertEquals(1, Checkpoint(self.checkpoint_path).get(self.pubmed_xml_path)["offset"])
+            self.assertEquals("cannot map", str(parser.error))
+
+        metrics = Metrics()
+        parser = XmlToJson(FailingMapper(), instrumentation=metrics)
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            self.assertEquals(self.expected[:1], parser.xml_to_json(self.pubmed_xml))
+            self.assertEquals("", sys.stdout.getvalue())
+        finally:
+            sys.stdout = stdout
+        self.assertEquals({"number": 3, "status": "failed", "error": "cannot map", "error_number": 2}, parser.result)
+        self.assertEquals(1, metrics.errors)
@@ -0,0 +1,86 @@
+import os
+import json
+import shutil
+import tempfile
+from unittest import TestCase, skipIf
+from piano_utils.columnar_converter import ColumnUnion, iter_columns, write_parquet, numpy, pyarrow
+from piano_utils.pubmed_converter import pubmed_xml_to_json, pubmed_xml_to_columns
+
+
+class TestColumnarConverter(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        create/setup test data
+        :return:
+        """
+        cls.records = [{"a": u"1", "b": u"2"}, {"c": u"3", "a": u"4"}, {"b": None}]
+        cls.pubmed_xml_path = os.path.join(os.path.dirname(__file__), 'multiple_pubmed_xml_articles.xml')
+
+    def test_iter_columns(self):
+        """
+        test conversion of records into batches of columns with a stable column union
+        :return:
+        """
+        batches = list(iter_columns(self.records, batch_size=2))
+
+        names, data = batches[0]
+        self.assertEquals(["a", "b", "c"], sorted(names))
+        self.assertEquals([[u"1", u"4"], [u"2", None], [None, u"3"]],
+                          [data[names.index(name)] for name in ("a", "b", "c")])
+
+        # later batches keep the columns of the first one first
+        self.assertEquals((names, [[None], [None], [None]]), (batches[1][0], batches[1][1]))
+
+    def test_iter_columns__with_column_union(self):
+        """
+        test conversion of records into columns after the columns of a previous export
+        :return:
+        """
+        names, data = next(iter_columns(self.records[:1], columns=ColumnUnion(["z", "a"])))
+        self.assertEquals(["z", "a", "b"], names)
+        self.assertEquals([[None], [u"1"], [u"2"]], data)
+
+    def test_pubmed_xml_to_columns(self):
+        """
+        test conversion from pubmed xml to columns
+        :return:
+        """
+        articles = json.loads(pubmed_xml_to_json(open(self.pubmed_xml_path).read()))
+
+        names, data = next(pubmed_xml_to_columns(self.pubmed_xml_path))
+        self.assertEquals(sorted(set(key for article in articles for key in article)), sorted(names))
+        for row, article in enumerate(articles):
+            self.assertEquals(article, dict((name, column[row]) for name, column in zip(names, data)
+                                            if column[row] is not None))
+
+    @skipIf(numpy is None, "numpy is not installed")
+    def test_iter_columns__with_numpy(self):
+        """
+        test conversion of records into numpy columns
+        :return:
+        """
+        names, data = next(iter_columns(self.records, backend="numpy"))
+        self.assertEquals([u"1", u"4", None], list(data[names.index("a")]))
+        self.assertEquals(object, data[0].dtype)
+
+    @skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_write_parquet(self):
+        """
+        test conversion of records into parquet files
+        :return:
+        """
+        directory = tempfile.mkdtemp()
+        try:
+            records = self.records + [{"d": 5}, {"d": u"x", "e": "y"}]
+            paths = write_parquet(records, directory, batch_size=3)
+            self.assertEquals(2, len(paths))
+
+            tables = [pyarrow.parquet.read_table(path) for path in paths]
+            self.assertEquals(["a", "b", "c"], sorted(tables[0].schema.names))
+            self.assertEquals([u"1", u"4", None], tables[0].column("a").to_pylist())
+            self.assertEquals([u"5", u"x"], tables[1].column("d").to_pylist())
+            self.assertEquals([None, u"y"], tables[1].column("e").to_pylist())
+        finally:
+            shutil.rmtree(directory)
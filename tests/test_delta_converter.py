@@ -0,0 +1,120 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from piano_utils.delta_converter import pubmed_xml_to_delta_iter, DeltaIndex, DeltaEvent, ADDED, CHANGED, DELETED
+from piano_utils.pubmed_converter import pubmed_xml_to_piano
+
+
+class TestDeltaConverter(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        create/setup test data
+        :return:
+        """
+        cls.pubmed_xml = open(os.path.join(os.path.dirname(__file__), 'multiple_pubmed_xml_articles.xml')).read()
+        cls.pianos = pubmed_xml_to_piano(cls.pubmed_xml, "lxml")
+        title = cls.pianos[0]["title"].encode("utf-8")
+        # update file revising the first article and deleting the third
+        cls.update_xml = cls.pubmed_xml.replace(title, "Revised title", 1).replace(
+            "</PubmedArticleSet>",
+            '<DeleteCitation><PMID Version="1">25870975</PMID><PMID Version="1">1</PMID></DeleteCitation>\n'
+            '</PubmedArticleSet>')
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.directory, "delta.sqlite")
+        self.paths = []
+        for name, xml in (("pubmed18n0001.xml", self.pubmed_xml), ("pubmed18n0002.xml", self.update_xml)):
+            self.paths.append(os.path.join(self.directory, name))
+            with open(self.paths[-1], "wb") as f:
+                f.write(xml)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_pubmed_xml_to_delta_iter(self):
+        """
+        test the added, changed and deleted articles of successive update files are emitted, and the unchanged
+        articles are not
+        :return:
+        """
+        for engine in ("soup", "lxml"):
+            if os.path.exists(self.index_path):
+                os.remove(self.index_path)
+            events = list(pubmed_xml_to_delta_iter(self.paths[:1], self.index_path, engine))
+            self.assertEquals([DeltaEvent(ADDED, piano["pmid"], 1, piano) for piano in self.pianos], events)
+
+            events = list(pubmed_xml_to_delta_iter(self.paths, self.index_path, engine))
+            self.assertEquals([(CHANGED, "26419243"), (DELETED, "25870975"), (DELETED, "1")],
+                              [(event.action, event.pmid) for event in events])
+            self.assertEquals("Revised title", events[0].piano["title"])
+            self.assertEquals(dict(self.pianos[0], title="Revised title"), events[0].piano)
+            self.assertEquals(None, events[1].piano)
+
+            index = DeltaIndex(self.index_path)
+            self.assertEquals(2, len(index))
+            self.assertTrue(index.applied("pubmed18n0002.xml"))
+            self.assertEquals(None, index.get("25870975"))
+            index.close()
+
+    def test_pubmed_xml_to_delta_iter__without_pmid(self):
+        """
+        test an article without a PMID is skipped, and the other articles of its file are applied
+        :return:
+        """
+        pmid = '<PMID Version="1">%s</PMID>' % self.pianos[0]["pmid"].encode("utf-8")
+        self.assertIn(pmid, self.pubmed_xml)
+        with open(self.paths[0], "wb") as f:
+            f.write(self.pubmed_xml.replace(pmid, "", 1))
+
+        events = list(pubmed_xml_to_delta_iter(self.paths[:1], self.index_path, "lxml"))
+        self.assertEquals([piano["pmid"] for piano in self.pianos[1:]], [event.pmid for event in events])
+        index = DeltaIndex(self.index_path)
+        self.assertTrue(index.applied("pubmed18n0001.xml"))
+        self.assertEquals(2, len(index))
+        index.close()
+
+    def test_pubmed_xml_to_delta_iter__applied_once(self):
+        """
+        test update files already applied are skipped, and an interrupted file is applied again
+        :return:
+        """
+        index = DeltaIndex(self.index_path)
+        events = pubmed_xml_to_delta_iter(self.paths, index, "lxml")
+        self.assertEquals(ADDED, next(events).action)
+        events.close()
+        self.assertEquals(0, len(index))
+        self.assertFalse(index.applied("pubmed18n0001.xml"))
+
+        self.assertEquals(6, len(list(pubmed_xml_to_delta_iter(self.paths, index, "lxml"))))
+        self.assertEquals([], list(pubmed_xml_to_delta_iter(self.paths, index, "lxml")))
+        index.close()
+
+    def test_pubmed_xml_to_delta_iter__with_fields(self):
+        """
+        test changes to the subtrees none of the fields mapped reads, such as the references, are not detected
+        :return:
+        """
+        references = ('<ReferenceList><Reference><Citation>%s</Citation></Reference></ReferenceList>'
+                      '</PubmedData>')
+        for path, citation in zip(self.paths, ("A citation", "A revised citation")):
+            with open(path, "wb") as f:
+                f.write(self.pubmed_xml.replace("</PubmedData>", references % citation))
+        events = list(pubmed_xml_to_delta_iter(self.paths, self.index_path, "lxml", fields=["pmid", "doi"]))
+
+        self.assertEquals([ADDED] * 3, [event.action for event in events])
+        self.assertEquals({"pmid": "26419243", "doi": self.pianos[0]["doi"]}, events[0].piano)
+
+    def test_pubmed_xml_to_delta_iter__with_other_engine(self):
+        """
+        test an index is refused to an engine other than the one that hashed its articles
+        :return:
+        """
+        self.assertEquals(3, len(list(pubmed_xml_to_delta_iter(self.paths[:1], self.index_path, "lxml"))))
+
+        with self.assertRaises(ValueError):
+            list(pubmed_xml_to_delta_iter(self.paths[1:], self.index_path, "soup"))
+        self.assertEquals(3, len(list(pubmed_xml_to_delta_iter(self.paths[1:], self.index_path, "lxml"))))
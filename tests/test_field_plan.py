@@ -0,0 +1,70 @@
+import pickle
+from unittest import TestCase
+from bs4 import BeautifulSoup
+from lxml import etree
+from piano_utils.utils.field_plan import FieldSpec, SoupFieldPlan, XPathFieldPlan, parse_selector
+
+
+class TestFieldPlan(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        create/setup test data
+        :return:
+        """
+        cls.xml = '<a><b><c k="x">1</c><c k="y">2</c></b><c k="y">3</c>' \
+                  '<d><e>4</e><e>5</e></d><d><f><e>6</e></f></d></a>'
+        cls.specs = (
+            FieldSpec("first_c", "c"),
+            FieldSpec("b_c", 'b > c[k="y"]'),
+            FieldSpec("all_c", "c", many=True),
+            FieldSpec("missing", "a > e"),
+            FieldSpec("ds", "d", many=True, fields=(
+                FieldSpec("e", "e"),
+                FieldSpec("f_e", "f > e", many=True),
+            )),
+        )
+        cls.expected = {
+            "first_c": "1",
+            "b_c": "2",
+            "all_c": ["1", "2", "3"],
+            "missing": None,
+            "ds": [{"e": "4", "f_e": []}, {"e": "6", "f_e": ["6"]}],
+        }
+
+    def texts(self, fields, get_text):
+        """
+        replace the extracted elements by their text
+        :param fields: extracted fields
+        :param get_text: function returning the text of an element
+        :return: dict
+        """
+        def _text(value):
+            if isinstance(value, list):
+                return [_text(v) for v in value]
+            if isinstance(value, dict):
+                return self.texts(value, get_text)
+            return get_text(value) if value is not None else None
+        return dict((k, _text(v)) for k, v in fields.items())
+
+    def test_parse_selector(self):
+        """
+        test parsing selectors into steps
+        :return:
+        """
+        self.assertEquals((("a", ()), ("b", (("k", "x"), ("l", "y")))), parse_selector('a > b[k="x"][l="y"]'))
+        self.assertRaises(ValueError, parse_selector, "a b")
+
+    def test_extract(self):
+        """
+        test the single pass soup plan and the xpath plan extract the same fields, also after pickling
+        :return:
+        """
+        for plan in (SoupFieldPlan(self.specs), pickle.loads(pickle.dumps(SoupFieldPlan(self.specs)))):
+            fields = plan.extract(BeautifulSoup(self.xml, "xml"))
+            self.assertEquals(self.expected, self.texts(fields, lambda e: e.get_text()))
+
+        for plan in (XPathFieldPlan(self.specs), pickle.loads(pickle.dumps(XPathFieldPlan(self.specs)))):
+            fields = plan.extract(etree.fromstring(self.xml))
+            self.assertEquals(self.expected, self.texts(fields, lambda e: e.xpath("string()")))
@@ -0,0 +1,66 @@
+import os
+from unittest import TestCase
+import xmltodict
+from piano_utils.utils.flat_schema import FlatSchema
+from piano_utils.utils.flatten_json import flatten, unflatten_list
+
+
+class TestFlatSchema(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        create/setup test data
+        :return:
+        """
+        with open(os.path.join(os.path.dirname(__file__), 'multiple_pubmed_xml_articles.xml')) as f:
+            cls.articles = xmltodict.parse(f.read())["PubmedArticleSet"]["PubmedArticle"]
+
+    def test_flatten_and_unflatten_list(self):
+        """
+        test a schema learned from one article flattens and unflattens every article as the generic functions do
+        :return:
+        """
+        schema = FlatSchema.from_sample(self.articles[0])
+        for article in self.articles * 2:
+            flat_article = schema.flatten(article)
+            self.assertEquals(flatten(article), flat_article)
+            self.assertEquals(unflatten_list(flat_article), schema.unflatten_list(flat_article))
+
+    def test_flatten_and_unflatten_list__other_shapes(self):
+        """
+        test records with keys the schema cannot learn are converted as the generic functions do
+        :return:
+        """
+        schema = FlatSchema(root_keys_to_ignore={"b"}, max_keys=3)
+        records = [{"a": {"x": 1, "y": [2, 3]}, "b": 4}, {1: {True: 5}, True: {1: 6}, "c": [[7]]}]
+        for record in records:
+            self.assertEquals(flatten(record, root_keys_to_ignore={"b"}), schema.flatten(record))
+            self.assertEquals(unflatten_list(flatten(record)), schema.unflatten_list(flatten(record)))
+        self.assertEquals({"a": {"b": 1}, "c": 2}, schema.unflatten_list({"a_b": 1, "c": 2}))
+
+    def test_flatten_and_unflatten_list__list_lengths(self):
+        """
+        test records whose lists have different lengths are converted as the generic functions do
+        :return:
+        """
+        schema = FlatSchema.from_sample({"a": [{"b": 1}], "c": 2})
+        for size in (3, 1, 0, 2):
+            record = {"a": [{"b": idx, "d": [idx] * size} for idx in range(size)], "c": size}
+            flat_record = schema.flatten(record)
+            self.assertEquals(flatten(record), flat_record)
+            self.assertEquals(unflatten_list(flat_record), schema.unflatten_list(flat_record))
+
+    def test_unflatten_list__layout_changes(self):
+        """
+        test records whose keys change how the schema compiled the keys of others are unflattened as the generic
+        function does: lists with gaps, lists in some records and dictionaries in others, values in some records
+        and containers in others
+        :return:
+        """
+        schema = FlatSchema()
+        records = [{"a_0": 1, "a_1": 2, "b": 3}, {"a_1": 1, "b_0": 2}, {"a_0": 1, "a_x": 2, "b": 3},
+                   {"a_0": 1, "a_1": 2, "b_0": 3}, {"a_1": 1}, {"b": 1, "b_0": 2}, {"b_0_c": 1, "b_1_c": 2}]
+        for record in records * 2:
+            self.assertEquals(unflatten_list(record), schema.unflatten_list(record))
+        self.assertRaises(AttributeError, schema.unflatten_list, {"b": 1, "b_0_c": 2, "b_0": 3})
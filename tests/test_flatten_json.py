@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from unittest import TestCase
+import xmltodict
+from piano_utils.utils.flatten_json import flatten, unflatten, unflatten_list, KeyPathCache, FlatIndex
+
+
+class TestFlattenJson(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        create/setup test data
+        :return:
+        """
+        cls.nested = OrderedDict([
+            ("a", 1),
+            ("b", OrderedDict([("c", [2, OrderedDict([("d", 3)]), []]), ("e", None)])),
+            ("f", set([4])),
+            ("g", {}),
+            (u"h\xe9", {1: u"\xe9"}),
+        ])
+        cls.expected = {
+            "a": 1,
+            "b_c_0": 2,
+            "b_c_1_d": 3,
+            "b_e": None,
+            "f_0": 4,
+            u"h\xe9_1": u"\xe9",
+        }
+
+    def test_flatten(self):
+        """
+        test flatten of nested dictionaries, lists and sets
+        :return:
+        """
+        self.assertEquals(self.expected, flatten(self.nested))
+        self.assertEquals(dict((key.replace("_", "."), value) for key, value in self.expected.items()),
+                          flatten(self.nested, separator="."))
+
+    def test_flatten__with_root_keys_to_ignore(self):
+        """
+        test flatten only ignores the given keys at the root
+        :return:
+        """
+        nested = {"a": {"a": 1, "b": 2}, "b": 3}
+        self.assertEquals({"a_a": 1, "a_b": 2}, flatten(nested, root_keys_to_ignore={"b"}))
+
+    def test_flatten__with_include_and_exclude(self):
+        """
+        test flatten keeps the keys of the included paths, at any depth, and leaves out the keys of the excluded ones
+        :return:
+        """
+        self.assertEquals({"b_c_0": 2, "b_c_1_d": 3, "b_e": None},
+                          flatten(self.nested, include=["b"], exclude=[("b", "c", "*", "x"), "b_c_*_e"]))
+        self.assertEquals({"b_c_0": 2, "f_0": 4}, flatten(self.nested, include=["b_c_*", "f"], exclude=["b_c_*_d"]))
+        self.assertEquals({"a": 1, "b_e": None, u"h\xe9_1": u"\xe9"},
+                          flatten(self.nested, exclude=["b_c", "f_*", "b_e_x"]))
+        self.assertEquals({u"h\xe9_1": u"\xe9"}, flatten(self.nested, include=[u"h\xe9_1"]))
+        self.assertEquals({"b.c.1.d": 3}, flatten(self.nested, ".", include=["b.c.*.d"]))
+        self.assertEquals({}, flatten(self.nested, include=[]))
+        # list items are only matched by the wildcard, as in the key patterns of FlatIndex
+        self.assertEquals({}, flatten(self.nested, include=["b_c_0"]))
+
+    def test_flatten__with_include_and_exclude_of_single_item(self):
+        """
+        test the wildcard of the paths also matches a single item where the paths expect a list, as xmltodict parses
+        an element that is not repeated
+        :return:
+        """
+        nested = {"l": {"m": {"d": 1, "e": 2}}, "n": [{"d": 3}, {"d": 4, "e": 5}]}
+        self.assertEquals({"l_m_d": 1, "n_0_d": 3, "n_1_d": 4}, flatten(nested, include=["l_m_*_d", "n_*_d"]))
+        self.assertEquals({"l_m_e": 2, "n_1_e": 5}, flatten(nested, exclude=["l_m_*_d", "n_*_d"]))
+        self.assertEquals({"l_m_d": 1, "l_m_e": 2}, flatten(nested, include=["l_m_*"]))
+        self.assertEquals({"l_m_e": 2}, flatten(nested, include=["l"], exclude=["l_m_d", "l_m_*_d"]))
+        self.assertEquals({"n_0_d": 3, "n_1_d": 4, "n_1_e": 5}, flatten(nested, exclude=["l_m_*"]))
+
+    def test_unflatten_list(self):
+        """
+        test unflatten_list of a flattened dictionary
+        :return:
+        """
+        nested = {"a": 1, "b": {"c": [2, {"d": 3}, [4, 5]], "e": None}}
+        self.assertEquals(nested, unflatten_list(flatten(nested)))
+
+    def test_unflatten_list__only_lists_indexed_from_zero(self):
+        """
+        test unflatten_list keeps dictionaries whose keys are not exactly the indices of a list
+        :return:
+        """
+        flat = {"a_0": 1, "a_2": 2, "b_1": 3, "b_01": 4, "c_1": 5, "0": 6}
+        self.assertEquals({"a": {"0": 1, "2": 2}, "b": {"1": 3, "01": 4}, "c": {"1": 5}, "0": 6},
+                          unflatten_list(flat))
+
+    def test_unflatten_list__with_key_cache(self):
+        """
+        test unflatten and unflatten_list with a key cache shared by several dictionaries
+        :return:
+        """
+        key_cache = KeyPathCache(separator=".", maxsize=4)
+        records = [{"a": {"b": [1, 2]}, "c": index} for index in range(3)] + [{"a": {"b": {"x": 1}}, "d": [3]}]
+        for record in records:
+            self.assertEquals(record, unflatten_list(flatten(record, separator="."), ".", key_cache))
+        self.assertEquals({"a": {"0": 1}}, unflatten({"a.0": 1}, ".", key_cache))
+        self.assertTrue(len(key_cache) <= 8)
+        self.assertRaises(AssertionError, unflatten_list, {"a_0": 1}, "_", key_cache)
+
+    def test_flatten__with_index(self):
+        """
+        test flatten indexes the flattened keys and values by key pattern, with wildcards for the list indices only
+        :return:
+        """
+        index = FlatIndex()
+        self.assertEquals(self.expected, flatten(self.nested, index=index))
+        self.assertEquals({"a": [("a", 1)],
+                           "b_c_*": [("b_c_0", 2)],
+                           "b_c_*_d": [("b_c_1_d", 3)],
+                           "b_e": [("b_e", None)],
+                           "f_*": [("f_0", 4)],
+                           u"h\xe9_1": [(u"h\xe9_1", u"\xe9")]}, index.patterns)
+
+        index = FlatIndex(".")
+        flatten({"a": [{"b": 1}, {"b": 2, "c": [3, 4]}], "": [5]}, ".", index=index)
+        self.assertEquals([("a.0.b", 1), ("a.1.b", 2)], index.get("a.*.b"))
+        self.assertEquals([3, 4], index.values("a.*.c.*"))
+        self.assertEquals(5, index.first("*"))
+        self.assertEquals([], index.get("a.0.b"))
+        self.assertEquals(None, index.first("a.*.d"))
+
+    def test_flat_index__from_flat(self):
+        """
+        test indexing an already flattened dictionary takes every key part made of digits for a list index
+        :return:
+        """
+        index = FlatIndex.from_flat(flatten({"a": [{"b": value} for value in range(12)], "c": {"1": 3}}))
+        self.assertEquals(range(12), index.values("a_*_b"))
+        self.assertEquals([3], index.values("c_*"))
+        self.assertEquals(set(["a_*_b", "c_*"]), set(index))
+
+    def test_flat_index__single_items(self):
+        """
+        test the wildcards of a pattern also match the keys of single items, which xmltodict does not put in a list
+        :return:
+        """
+        xml = "<r><l><m><d>%s</d></m>%s</l><n><m><d>3</d></m><m><d>4</d></m></n></r>"
+        index = FlatIndex.from_flat(flatten(xmltodict.parse(xml % ("1", ""))))
+        self.assertEquals(["1"], index.values("r_l_m_*_d"))
+        self.assertEquals(["3", "4"], index.values("r_n_m_*_d"))
+        self.assertEquals([("r_l_m_d", "1")], index.get("r_l_m_*_d"))
+        self.assertEquals("1", index.first("r_l_m_*_d"))
+
+        index = FlatIndex()
+        flatten(xmltodict.parse(xml % ("1", "<m><x><d>2</d></x></m>")), index=index)
+        self.assertEquals(["1"], index.values("r_l_m_*_d"))
+        self.assertEquals(["2"], index.values("r_l_m_*_x_*_d"))
+        self.assertEquals([], index.values("r_l_*_*"))
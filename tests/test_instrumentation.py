@@ -0,0 +1,85 @@
+import os
+from StringIO import StringIO
+from unittest import TestCase
+from piano_utils.pubmed_converter import PubMedMapper, PubMedLxmlMapper
+from piano_utils.utils.instrumentation import Metrics, StderrProgress, SPLIT, PARSE, MAP
+from piano_utils.utils.parse_xml import XmlToJson
+
+
+class TestInstrumentation(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        create/setup test data
+        :return:
+        """
+        cls.pubmed_xml_path = os.path.join(os.path.dirname(__file__), 'multiple_pubmed_xml_articles.xml')
+        cls.pubmed_xml = open(cls.pubmed_xml_path).read()
+
+    def test_metrics(self):
+        """
+        test the articles and phases of an import are counted, whether the articles are mapped in worker processes
+        or not
+        :return:
+        """
+        for mapper in (PubMedMapper, PubMedLxmlMapper):
+            for processes in (1, 2):
+                metrics = Metrics()
+                articles = XmlToJson(mapper(), processes, instrumentation=metrics).xml_to_json(self.pubmed_xml)
+
+                report = metrics.report()
+                self.assertEquals(3, len(articles))
+                self.assertEquals(1, report["imports"])
+                self.assertEquals(3, report["articles"])
+                self.assertEquals(0, report["errors"])
+                self.assertEquals({SPLIT: 3, PARSE: 3, MAP: 3},
+                                  dict((name, phase["count"]) for name, phase in report["phases"].iteritems()))
+                self.assertTrue(report["throughput"] > 0)
+
+    def test_metrics__with_shared_mapper(self):
+        """
+        test importers sharing a mapper report to their own instrumentation
+        :return:
+        """
+        mapper = PubMedMapper()
+        metrics = Metrics()
+        importer = XmlToJson(mapper, instrumentation=metrics)
+        other_metrics = Metrics()
+        XmlToJson(mapper, instrumentation=other_metrics)
+        importer.xml_to_json(self.pubmed_xml)
+
+        self.assertEquals({SPLIT: 3, PARSE: 3, MAP: 3}, metrics.counts)
+        self.assertEquals({}, other_metrics.counts)
+
+    def test_metrics__with_iter(self):
+        """
+        test the articles and phases of streaming imports are counted and accumulated across imports
+        :return:
+        """
+        for processes in (1, 2):
+            metrics = Metrics()
+            importer = XmlToJson(PubMedLxmlMapper(), processes, instrumentation=metrics)
+            self.assertEquals(3, len(list(importer.xml_to_json_iter(self.pubmed_xml_path))))
+            self.assertEquals(3, len(list(importer.xml_to_json_iter(self.pubmed_xml_path))))
+
+            self.assertEquals(2, metrics.imports)
+            self.assertEquals(6, metrics.articles)
+            self.assertEquals(6, metrics.counts[SPLIT])
+            self.assertEquals(6, metrics.counts[PARSE])
+            self.assertEquals(6, metrics.counts[MAP])
+
+    def test_stderr_progress(self):
+        """
+        test the progress lines are sampled every number of articles
+        :return:
+        """
+        stream = StringIO()
+        XmlToJson(PubMedLxmlMapper(), instrumentation=StderrProgress(stream, every=2)).xml_to_json(self.pubmed_xml)
+
+        lines = stream.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith("Start Import"))
+        self.assertEquals("Found: 3 xml articles", lines[1])
+        self.assertEquals(["Processing: 2/3"], [line.split(",")[0] for line in lines[2:-1]])
+        self.assertTrue(lines[-1].startswith("End Import"))
+        self.assertIn("3 articles", lines[-1])
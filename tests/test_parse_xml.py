@@ -0,0 +1,103 @@
+import os
+import gzip
+import mmap
+import shutil
+import tempfile
+from contextlib import closing
+from unittest import TestCase
+from piano_utils.pubmed_converter import PubMedMapper, PubMedLxmlMapper
+from piano_utils.utils.parse_xml import iterparse_elements, open_mapped, open_xml
+
+
+class TestParseXml(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        create/setup test data
+        :return:
+        """
+        cls.pubmed_xml_path = os.path.join(os.path.dirname(__file__), 'multiple_pubmed_xml_articles.xml')
+        cls.pubmed_xml = open(cls.pubmed_xml_path).read()
+
+    def test_iterparse_elements(self):
+        """
+        test incremental parsing yields each element and clears it afterwards
+        :return:
+        """
+        elements = []
+        for element in iterparse_elements(self.pubmed_xml_path, "PubmedArticle"):
+            self.assertEquals("PubmedArticle", element.tag)
+            self.assertIsNotNone(element.find("MedlineCitation/PMID"))
+            elements.append(element)
+
+        self.assertEquals(3, len(elements))
+        for element in elements:
+            self.assertEquals(0, len(element))
+
+    def test_iterparse_articles(self):
+        """
+        test streaming articles from a file path and a file object matches parsing the whole string
+        :return:
+        """
+        mapper = PubMedMapper()
+        expected = [str(article) for article in mapper.parallelize_parse(self.pubmed_xml)]
+
+        from_path = [str(article) for article in mapper.iterparse_articles(self.pubmed_xml_path)]
+        with open(self.pubmed_xml_path, "rb") as f:
+            from_file = [str(article) for article in mapper.iterparse_articles(f)]
+
+        self.assertEquals(3, len(expected))
+        self.assertEquals(expected, from_path)
+        self.assertEquals(expected, from_file)
+
+    def test_open_mapped(self):
+        """
+        test articles parsed from a memory mapped file match parsing the whole string, and empty files can be opened
+        :return:
+        """
+        for mapper in (PubMedMapper(), PubMedLxmlMapper()):
+            expected = [mapper.etree.tostring(element) for element in mapper.iter_elements(self.pubmed_xml)]
+            with closing(open_mapped(self.pubmed_xml_path)) as mapped:
+                from_map = [mapper.etree.tostring(element) for element in mapper.iter_elements(mapped)]
+            self.assertEquals(expected, from_map)
+
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            with closing(open_mapped(path)) as empty:
+                self.assertEquals("", empty.read())
+        finally:
+            os.remove(path)
+
+    def test_open_xml(self):
+        """
+        test files are read through a buffer for incremental parsing, and from a memory map when asked
+        :return:
+        """
+        with closing(open_xml(self.pubmed_xml_path)) as xml_file:
+            self.assertIsInstance(xml_file, file)
+            self.assertEquals(self.pubmed_xml, xml_file.read())
+        with closing(open_xml(self.pubmed_xml_path, mapped=True)) as xml_file:
+            self.assertIsInstance(xml_file, mmap.mmap)
+            self.assertEquals(self.pubmed_xml, xml_file[:])
+
+    def test_open_xml__with_gzip(self):
+        """
+        test gzip compressed files are decompressed while they are parsed
+        :return:
+        """
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "pubmed.xml.gz")
+            with closing(gzip.open(path, "wb")) as f:
+                f.write(self.pubmed_xml)
+
+            with closing(open_xml(path)) as xml_file:
+                self.assertEquals(self.pubmed_xml, xml_file.read())
+
+            mapper = PubMedMapper()
+            expected = [str(article) for article in mapper.iterparse_articles(self.pubmed_xml_path)]
+            self.assertEquals(expected, [str(article) for article in mapper.iterparse_articles(path)])
+        finally:
+            shutil.rmtree(directory)
@@ -0,0 +1,146 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from piano_utils.pubmed_converter import PubMedMapper, PubMedLxmlMapper, pubmed_xml_to_piano_iter
+from piano_utils.utils.parse_xml import XmlToJson
+from piano_utils.utils.piano_cache import PianoCache
+
+
+class TestPianoCache(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        create/setup test data
+        :return:
+        """
+        cls.pubmed_xml_path = os.path.join(os.path.dirname(__file__), 'multiple_pubmed_xml_articles.xml')
+        cls.pubmed_xml = open(cls.pubmed_xml_path).read()
+        cls.pianos = XmlToJson(PubMedLxmlMapper()).xml_to_json(cls.pubmed_xml)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.directory, "pianos.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_xml_to_json__with_cache(self):
+        """
+        test the articles of a repeated import are taken from the cache, whether they are mapped in worker processes
+        or not
+        :return:
+        """
+        for mapper in (PubMedMapper, PubMedLxmlMapper):
+            for processes in (1, 2):
+                cache = PianoCache(self.cache_path)
+                cache.clear()
+                importer = XmlToJson(mapper(), processes, cache=cache)
+
+                self.assertEquals(self.pianos, importer.xml_to_json(self.pubmed_xml))
+                self.assertEquals(3, len(cache))
+                self.assertEquals((0, 3), (cache.hits, cache.misses))
+
+                self.assertEquals(self.pianos, importer.xml_to_json(self.pubmed_xml))
+                self.assertEquals((3, 3), (cache.hits, cache.misses))
+                cache.close()
+
+    def test_xml_to_json__with_changed_article(self):
+        """
+        test an article whose XML has changed since it was cached is mapped again and replaces its entry
+        :return:
+        """
+        cache = PianoCache(self.cache_path)
+        XmlToJson(PubMedLxmlMapper(), cache=cache).xml_to_json(self.pubmed_xml)
+
+        title = self.pianos[0]["title"]
+        changed_xml = self.pubmed_xml.replace(title.encode("utf-8"), "Changed title", 1)
+        pianos = XmlToJson(PubMedLxmlMapper(), cache=cache).xml_to_json(changed_xml)
+
+        self.assertEquals("Changed title", pianos[0]["title"])
+        self.assertEquals(self.pianos[1:], pianos[1:])
+        self.assertEquals({"hits": 2, "misses": 4, "evictions": 0, "hit_rate": 2 / 6.0}, cache.stats())
+        self.assertEquals(3, len(cache))
+
+        pianos = XmlToJson(PubMedLxmlMapper(), cache=cache).xml_to_json(changed_xml)
+        self.assertEquals("Changed title", pianos[0]["title"])
+        self.assertEquals(5, cache.hits)
+
+    def test_xml_to_json__with_fields(self):
+        """
+        test the Piano dictionaries of mappers of different fields are cached apart
+        :return:
+        """
+        cache = PianoCache(self.cache_path)
+        XmlToJson(PubMedLxmlMapper(), cache=cache).xml_to_json(self.pubmed_xml)
+        pianos = XmlToJson(PubMedLxmlMapper(fields=["pmid", "title"]), cache=cache).xml_to_json(self.pubmed_xml)
+
+        self.assertEquals([{"pmid": piano["pmid"], "title": piano["title"]} for piano in self.pianos], pianos)
+        self.assertEquals(0, cache.hits)
+        self.assertEquals(6, len(cache))
+
+    def test_xml_to_json__with_cached_and_mapped_articles(self):
+        """
+        test the cached articles are merged back in their place between the mapped ones, and that empty dictionaries
+        are cached
+        :return:
+        """
+        for processes in (1, 2):
+            cache = PianoCache(self.cache_path)
+            cache.clear()
+            importer = XmlToJson(PubMedLxmlMapper(), processes, chunk_size=1, cache=cache)
+            importer.xml_to_json(self.pubmed_xml)
+            cache.put(PubMedLxmlMapper().cache_namespace(), self.pianos[1]["pmid"], "changed", {})
+            cache.flush()
+
+            self.assertEquals(self.pianos, importer.xml_to_json(self.pubmed_xml))
+            self.assertEquals((2, 4), (cache.hits, cache.misses))
+
+            empty_importer = XmlToJson(PubMedLxmlMapper(fields=[]), processes, cache=cache)
+            self.assertEquals([{}] * 3, empty_importer.xml_to_json(self.pubmed_xml))
+            self.assertEquals([{}] * 3, empty_importer.xml_to_json(self.pubmed_xml))
+            self.assertEquals(5, cache.hits)
+            cache.close()
+
+    def test_xml_to_json__with_mapping_version(self):
+        """
+        test the dictionaries cached by a previous version of the mapping are not used
+        :return:
+        """
+        class NextMapper(PubMedLxmlMapper):
+            mapping_version = PubMedLxmlMapper.mapping_version + 1
+
+        cache = PianoCache(self.cache_path)
+        XmlToJson(PubMedLxmlMapper(), cache=cache).xml_to_json(self.pubmed_xml)
+        self.assertEquals(self.pianos, XmlToJson(NextMapper(), cache=cache).xml_to_json(self.pubmed_xml))
+        self.assertEquals((0, 6), (cache.hits, cache.misses))
+
+    def test_eviction(self):
+        """
+        test the least recently used entries are evicted beyond the maximum number of entries
+        :return:
+        """
+        cache = PianoCache(self.cache_path, max_entries=2)
+        XmlToJson(PubMedLxmlMapper(), cache=cache).xml_to_json(self.pubmed_xml)
+
+        self.assertEquals(2, len(cache))
+        self.assertEquals(1, cache.evictions)
+        self.assertIsNone(cache.get(PubMedLxmlMapper().cache_namespace(), self.pianos[0]["pmid"], "digest"))
+
+        XmlToJson(PubMedLxmlMapper(), cache=cache).xml_to_json(self.pubmed_xml)
+        self.assertEquals(2, len(cache))
+
+    def test_pubmed_xml_to_piano_iter__with_cache(self):
+        """
+        test the streamed articles are cached and taken from the cache across instances of the cache
+        :return:
+        """
+        cache = PianoCache(self.cache_path)
+        self.assertEquals(self.pianos, list(pubmed_xml_to_piano_iter(self.pubmed_xml_path, "lxml", cache=cache)))
+        cache.close()
+
+        cache = PianoCache(self.cache_path)
+        self.assertEquals(self.pianos, list(pubmed_xml_to_piano_iter(self.pubmed_xml_path, "lxml", cache=cache)))
+        self.assertEquals((3, 0), (cache.hits, cache.misses))
+        cache.close()
@@ -4,8 +4,12 @@ import xmltodict
 import xml.etree.ElementTree as Et
 from unittest import TestCase
 from copy import deepcopy
-from piano_utils.pubmed_converter import pubmed_xml_to_json, json_to_pubmed_xml, \
-    pubmed_xml_to_piano, pubmed_json_to_piano
+from StringIO import StringIO
+from piano_utils.pubmed_converter import pubmed_xml_to_json, pubmed_xml_file_to_json, pubmed_xml_to_json_stream, \
+    json_to_pubmed_xml, json_to_pubmed_xml_stream, pubmed_xml_to_piano, pubmed_xml_file_to_piano, \
+    pubmed_xml_to_piano_iter, pubmed_json_to_piano, PubMedMapper, PubMedLxmlMapper, PIANO_FIELDS, PUBMED_FIELD_SPECS, \
+    WALK_ARTICLE, EXTRACT_SPEC, PUBMED_MAPPERS
+from piano_utils.utils.parse_xml import XmlToJson
 
 
 class TestPubMedConverter(TestCase):
@@ -254,6 +258,22 @@ class TestPubMedConverter(TestCase):
         # compare dictionary values
         self.assertDictEqual(result, expects)
 
+    def test_xml_to_json_to_xml__with_streams(self):
+        """
+        test streaming conversion from xml to json lines, then back from json lines to xml with multiple articles
+        :return:
+        """
+        original_xml = deepcopy(self.pubmed_xml_mulitple_non_ascii)
+
+        json_lines = StringIO()
+        pubmed_xml_to_json_stream(StringIO(original_xml), json_lines)
+        json_lines.seek(0)
+        output = StringIO()
+        count = json_to_pubmed_xml_stream(json_lines, output)
+
+        self.assertEquals(3, count)
+        self.assertEquals(json_to_pubmed_xml(pubmed_xml_to_json(original_xml)).encode("utf-8"), output.getvalue())
+
     def test_json_to_xml_to_json(self):
         """
         test conversion from json to xml, then back from xml to json and ensure they are equal
@@ -942,3 +962,141 @@ class TestPubMedConverter(TestCase):
         piano = pubmed_json_to_piano(json.dumps(unsorted_json))
 
         self.assertEquals(piano[0]["pmid"], "24115221")
+
+    def test_xml_to_piano_iter(self):
+        """
+        test streaming conversion from xml to piano with multiple articles
+        :return:
+        """
+        path = os.path.join(os.path.dirname(__file__), 'multiple_pubmed_xml_articles.xml')
+
+        # convert xml to piano documents one at a time
+        piano_docs = pubmed_xml_to_piano_iter(path)
+        self.check_piano(0, next(piano_docs))
+        self.check_piano(1, next(piano_docs))
+
+        # results match the non-streaming conversion
+        self.assertEquals(pubmed_xml_to_piano(self.pubmed_xmls[1])[2], next(piano_docs))
+        self.assertRaises(StopIteration, next, piano_docs)
+
+    def test_xml_to_piano__with_lxml_engine(self):
+        """
+        test conversion from xml to piano with the lxml mapper gives the same output as the default mapper
+        :return:
+        """
+        for original_xml in self.pubmed_xmls + [self.pubmed_xml_non_ascii, self.pubmed_xml_mulitple_non_ascii]:
+            expected = pubmed_xml_to_piano(deepcopy(original_xml))
+            piano_docs = pubmed_xml_to_piano(deepcopy(original_xml), engine="lxml")
+            self.assertEquals(json.dumps(expected), json.dumps(piano_docs))
+
+        piano_docs = pubmed_xml_to_piano(deepcopy(self.pubmed_xmls[1]), engine="lxml")
+        self.check_piano(0, piano_docs[0])
+        self.check_piano(1, piano_docs[1])
+
+    def test_xml_to_piano__with_processes(self):
+        """
+        test conversion from xml to piano in worker processes preserves the order of the articles
+        :return:
+        """
+        path = os.path.join(os.path.dirname(__file__), 'multiple_pubmed_xml_articles.xml')
+        expected = pubmed_xml_to_piano(deepcopy(self.pubmed_xmls[1]))
+
+        for mapper in (PubMedMapper(), PubMedLxmlMapper()):
+            parser = XmlToJson(mapper, processes=2, chunk_size=1)
+            self.assertEquals(expected, parser.xml_to_json(deepcopy(self.pubmed_xmls[1])))
+            self.assertEquals(expected, list(parser.xml_to_json_iter(path)))
+
+    def test_xml_to_piano__with_profile(self):
+        """
+        test a profiling mapper gives the same output and times the extraction of every field spec and the assembly
+        of every field of every article
+        :return:
+        """
+        expected = pubmed_xml_to_piano(deepcopy(self.pubmed_xmls[1]))
+
+        for mapper in (PubMedMapper(profile=True), PubMedLxmlMapper(profile=True)):
+            self.assertEquals(expected, XmlToJson(mapper).xml_to_json(deepcopy(self.pubmed_xmls[1])))
+
+            report = mapper.profile_report()
+            self.assertEquals(set([WALK_ARTICLE] + [EXTRACT_SPEC % spec.name for spec in PUBMED_FIELD_SPECS] +
+                                  [field.key for field in PIANO_FIELDS]),
+                              set(field for field, seconds, calls in report))
+            timings = dict((field, seconds) for field, seconds, calls in report)
+            self.assertTrue(timings["(extract) pubdate_year"] > 0)
+            self.assertTrue(timings["(extract) authors"] > 0)
+            self.assertEquals(set([3]), set(calls for field, seconds, calls in report))
+            self.assertEquals(sorted((seconds for field, seconds, calls in report), reverse=True),
+                              [seconds for field, seconds, calls in report])
+
+            mapper.reset_profile()
+            self.assertEquals(set([0]), set(calls for field, seconds, calls in mapper.profile_report()))
+
+    def test_xml_to_piano__with_fields(self):
+        """
+        test conversion from xml to piano of only the requested fields
+        :return:
+        """
+        path = os.path.join(os.path.dirname(__file__), 'multiple_pubmed_xml_articles.xml')
+        expected = pubmed_xml_to_piano(deepcopy(self.pubmed_xmls[1]))
+
+        for fields in (["pmid", "doi", "title"], ["external_id", "keywords"], ["edition", "abstract", "authors"]):
+            projected = [dict((key, value) for key, value in piano.iteritems() if key in fields) for piano in expected]
+            for engine in ("soup", "lxml"):
+                self.assertEquals(projected, pubmed_xml_to_piano(deepcopy(self.pubmed_xmls[1]), engine, fields))
+                self.assertEquals(projected, list(pubmed_xml_to_piano_iter(path, engine, fields)))
+                self.assertEquals(projected, pubmed_xml_file_to_piano(path, engine, fields))
+
+        self.assertRaises(ValueError, PubMedMapper, fields=["pmid", "unknown"])
+
+    def test_xml_to_piano__skips_references(self):
+        """
+        test the references of the articles are skipped, and their ids not taken for the ids of the articles
+        :return:
+        """
+        references = ('<ReferenceList><Reference><Citation>cited</Citation><ArticleIdList>'
+                      '<ArticleId IdType="doi">10.1/cited</ArticleId></ArticleIdList></Reference></ReferenceList>')
+        xml = deepcopy(self.pubmed_xmls[1]).replace("</PubmedData>", references + "</PubmedData>")
+        without_doi = deepcopy(self.pubmed_xmls[1]).replace('<ArticleId IdType="doi">', '<ArticleId IdType="other">')
+        without_doi = without_doi.replace("</PubmedData>", references + "</PubmedData>")
+        expected = pubmed_xml_to_piano(deepcopy(self.pubmed_xmls[1]))
+
+        for engine in ("soup", "lxml"):
+            self.assertEquals(expected, pubmed_xml_to_piano(xml, engine))
+            self.assertEquals(None, pubmed_xml_to_piano(without_doi, engine)[0]["doi"])
+
+            mapper = PUBMED_MAPPERS[engine](fields=["pmid", "doi"])
+            for element in mapper.iterparse_elements(StringIO(xml)):
+                self.assertEquals(0, len(element.find("PubmedData/ReferenceList")))
+
+    def test_json_to_piano__matches_xml_to_piano(self):
+        """
+        test direct conversion from json to piano gives the same output as converting through pubmed xml
+        :return:
+        """
+        mixed_content_json = {
+            "MedlineCitation_PMID_#text": "1",
+            "MedlineCitation_Article_ArticleTitle_#text": "title with ",
+            "MedlineCitation_Article_ArticleTitle_i": "markup",
+            "MedlineCitation_Article_Abstract_AbstractText_0_@Label": "BACKGROUND",
+            "MedlineCitation_Article_Abstract_AbstractText_0_#text": "first",
+            "MedlineCitation_Article_Abstract_AbstractText_1": None,
+        }
+        json_strings = [json.dumps(self.pubmed_jsons), json.dumps(mixed_content_json),
+                        pubmed_xml_to_json(deepcopy(self.pubmed_xml_mulitple_non_ascii))]
+
+        for json_string in json_strings:
+            expected = pubmed_xml_to_piano(json_to_pubmed_xml(json_string))
+            self.assertEquals(json.dumps(expected), json.dumps(pubmed_json_to_piano(json_string)))
+
+    def test_xml_file_to_json_and_piano(self):
+        """
+        test conversion from a pubmed xml file gives the same output as converting its content
+        :return:
+        """
+        path = os.path.join(os.path.dirname(__file__), 'multiple_pubmed_xml_articles_non_ascii.xml')
+
+        self.assertEquals(pubmed_xml_to_json(deepcopy(self.pubmed_xml_mulitple_non_ascii)),
+                          pubmed_xml_file_to_json(path))
+        for engine in ("soup", "lxml"):
+            self.assertEquals(pubmed_xml_to_piano(deepcopy(self.pubmed_xml_mulitple_non_ascii), engine=engine),
+                              pubmed_xml_file_to_piano(path, engine=engine))
@@ -4,7 +4,9 @@ import xmltodict
 import xml.etree.ElementTree as Et
 from unittest import TestCase
 from copy import deepcopy
-from piano_utils.xml_json_converter import xml_to_json, json_to_xml
+from StringIO import StringIO
+from piano_utils.utils.flatten_json import flatten, unflatten_list
+from piano_utils.xml_json_converter import xml_to_json, xml_to_json_stream, json_to_xml, json_to_xml_stream
 
 
 class TestXmlJsonConverter(TestCase):
@@ -90,6 +92,55 @@ class TestXmlJsonConverter(TestCase):
             for k, v in json_value.iteritems():
                 self.assertEquals(v, result[idx][k])
 
+    def test_xml_to_json__with_include_and_exclude(self):
+        """
+        test conversion from xml to json of only the included key paths, without the excluded ones
+        :return:
+        """
+        original_xml = deepcopy(self.complex_xml)
+        expected = json.loads(xml_to_json(original_xml, "cd"))
+
+        filters = [
+            (None, ["prices"]),
+            (["title", "prices_price_*_#text"], None),
+            (["prices"], ["prices_price_*_@type"]),
+            (["year", "artist"], ["year"]),
+            ([], None),
+        ]
+        for include, exclude in filters:
+            result = json.loads(xml_to_json(original_xml, "cd", include, exclude))
+            self.assertEquals([flatten(unflatten_list(cd), include=include, exclude=exclude) for cd in expected], result)
+
+        self.assertEquals([{"title": cd["title"], "prices_price_0_#text": cd["prices"][0],
+                            "prices_price_1_#text": cd["prices"][1]} for cd in self.catalog],
+                          json.loads(xml_to_json(original_xml, "cd", ["title", "prices_price_*_#text"])))
+        self.assertEquals([dict((key, value) for key, value in self.complex_json[0].items() if "_price_" not in key)],
+                          json.loads(xml_to_json(original_xml, exclude=["catalog_cd_*_prices"])))
+
+    def test_xml_to_json__with_exclude_keeps_text(self):
+        """
+        test excluded elements are left out of mixed content without the text around them, and of lists without
+        changing the indices of the other items
+        :return:
+        """
+        xml = "<r><a><b>x <i>removed</i> y <j>kept</j> z</b><c><d>1</d><d>2</d><e>3</e></c></a></r>"
+        self.assertEquals([{"b_#text": "x  y  z", "b_j": "kept", "c_e": "3"}],
+                          json.loads(xml_to_json(xml, "a", exclude=["b_i", "c_d_*"])))
+        self.assertEquals([{"c_d_0": "1", "c_d_1": "2"}], json.loads(xml_to_json(xml, "a", include=["c_d_*"])))
+        self.assertEquals([{"c_e": "3"}], json.loads(xml_to_json(xml, "a", include=["c"], exclude=["c_d"])))
+
+    def test_xml_to_json__with_include_and_exclude_of_single_element(self):
+        """
+        test the wildcard of the paths also matches an element that is not repeated, which xmltodict does not parse
+        into a list
+        :return:
+        """
+        xml = "<r><a><c><d><f>1</f><g>2</g></d></c></a><a><c><d><f>3</f></d><d><f>4</f><g>5</g></d></c></a></r>"
+        self.assertEquals([{"c_d_f": "1"}, {"c_d_0_f": "3", "c_d_1_f": "4"}],
+                          json.loads(xml_to_json(xml, "a", include=["c_d_*_f"])))
+        self.assertEquals([{"c_d_g": "2"}, {"c_d_1_g": "5"}], json.loads(xml_to_json(xml, "a", exclude=["c_d_*_f"])))
+        self.assertEquals([{}, {}], json.loads(xml_to_json(xml, "a", exclude=["c_d_*"])))
+
     def test_json_to_xml(self):
         """
         test conversion from json to xml
@@ -201,3 +252,43 @@ class TestXmlJsonConverter(TestCase):
         self.assertEquals(len(original_json), len(xml_as_json))
         for idx, d in enumerate(original_json):
             self.assertDictEqual(d, xml_as_json[idx])
+
+    def test_xml_to_json_stream(self):
+        """
+        test streaming conversion from xml to json lines
+        :return:
+        """
+        expected = json.loads(xml_to_json(deepcopy(self.complex_xml), "cd"))
+
+        output = StringIO()
+        count = xml_to_json_stream(StringIO(self.complex_xml), output, "cd")
+
+        lines = output.getvalue().splitlines()
+        self.assertEquals(3, count)
+        self.assertEquals(expected, [json.loads(line) for line in lines])
+
+    def test_xml_to_json_stream__without_element_name(self):
+        """
+        test streaming conversion from xml to json lines of the whole document
+        :return:
+        """
+        output = StringIO()
+        xml_to_json_stream(os.path.join(os.path.dirname(__file__), 'simple_xml.xml'), output)
+
+        self.assertEquals([self.simple_json], [json.loads(line) for line in output.getvalue().splitlines()])
+
+    def test_json_to_xml_stream(self):
+        """
+        test streaming conversion from json lines to xml
+        :return:
+        """
+        xml_as_json = json.loads(xml_to_json(deepcopy(self.complex_xml), "cd"))
+        json_lines = "".join(json.dumps(json_value) + "\n" for json_value in xml_as_json)
+
+        output = StringIO()
+        count = json_to_xml_stream(StringIO(json_lines), output, "catalog", "cd")
+
+        self.assertEquals(3, count)
+        self.assertEquals(json_to_xml(json.dumps(xml_as_json), "catalog", "cd"), output.getvalue())
+        self.assertDictEqual(json.loads(json.dumps(xmltodict.parse(self.complex_xml))),
+                             json.loads(json.dumps(xmltodict.parse(output.getvalue()))))